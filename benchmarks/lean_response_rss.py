@@ -0,0 +1,81 @@
+"""Memory benchmark of the lean `qnxt.api.Response.Response` mode: the peak RSS of a process that holds on to 10k
+parsed responses, with and without `lean=True`.
+
+Each mode runs in its own child process, so each peak is measured from a clean start. Peak RSS is read with the
+`resource` module, so this only runs on POSIX systems.
+
+Usage
+-----
+python benchmarks/lean_response_rss.py --responses 10000 --records 25
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qnxt.api.Response import Response  # noqa: E402
+
+
+def http_response(i: int, records: int) -> requests.Response:
+    results = [{'callId': f"CALL{i:06d}{j:03d}", 'callDate': '2024-03-01T12:00:00', 'status': 'Open',
+                'description': 'x' * 200} for j in range(records)]
+    r = requests.Response()
+    r.status_code = 200
+    r._content = json.dumps({'processMetadata': {'totalCount': records}, 'results': results}).encode('utf-8')
+    r.encoding = 'utf-8'
+    r.headers['Content-Type'] = 'application/json; charset=utf-8'
+    r.url = f"http://qnxt_app_server.com/QNXTApi/CallTracking/calls?skip={i * records}"
+    # what a caller typically does with a response it keeps: read its text, e.g. for logging, and its results
+    r.text
+    return r
+
+
+def peak_rss_mib() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run(mode: str, responses: int, records: int):
+    """Builds and retains `responses` responses in this process and prints its peak RSS"""
+    kept = []
+    for i in range(responses):
+        if mode == 'baseline':
+            http_response(i, records)
+            continue
+        response = Response(http_response(i, records), lean=(mode == 'lean'))
+        response.results
+        kept.append(response)
+    print(f"{peak_rss_mib():.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--responses', type=int, default=10000)
+    parser.add_argument('--records', type=int, default=25)
+    parser.add_argument('--mode', choices=('baseline', 'default', 'lean'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        run(args.mode, args.responses, args.records)
+        return
+
+    print(f"{args.responses} retained responses of {args.records} records each")
+    peaks = {}
+    for mode in ('baseline', 'default', 'lean'):
+        out = subprocess.run([sys.executable, __file__, '--mode', mode, '--responses', str(args.responses),
+                              '--records', str(args.records)], check=True, capture_output=True, text=True).stdout
+        peaks[mode] = float(out.strip())
+    for mode in ('default', 'lean'):
+        print(f"{mode:<8} peak RSS {peaks[mode]:8.1f} MiB, {peaks[mode] - peaks['baseline']:8.1f} MiB above "
+              f"a process that keeps nothing")
+
+
+if __name__ == '__main__':
+    main()
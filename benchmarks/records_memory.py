@@ -0,0 +1,72 @@
+"""Memory benchmark of the compact `qnxt.api.Records` classes against the plain dicts they are converted from.
+
+Parses a search body of `--records` application logs (or calls) and measures, with tracemalloc, the memory held once
+only the dicts, or only the records, are kept. It also reports how long each takes; tracemalloc slows both down, so
+the times only compare with each other.
+
+Usage
+-----
+python benchmarks/records_memory.py --records 200000 --model ApplicationLog
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qnxt.api import Records  # noqa: E402
+
+LEVELS = ('Error', 'Warning', 'Information')
+STATUSES = ('Open', 'Closed', 'Pending')
+
+
+def body(model: str, records: int) -> bytes:
+    if model == 'ApplicationLog':
+        results = [{'referenceId': f"REF{i:08d}", 'timeStamp': '2024-03-01T12:00:00', 'level': LEVELS[i % 3],
+                    'source': 'PlanIntegration', 'sourceCategory': 'Enrollment', 'userName': 'svc_batch',
+                    'machineName': f"APP{i % 8:02d}", 'message': f"Enrollment {i} failed validation",
+                    'exception': None, 'entityState': 'Unchanged'} for i in range(records)]
+    else:
+        results = [{'callerId': f"CLR{i % 5000:06d}", 'callId': f"CALL{i:08d}", 'callDate': '2024-03-01T12:00:00',
+                    'memId': f"MEM{i % 20000:08d}", 'status': STATUSES[i % 3], 'callSourceId': 'PHONE',
+                    'submitMethod': 'IVR', 'callerType': 'Member', 'userId': f"USR{i % 40:03d}",
+                    'description': f"Call {i}", 'entityState': 'Unchanged'} for i in range(records)]
+    return json.dumps({'results': results}).encode('utf-8')
+
+
+def retained(build) -> tuple:
+    """Returns (MiB held by what `build` returns, seconds it took)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = build()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current / 2 ** 20, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--model', choices=('ApplicationLog', 'Call'), default='ApplicationLog')
+    args = parser.parse_args()
+
+    raw = body(args.model, args.records)
+    model = getattr(Records, args.model)
+    dicts, dict_seconds = retained(lambda: json.loads(raw)['results'])
+    records, record_seconds = retained(lambda: model.from_results(json.loads(raw)['results']))
+    print(f"{args.records} {args.model} records")
+    print(f"dicts    {dicts:8.1f} MiB  parse {dict_seconds:6.2f} s")
+    print(f"records  {records:8.1f} MiB  parse + convert {record_seconds:6.2f} s  ({dicts / records:.1f}x smaller)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Micro-benchmark of `qnxt.api.Response.Response` body parsing on large `results` payloads.
+
+Compares the old eager decoding, `json.loads(http_response.text)` on every response, with the lazy bytes-based parsing:
+checking only `status_code` never parses the body, and `results` parses straight from the raw bytes with the current
+JSON backend (orjson when it is installed).
+
+Usage
+-----
+python benchmarks/response_parsing.py --records 50000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qnxt.api import Response as response_module  # noqa: E402
+from qnxt.api.Response import Response  # noqa: E402
+
+
+def payload(records: int) -> bytes:
+    """Returns the body of an application log search with `records` results"""
+    results = [{'referenceId': f"REF{i:08d}", 'timeStamp': '2024-03-01T12:00:00', 'level': 'Error',
+                'source': 'PlanIntegration', 'machineName': f"APP{i % 8:02d}", 'message': 'x' * 120,
+                'exception': None, 'entityState': 'Unchanged'} for i in range(records)]
+    return json.dumps({'processMetadata': {'totalCount': records}, 'results': results}).encode('utf-8')
+
+
+def http_response(body: bytes) -> requests.Response:
+    r = requests.Response()
+    r.status_code = 200
+    r._content = body
+    r.encoding = 'utf-8'
+    r.headers['Content-Type'] = 'application/json; charset=utf-8'
+    return r
+
+
+def best(fn, body: bytes, repeat: int) -> float:
+    """Returns the fastest of `repeat` runs of `fn` on a fresh response, in seconds"""
+    times = []
+    for _ in range(repeat):
+        r = http_response(body)
+        start = time.perf_counter()
+        fn(r)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    body = payload(args.records)
+    backend = getattr(response_module._loads, '__module__', None) or 'json'
+    print(f"{args.records} records, {len(body) / 2 ** 20:.1f} MiB body, backend {backend}")
+
+    cases = [
+        ('eager json.loads(text), status only', lambda r: (json.loads(r.text), r.status_code)),
+        ('lazy Response, status only', lambda r: Response(r).status_code),
+        ('eager json.loads(text), results', lambda r: json.loads(r.text)['results']),
+        ('lazy Response, results', lambda r: Response(r).results),
+    ]
+    baseline = {}
+    for name, fn in cases:
+        seconds = best(fn, body, args.repeat)
+        kind = name.rsplit(', ', 1)[1]
+        baseline.setdefault(kind, seconds)
+        print(f"{name:<40} {seconds * 1000:10.2f} ms  {baseline[kind] / seconds:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""asyncio support. An `AsyncClient` can be passed to any of the API classes in place of the `app_server` string or a
+`qnxt.client.Client`; every method of that resource then returns an awaitable that resolves to the same
+`qnxt.api.Response.Response` objects, and all of them share the client's connection pool.
+
+Requires the optional `httpx` package.
+
+Examples
+--------
+>>> import asyncio
+>>> from qnxt.api import CallTracking
+>>> async def main(callerids):
+...     async with AsyncClient(r"http://qnxt_app_server.com", max_connections=100) as client:
+...         calls = CallTracking.CallResource(client, header_factory)
+...         return await asyncio.gather(*(calls.get_calls_by_callerid(c) for c in callerids))
+"""
+
+import logging
+from typing import Union
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from qnxt.api.Response import Response
+from qnxt.cache import ResponseCache
+from qnxt.ratelimit import RateLimiter
+from qnxt.retry import CircuitBreaker, RetryPolicy
+from qnxt.utils import *
+
+
+def _params(params: dict) -> Union[list, None]:
+    """Encode query parameters the way requests does: None values are dropped, lists become repeated keys and
+    everything else is sent as its str()"""
+    if not params:
+        return None
+    encoded = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            encoded.append((key, str(item)))
+    return encoded
+
+
+class AsyncClient:
+    def __init__(self,
+                 app_server: str,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 5.0,
+                 timeout: Union[float, tuple] = None,
+                 lean: bool = False,
+                 cache: ResponseCache = None,
+                 coalesce: bool = False,
+                 retry: RetryPolicy = None,
+                 breaker: CircuitBreaker = None,
+                 rate_limiter: RateLimiter = None,
+                 ):
+        """
+        The asyncio counterpart of `qnxt.client.Client`. It owns a single `httpx.AsyncClient` connection pool shared
+        by every resource it is passed to.
+
+        Parameters
+        ----------
+        app_server: str, required
+            This is the FQDN of the target QNXT app server
+        max_connections: int, optional, default 100
+            The maximum number of concurrent connections to the app server, i.e. the number of requests in flight.
+        max_keepalive_connections: int, optional, default 20
+            The maximum number of idle connections kept alive for reuse.
+        keepalive_expiry: float, optional, default 5.0
+            The number of seconds an idle connection is kept alive.
+        timeout: float or tuple, optional
+            Default (connect, read) timeout of every request made through the client. No timeout by default, the same
+            as `qnxt.client.Client`.
+        lean: bool, optional, default False
+            If True, responses are returned in lean mode (see `qnxt.api.Response.Response`).
+        cache: qnxt.cache.ResponseCache, optional
+            If given, GET requests to the endpoints it has a TTL for are answered from it while the stored response is
+            fresh, and revalidated with a conditional request once it is stale. It can be shared with a
+            `qnxt.client.Client`.
+        coalesce: bool, optional, default False
+            If True, concurrent identical GET requests share one request to the app server (see
+            `qnxt.client.Client`). `flights.stats()` counts the requests saved.
+        retry: qnxt.retry.RetryPolicy, optional
+            If given, failed requests with one of its `methods` are sent again after a backoff (see
+            `qnxt.client.Client`). It can be shared with a `qnxt.client.Client`.
+        breaker: qnxt.retry.CircuitBreaker, optional
+            If given, requests to an endpoint that keeps failing raise `qnxt.retry.CircuitOpenError` without being sent
+            until the endpoint recovers (see `qnxt.client.Client`).
+        rate_limiter: qnxt.ratelimit.RateLimiter, optional
+            If given, every request waits for a token of its API family before it is sent, without blocking the event
+            loop. It can be shared with a `qnxt.client.Client` running in other threads.
+        """
+        if httpx is None:
+            raise ImportError("AsyncClient requires the httpx package, install it with `pip install httpx`")
+        if app_server.endswith('/'):
+            self.app_server = app_server[:-1]
+        else:
+            self.app_server = app_server
+        self.lean = lean
+        self.cache = cache
+        self.flights = singleflight.AsyncSingleFlight() if coalesce else None
+        self.retry = retry
+        self.breaker = breaker
+        self.rate_limiter = rate_limiter
+
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_keepalive_connections,
+                              keepalive_expiry=keepalive_expiry)
+        self.session = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    def __repr__(self):
+        return f"AsyncClient(app_server={self.app_server})"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def url(self, base_path: str) -> str:
+        """Returns the base URL of an API resource on this client's app server"""
+        return clean_url.clean_url(self.app_server, base_path)
+
+    async def request(self, method: str, uri: str, header_factory, params: dict = None, **kwargs) -> Response:
+        """
+        Send a request through the shared connection pool and wrap the result in a `Response`
+
+        Parameters
+        ----------
+        method: str, required
+            The HTTP method, e.g. GET, POST or PUT
+        uri: str, required
+            The full URI of the endpoint
+        header_factory: qnxt.authentication.RequestHeader, required
+            This is a callable that generates the appropriate authentication headers for QNXT API requests. Its
+            `acall` coroutine is used when it has one, so token refreshes do not block the event loop.
+        params: dict, optional
+            The query string parameters of the request
+        """
+        if method != 'GET' or (self.cache is None and self.flights is None):
+            return Response(await self._send(method, uri, header_factory, params, kwargs), lean=self.lean)
+
+        key = ResponseCache.key(method, uri, params, header_factory)
+        ttl = cached = None
+        if self.cache is not None:
+            ttl = self.cache.ttl(uri)
+        if ttl is not None:
+            cached = self.cache.get(key)
+            if cached is not None and cached.fresh():
+                logging.debug(f"{method} {cached.url} {cached.status_code}: from cache")
+                return Response(cached, lean=self.lean)
+        if self.flights is not None:
+            http_response = await self.flights.do(f"{key} {sorted(kwargs.items())}", self._send_cached, method, uri,
+                                                  header_factory, params, kwargs, key, ttl, cached)
+        else:
+            http_response = await self._send_cached(method, uri, header_factory, params, kwargs, key, ttl, cached)
+        return Response(http_response, lean=self.lean)
+
+    async def _send(self, method: str, uri: str, header_factory, params: dict, kwargs: dict, validators: dict = None):
+        """Send a request through the shared connection pool, retrying it if the retry policy covers it, and return
+        the HTTP response"""
+        if self.retry is not None and method in self.retry.methods:
+            return await self.retry.acall(self._attempt, method, uri, header_factory, params, kwargs, validators)
+        return await self._attempt(method, uri, header_factory, params, kwargs, validators)
+
+    async def _attempt(self, method: str, uri: str, header_factory, params: dict, kwargs: dict,
+                       validators: dict = None):
+        """Send a request once, through the circuit breaker and rate limiter if there are any, and return the HTTP
+        response"""
+        endpoint, trial = self.breaker.before(uri) if self.breaker is not None else (None, False)
+        sending = False
+        try:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.aacquire(uri)
+            acall = getattr(header_factory, 'acall', None)
+            headers = await acall() if acall is not None else header_factory()
+            if validators:
+                headers = {**headers, **validators}
+            sending = True
+            response = await self.session.request(method, uri, headers=headers, params=_params(params), **kwargs)
+        except BaseException as e:
+            # BaseException, so a cancelled task gives back a trial too
+            if endpoint is not None:
+                self.breaker.record_error(endpoint, trial, e if sending else None)
+            raise
+        if endpoint is not None:
+            self.breaker.record(endpoint, self.breaker.failed(response))
+        logging.debug(f"{method} {response.url} {response.status_code}: {response.reason_phrase}")
+        return response
+
+    async def _send_cached(self, method: str, uri: str, header_factory, params: dict, kwargs: dict, key: str,
+                           ttl: float, cached):
+        """Send a GET request, revalidating the stale `cached` response if there is one, and store the result in the
+        cache if `ttl` is not None"""
+        validators = cached.validators() if cached is not None else None
+        response = await self._send(method, uri, header_factory, params, kwargs, validators=validators)
+        if ttl is not None:
+            if response.status_code == 304 and cached is not None:
+                return self.cache.revalidated(key, cached, response, ttl)
+            self.cache.put(key, response, ttl)
+        return response
+
+    def get(self, uri: str, header_factory, params: dict = None, **kwargs):
+        return self.request('GET', uri, header_factory, params=params, **kwargs)
+
+    def post(self, uri: str, header_factory, params: dict = None, **kwargs):
+        return self.request('POST', uri, header_factory, params=params, **kwargs)
+
+    def put(self, uri: str, header_factory, params: dict = None, **kwargs):
+        return self.request('PUT', uri, header_factory, params=params, **kwargs)
+
+    async def close(self):
+        """Close the connection pool"""
+        await self.session.aclose()
@@ -1,25 +1,24 @@
-import requests
+from typing import Iterator, Union
 
 from qnxt.authentication import RequestHeader
+from qnxt.client import Client, as_client
 from qnxt.api.Response import Response
+from qnxt.utils import *
 
-forcing a linting error
 
 class Search:
     BASE_PATH = r'QNXTApi/AppealAndGrievance/agIncidents/search'
 
     def __init__(self,
-                 app_server: str,
+                 app_server: Union[str, Client],
                  header_factory: RequestHeader,
                  skip: int = None,
                  take: int = None,
                  order_by: str = None,
                  expand: str = None,
                  ):
-        if app_server.endswith('/'):
-            self.base_uri = f"{app_server[:-1]}{self.BASE_PATH}"
-        else:
-            self.base_uri = f"{app_server}/{self.BASE_PATH}"
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
         self.header_factory = header_factory
 
         self.skip = skip
@@ -39,24 +38,111 @@ class Search:
         params = {'skip': self.skip, 'take': self.take, 'orderBy': self.order_by, 'expand': self.expand}
         params.update(kwargs)
         params.update({'detailId': detail_id})
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
+
+    def iter_details_by_id(self,
+                           detail_id,
+                           page_size: int = 100,
+                           max_records: int = None,
+                           prefetch: int = 0,
+                           **kwargs
+                           ) -> Iterator[dict]:
+        """
+        Lazily yields every incident with the given detail ID, requesting `page_size` records at a time. Each page is
+        released as soon as its records have been consumed.
+
+        Parameters
+        ----------
+        detail_id: required
+            Passed on to `get_details_by_id`
+        page_size: int, optional, default 100
+            The number of records requested per page (the `take` value)
+        max_records: int, optional
+            Stop after this many records. By default every matching record is returned.
+        prefetch: int, optional, default 0
+            The number of further pages kept in flight concurrently once the first page is back; records are still
+            yielded in order. See `qnxt.utils.paginate.iter_pages`.
+        kwargs:
+            Any other parameter of `get_details_by_id` except `take`, or `model` to convert each record (see
+            `qnxt.utils.paginate.paginate`)
+        """
+        return paginate.paginate(self.get_details_by_id, detail_id,
+                                 page_size=page_size, max_records=max_records, prefetch=prefetch,
+                                 **kwargs)
 
     def get_details_by_type(self, detail_type, **kwargs) -> Response:
         uri = self.base_uri
         params = {'skip': self.skip, 'take': self.take, 'orderBy': self.order_by, 'expand': self.expand}
         params.update(kwargs)
         params.update({'detailType': detail_type})
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
+
+    def iter_details_by_type(self,
+                             detail_type,
+                             page_size: int = 100,
+                             max_records: int = None,
+                             prefetch: int = 0,
+                             **kwargs
+                             ) -> Iterator[dict]:
+        """
+        Lazily yields every incident of the given detail type, requesting `page_size` records at a time. Each page is
+        released as soon as its records have been consumed.
+
+        Parameters
+        ----------
+        detail_type: required
+            Passed on to `get_details_by_type`
+        page_size: int, optional, default 100
+            The number of records requested per page (the `take` value)
+        max_records: int, optional
+            Stop after this many records. By default every matching record is returned.
+        prefetch: int, optional, default 0
+            The number of further pages kept in flight concurrently once the first page is back; records are still
+            yielded in order. See `qnxt.utils.paginate.iter_pages`.
+        kwargs:
+            Any other parameter of `get_details_by_type` except `take`, or `model` to convert each record (see
+            `qnxt.utils.paginate.paginate`)
+        """
+        return paginate.paginate(self.get_details_by_type, detail_type,
+                                 page_size=page_size, max_records=max_records, prefetch=prefetch,
+                                 **kwargs)
 
     def get_details_by_status(self, statuses, **kwargs) -> Response:
         uri = self.base_uri
         params = {'skip': self.skip, 'take': self.take, 'orderBy': self.order_by, 'expand': self.expand}
         params.update(kwargs)
         params.update({'statuses': statuses})
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
+
+    def iter_details_by_status(self,
+                               statuses,
+                               page_size: int = 100,
+                               max_records: int = None,
+                               prefetch: int = 0,
+                               **kwargs
+                               ) -> Iterator[dict]:
+        """
+        Lazily yields every incident with one of the given statuses, requesting `page_size` records at a time. Each page
+        is released as soon as its records have been consumed.
+
+        Parameters
+        ----------
+        statuses: required
+            Passed on to `get_details_by_status`
+        page_size: int, optional, default 100
+            The number of records requested per page (the `take` value)
+        max_records: int, optional
+            Stop after this many records. By default every matching record is returned.
+        prefetch: int, optional, default 0
+            The number of further pages kept in flight concurrently once the first page is back; records are still
+            yielded in order. See `qnxt.utils.paginate.iter_pages`.
+        kwargs:
+            Any other parameter of `get_details_by_status` except `take`, or `model` to convert each record (see
+            `qnxt.utils.paginate.paginate`)
+        """
+        return paginate.paginate(self.get_details_by_status, statuses,
+                                 page_size=page_size, max_records=max_records, prefetch=prefetch,
+                                 **kwargs)
 
     def ascending(self):
         """Update the class' orderBy parameter to ascending"""
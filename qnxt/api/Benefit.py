@@ -1,9 +1,8 @@
 from datetime import datetime, date
 from typing import Union
 
-import requests
-
 from qnxt.authentication import RequestHeader
+from qnxt.client import Client, as_client
 # from qnxt.utils.dateutil import dateformat
 # from qnxt.utils.clean_url import clean_url
 from qnxt.api.Response import Response
@@ -19,10 +18,11 @@ class BenefitResource:
     BASE_PATH = r'QNXTApi/Benefit'
 
     def __init__(self,
-                 app_server: str,
+                 app_server: Union[str, Client],
                  header_factory: RequestHeader,
                  ):
-        self.base_uri = f"{clean_url.clean_url(app_server, self.BASE_PATH)}"
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
         self.header_factory = header_factory
 
     def get_accumulators(self,
@@ -41,8 +41,7 @@ class BenefitResource:
         """
         endpoint = f"benefits/{plan_id}/{benefit_id}/accumulators"
         uri = f"{self.base_uri}/{endpoint}"
-        response = requests.get(uri, headers=self.header_factory())
-        return Response(response)
+        return self.client.get(uri, self.header_factory)
 
     def get_benefit(self,
                     plan_id: str,
@@ -59,8 +58,7 @@ class BenefitResource:
         """
         endpoint = f"benefits/{plan_id}/{benefit_id}"
         uri = f"{self.base_uri}/{endpoint}"
-        response = requests.get(uri, headers=self.header_factory())
-        return Response(response)
+        return self.client.get(uri, self.header_factory)
 
     def get_coverage_details(self,
                              plan_id: str,
@@ -85,22 +83,22 @@ class BenefitResource:
                   'asOfDate': as_of,
                   'expand': expand
                   }
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
 
 
 class BenefitPlan:
     BASE_PATH = r'QNXTApi/Benefit/plans'
 
     def __init__(self,
-                 app_server: str,
+                 app_server: Union[str, Client],
                  header_factory: RequestHeader,
                  plan_id: str,
                  expand: str = None,
                  enroll_type: str = None,
                  as_of: Union[date, datetime, str] = None
                  ):
-        self.base_uri = f"{clean_url(app_server, self.BASE_PATH)}/{plan_id}"
+        self.client = as_client(app_server)
+        self.base_uri = f"{self.client.url(self.BASE_PATH)}/{plan_id}"
         self.header_factory = header_factory
 
         self.expand = expand
@@ -112,8 +110,7 @@ class BenefitPlan:
         uri = self.base_uri
         params = {'expand': self.expand}
         params.update(kwargs)
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
 
     def get_benefit_plan_details(self, **kwargs) -> Response:
         """Takes in the optional parameters enrollType and asOfDate"""
@@ -121,8 +118,7 @@ class BenefitPlan:
         uri = f"{self.base_uri}/{endpoint}"
         params = {'enrollType': self.enroll_type, 'asOfDate': self.as_of}
         params.update(kwargs)
-        response = requests.get(uri, headers=self.header_factory())
-        return Response(response)
+        return self.client.get(uri, self.header_factory)
 
     def since(self, as_of: Union[date, datetime, str]):
         """Pass either a datetime/date object or a string in ISO format to set the class' asOfDate parameter.
@@ -1,10 +1,9 @@
 from datetime import date, datetime
-from typing import Union
-
-import requests
+from typing import Iterator, Union
 
 from qnxt.api.Response import Response
 from qnxt.authentication import RequestHeader
+from qnxt.client import Client, as_client
 from qnxt.utils import *
 
 
@@ -14,16 +13,17 @@ class CallStatistics:
 
     BASE_PATH = r'QNXTApi/CallTracking/stats/calls/dates/count'
 
-    def __init__(self, app_server: str, header_factory: RequestHeader):
+    def __init__(self, app_server: Union[str, Client], header_factory: RequestHeader):
         """
         Parameters
         ----------
-        app_server: str, optional
-            This is the FQDN of the target QNXT app server
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
         header_factory: qnxt.authentication.RequestHeader, required
             This is a callable that generates the appropriate authentication headers for QNXT API requests
         """
-        self.base_uri = clean_url.clean_url(app_server, self.BASE_PATH)
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
         self.header_factory = header_factory
 
     def get_call_count(self,
@@ -77,8 +77,7 @@ class CallStatistics:
                   'dateTo': date_to,
                   'entityState': entity_state
                   }
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
 
 
 class CallResource:
@@ -89,16 +88,17 @@ class CallResource:
 
     BASE_PATH = r'QNXTApi/CallTracking'
 
-    def __init__(self, app_server: str, header_factory: RequestHeader):
+    def __init__(self, app_server: Union[str, Client], header_factory: RequestHeader):
         """
         Parameters
         ----------
-        app_server: str, optional
-            This is the FQDN of the target QNXT app server
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
         header_factory: qnxt.authentication.RequestHeader, required
             This is a callable that generates the appropriate authentication headers for QNXT API requests
         """
-        self.base_uri = clean_url(app_server, self.BASE_PATH)
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
         self.header_factory = header_factory
 
     def search_call_issues(self,
@@ -193,8 +193,34 @@ class CallResource:
                   'orderBy': order_by,
                   'expand': expand,
                   }
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
+
+    def iter_call_issues(self,
+                         page_size: int = 100,
+                         max_records: int = None,
+                         prefetch: int = 0,
+                         **kwargs
+                         ) -> Iterator[dict]:
+        """
+        Lazily yields every call issue matching the search, requesting `page_size` records at a time. Each page is
+        released as soon as its records have been consumed.
+
+        Parameters
+        ----------
+        page_size: int, optional, default 100
+            The number of records requested per page (the `take` value)
+        max_records: int, optional
+            Stop after this many records. By default every matching record is returned.
+        prefetch: int, optional, default 0
+            The number of further pages kept in flight concurrently once the first page is back; records are still
+            yielded in order. See `qnxt.utils.paginate.iter_pages`.
+        kwargs:
+            Any other parameter of `search_call_issues` except `take`, or `model` to convert each record (see
+            `qnxt.utils.paginate.paginate`)
+        """
+        return paginate.paginate(self.search_call_issues,
+                                 page_size=page_size, max_records=max_records, prefetch=prefetch,
+                                 **kwargs)
 
     def search_call_details(self,
                             callerid: str = None,
@@ -283,8 +309,34 @@ class CallResource:
                   'orderBy': order_by,
                   'expand': expand
                   }
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
+
+    def iter_call_details(self,
+                          page_size: int = 100,
+                          max_records: int = None,
+                          prefetch: int = 0,
+                          **kwargs
+                          ) -> Iterator[dict]:
+        """
+        Lazily yields every call matching the search, requesting `page_size` records at a time. Each page is released as
+        soon as its records have been consumed.
+
+        Parameters
+        ----------
+        page_size: int, optional, default 100
+            The number of records requested per page (the `take` value)
+        max_records: int, optional
+            Stop after this many records. By default every matching record is returned.
+        prefetch: int, optional, default 0
+            The number of further pages kept in flight concurrently once the first page is back; records are still
+            yielded in order. See `qnxt.utils.paginate.iter_pages`.
+        kwargs:
+            Any other parameter of `search_call_details` except `take`, or `model` to convert each record (see
+            `qnxt.utils.paginate.paginate`)
+        """
+        return paginate.paginate(self.search_call_details,
+                                 page_size=page_size, max_records=max_records, prefetch=prefetch,
+                                 **kwargs)
 
     def get_call_details(self, callerid: str, expand: str = None) -> Response:
         """
@@ -308,8 +360,7 @@ class CallResource:
         endpoint = f"calls/{callerid}/issues"
         uri = f"{self.base_uri}/{endpoint}"
         params = {'expand': expand}
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
 
     def get_calls_by_callerid(self, callerid: str, expand: str = None) -> Response:
         """
@@ -333,5 +384,4 @@ class CallResource:
         endpoint = f"calls/{callerid}"
         uri = f"{self.base_uri}/{endpoint}"
         params = {'expand': expand}
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
@@ -1,13 +1,16 @@
 """The Member API provides access to member data including eligibility and enrollments, relationships, conditions,
 restrictions, assigned providers, benefits and accumulations, and memos and alerts"""
 
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import date, datetime
-from typing import Union
+from typing import Callable, Iterable, Iterator, Union
 
 import requests
 
 from qnxt.api.Response import Response
 from qnxt.authentication import RequestHeader
+from qnxt.client import Client, as_client, require_sync
 from qnxt.utils import *
 
 
@@ -17,17 +20,22 @@ class COPCProviders:
     can associate members with COPC providers and the conditions they can treat. The COPC Providers resource includes
     stored values for COPC providers, including address information and identifiers."""
     BASE_PATH = r"QNXTApi/Member"
+    # the fields of a COPC enrollment provider holding its provider ID and the window it is valid in. They are not in
+    # the QNXT documentation; an enrollment whose providers lack the ID or effective date, or do not carry the
+    # termination date at all, is never collapsed. Only an explicit null termination date means an open-ended window
+    COPC_WINDOW = ('provId', 'effDate', 'termDate')
 
-    def __init__(self, app_server: str, header_factory: RequestHeader):
+    def __init__(self, app_server: Union[str, Client], header_factory: RequestHeader):
         """
         Parameters
         ----------
-        app_server: str, optional
-            This is the FQDN of the target QNXT app server
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
         header_factory: qnxt.authentication.RequestHeader, required
             This is a callable that generates the appropriate authentication headers for QNXT API requests
         """
-        self.base_uri = f"{clean_url.clean_url(app_server, self.BASE_PATH)}"
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
         self.header_factory = header_factory
 
     def get_copc_enrollment_providers(self,
@@ -73,8 +81,37 @@ class COPCProviders:
                   'order_by': order_by,
                   'expand': expand,
                   }
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
+
+    def iter_copc_enrollment_providers(self,
+                                       enroll_id: str,
+                                       page_size: int = 100,
+                                       max_records: int = None,
+                                       prefetch: int = 0,
+                                       **kwargs
+                                       ) -> Iterator[dict]:
+        """
+        Lazily yields every COPC provider of the member enrollment, requesting `page_size` records at a time. Each page
+        is released as soon as its records have been consumed.
+
+        Parameters
+        ----------
+        enroll_id: str, required
+            Primary key of the enrollment table
+        page_size: int, optional, default 100
+            The number of records requested per page (the `take` value)
+        max_records: int, optional
+            Stop after this many records. By default every matching record is returned.
+        prefetch: int, optional, default 0
+            The number of further pages kept in flight concurrently once the first page is back; records are still
+            yielded in order. See `qnxt.utils.paginate.iter_pages`.
+        kwargs:
+            Any other parameter of `get_copc_enrollment_providers` except `take`, or `model` to convert each record (see
+            `qnxt.utils.paginate.paginate`)
+        """
+        return paginate.paginate(self.get_copc_enrollment_providers, enroll_id,
+                                 page_size=page_size, max_records=max_records, prefetch=prefetch,
+                                 **kwargs)
 
     def validate_copc_provider(self,
                                enroll_id: str,
@@ -116,8 +153,169 @@ class COPCProviders:
                   'codeId': code_id,
                   'icdVersion': icd_version
                   }
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
+
+    def validate_copc_providers(self,
+                                checks: Iterable[tuple],
+                                collapse: bool = True,
+                                workers: int = 16,
+                                **kwargs
+                                ) -> 'COPCValidationTable':
+        """
+        Validates many (enroll_id, prov_id, as_of_date) combinations at once and returns a lookup table of the
+        answers. Repeated combinations are validated once. If `collapse` is True, the COPC provider windows (effective
+        and termination dates) of every enrollment that is checked on more than one date are fetched first, and dates
+        that fall inside exactly the same windows of a provider are validated once for all of them, since the answer
+        cannot differ between them. Dates are only collapsed when they fall inside at least one window of the
+        provider; a provider with no windows, and every date outside all of its windows, is validated date by date.
+        The remaining validations run concurrently on `workers` threads.
+
+        Parameters
+        ----------
+        checks: iterable of tuple, required
+            (enroll_id, prov_id, as_of_date) or (enroll_id, prov_id) tuples; as_of_date is a date, datetime or ISO
+            string, or None
+        collapse: bool, optional, default True
+            Collapse the dates that COPC windows show to be equivalent. If an enrollment's windows cannot be fetched
+            or read, each of its distinct dates is validated.
+        workers: int, optional, default 16
+            The number of requests in flight at a time. Use a `qnxt.client.Client` with `pool_maxsize` of at least
+            `workers`.
+        kwargs:
+            Any other parameter of `validate_copc_provider`, the same for every check
+
+        Returns
+        -------
+        table: COPCValidationTable
+            {(enroll_id, prov_id, date): answer}; use `table.lookup(enroll_id, prov_id, as_of_date)` to look up a
+            date given in any form. Checks that failed are in `table.errors` instead.
+
+        Examples
+        --------
+        >>> table = copc.validate_copc_providers((c['enrollid'], c['provid'], c['startdate']) for c in claims)
+        >>> table.lookup('ENR1', 'PRV1', '2024-03-01'), table.stats()
+        """
+        assert (workers > 0), "`workers` must be greater than 0"
+        require_sync(self.client, 'validate_copc_providers')
+        table = COPCValidationTable()
+        distinct = {}
+        for enroll_id, prov_id, *as_of_date in checks:
+            table.requested += 1
+            distinct.setdefault((enroll_id, prov_id), set()).add(_as_of(as_of_date[0] if as_of_date else None))
+        table.distinct = sum(len(dates) for dates in distinct.values())
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            windows = {}
+            if collapse:
+                members = {enroll_id for (enroll_id, _), dates in distinct.items() if len(dates) > 1}
+                futures = {pool.submit(self._copc_windows, enroll_id): enroll_id for enroll_id in members}
+                for future in as_completed(futures):
+                    try:
+                        windows[futures[future]] = future.result()
+                    except Exception as e:
+                        logging.debug(f"COPC windows of {futures[future]} unavailable, dates not collapsed: {e}")
+                del futures
+
+            calls = {}
+            for (enroll_id, prov_id), dates in distinct.items():
+                # a provider missing from the windows is not known to have none, so its dates are not collapsed
+                provider_windows = windows[enroll_id].get(prov_id) if enroll_id in windows else None
+                for as_of, group in _collapse(dates, provider_windows):
+                    future = pool.submit(self.validate_copc_provider, enroll_id, prov_id,
+                                         as_of_date=as_of.isoformat() if as_of is not None else None, **kwargs)
+                    calls[future] = (enroll_id, prov_id, group)
+            table.validated = len(calls)
+            del distinct, windows
+
+            for future in as_completed(calls):
+                enroll_id, prov_id, group = calls.pop(future)
+                try:
+                    answer = _validation(future.result())
+                except Exception as e:
+                    for as_of in group:
+                        table.errors[(enroll_id, prov_id, as_of)] = e
+                    continue
+                for as_of in group:
+                    table[(enroll_id, prov_id, as_of)] = answer
+        return table
+
+    def _copc_windows(self, enroll_id: str) -> dict:
+        """Returns {prov_id: [(effective date, termination date or None)]} of every COPC provider of an enrollment.
+        No `as_of_date` is passed on purpose, so past and future windows are included and not only the active ones."""
+        windows = {}
+        prov_field, eff_field, term_field = self.COPC_WINDOW
+        for provider in self.iter_copc_enrollment_providers(enroll_id, page_size=500):
+            prov_id, eff, term = provider.get(prov_field), provider.get(eff_field), provider.get(term_field)
+            if prov_id is None or eff is None or term_field not in provider:
+                raise ValueError(f"COPC provider without {prov_field}, {eff_field} or {term_field}: {provider}")
+            windows.setdefault(prov_id, []).append((_as_of(eff), _as_of(term)))
+        return windows
+
+
+def _as_of(value: Union[date, datetime, str, None]) -> Union[date, None]:
+    """Returns the calendar date of a date, datetime or ISO string"""
+    if value is None or value == '':
+        return None
+    return dateutil.to_datetime(value).date()
+
+
+def _collapse(dates: set, windows: Union[list, None]) -> list:
+    """Returns [(representative date, dates)] grouping the dates that fall inside exactly the same `windows`. Every
+    date is its own group if `windows` is None or empty, and so is a missing date and a date outside every window,
+    since nothing is known about the windows it might fall in"""
+    groups = {}
+    singles = []
+    for as_of in dates:
+        signature = None
+        if windows and as_of is not None:
+            signature = tuple(eff <= as_of and (term is None or as_of <= term) for eff, term in windows)
+        if signature is None or not any(signature):
+            singles.append((as_of, (as_of,)))
+        else:
+            groups.setdefault(signature, []).append(as_of)
+    return [(group[0], tuple(group)) for group in groups.values()] + singles
+
+
+def _raise_for_status(response: Response) -> Response:
+    """Raises requests.HTTPError if `response` is an HTTP error"""
+    if response.status_code >= 400:
+        raise requests.HTTPError(f"{response.status_code} Error for url: {response.http_response.url}",
+                                 response=response.http_response)
+    return response
+
+
+def _validation(response: Response):
+    """Returns the answer of `validate_copc_provider`, unwrapped from 'results' if it is there"""
+    body = _raise_for_status(response).json
+    answer = body.get('results', body) if isinstance(body, dict) else body
+    if isinstance(answer, list) and len(answer) == 1:
+        answer = answer[0]
+    if isinstance(answer, dict) and len(answer) == 1:
+        answer = next(iter(answer.values()))
+    return answer
+
+
+class COPCValidationTable(dict):
+    """The answers of `COPCProviders.validate_copc_providers`, keyed by (enroll_id, prov_id, datetime.date or None)"""
+
+    def __init__(self):
+        super().__init__()
+        self.errors = {}
+        self.requested = 0
+        self.distinct = 0
+        self.validated = 0
+
+    def lookup(self, enroll_id: str, prov_id: str, as_of_date: Union[date, datetime, str] = None):
+        """Returns the answer for a check, given its date in any form. Raises the error if the check failed."""
+        key = (enroll_id, prov_id, _as_of(as_of_date))
+        if key in self.errors:
+            raise self.errors[key]
+        return self[key]
+
+    def stats(self) -> dict:
+        """Returns the number of checks passed in, of distinct checks and of validation requests actually sent"""
+        return {'requested': self.requested, 'distinct': self.distinct, 'validated': self.validated,
+                'errors': len(self.errors)}
 
 
 class EnrollmentAccumulators:
@@ -127,24 +325,24 @@ class EnrollmentAccumulators:
 
     BASE_PATH = r"QNXTApi/Member"
 
-    def __init__(self, app_server: str, header_factory: RequestHeader):
+    def __init__(self, app_server: Union[str, Client], header_factory: RequestHeader):
         """
         Parameters
         ----------
-        app_server: str, optional
-            This is the FQDN of the target QNXT app server
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
         header_factory: qnxt.authentication.RequestHeader, required
             This is a callable that generates the appropriate authentication headers for QNXT API requests
         """
-        self.base_uri = f"{clean_url.clean_url(app_server, self.BASE_PATH)}"
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
         self.header_factory = header_factory
 
     def get_static_plan_accruals(self, enroll_id: str, expand: str = None) -> Response:
         endpoint = f"accumulations/{enroll_id}/staticPlanAccruals"
         uri = f"{self.base_uri}/{endpoint}"
         params = {'expand': expand}
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
 
     def get_static_benefit_accruals(self,
                                     enroll_id: str,
@@ -181,11 +379,174 @@ class EnrollmentAccumulators:
         endpoint = f"accumulations/{enroll_id}/staticBenefitAccruals/{accum_id}/{accum_type}"
         uri = f"{self.base_uri}/{endpoint}"
         params = {'entityState': entity_state}
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
 
 
 class EnrollmentPlanAccumulations:
     def __init__(self):
         pass
         # TODO
+
+
+# marks the end of the enrollment IDs passed to `MemberEnrichment.enrich`, since None could be one of them
+_END = object()
+
+
+class _Enrollment:
+    """The state of one member of a `MemberEnrichment` batch: its record and the number of calls still in flight"""
+    __slots__ = ('record', 'remaining')
+
+    def __init__(self, enroll_id: str):
+        self.record = {'enroll_id': enroll_id,
+                       'copc_providers': None,
+                       'plan_accruals': None,
+                       'benefit_accruals': {},
+                       'errors': {}}
+        self.remaining = 0
+
+
+class MemberEnrichment:
+    """Fetches the COPC providers, static plan accruals and static benefit accruals of many enrollments at once"""
+
+    def __init__(self, app_server: Union[str, Client], header_factory: RequestHeader):
+        """
+        Parameters
+        ----------
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used. Use a
+            Client with `pool_maxsize` of at least the number of workers.
+        header_factory: qnxt.authentication.RequestHeader, required
+            This is a callable that generates the appropriate authentication headers for QNXT API requests
+        """
+        self.client = as_client(app_server)
+        self.header_factory = header_factory
+        self.copc = COPCProviders(self.client, header_factory)
+        self.accumulators = EnrollmentAccumulators(self.client, header_factory)
+
+    @staticmethod
+    def accumulator_keys(plan_accruals: list) -> list:
+        """Returns the (accum_id, accum_type) of every static plan accrual that carries both"""
+        keys = []
+        for accrual in plan_accruals or ():
+            if isinstance(accrual, dict) and accrual.get('accumId') and accrual.get('accumType'):
+                keys.append((accrual['accumId'], accrual['accumType']))
+        return list(dict.fromkeys(keys))
+
+    def enrich(self,
+               enroll_ids: Iterable[str],
+               as_of_date: Union[date, datetime, str] = None,
+               accumulators: Union[Iterable[tuple], Callable] = None,
+               workers: int = 16,
+               max_enrollments: int = None,
+               ) -> Iterator[dict]:
+        """
+        Lazily yields one record per enrollment ID, as soon as all of that enrollment's calls have completed, so
+        records come back in completion order rather than input order. The COPC providers and static plan accruals of
+        every enrollment are requested concurrently on a pool of `workers` threads, followed by its static benefit
+        accruals once the accumulators are known. `enroll_ids` is consumed lazily and at most `max_enrollments`
+        enrollments are in flight at a time, so memory stays flat however many IDs are passed.
+
+        Each record is a dict:
+        {'enroll_id': str,
+         'copc_providers': list,                        # results of `COPCProviders.get_copc_enrollment_providers`
+         'plan_accruals': list,                         # results of `EnrollmentAccumulators.get_static_plan_accruals`
+         'benefit_accruals': {(accum_id, accum_type): list},  # results of `get_static_benefit_accruals`
+         'errors': {call: exception}}
+        A call that raises or returns an HTTP error leaves its section None (or out of 'benefit_accruals') and is
+        reported in 'errors' under 'copc_providers', 'plan_accruals' or (accum_id, accum_type); the other calls and
+        enrollments carry on.
+
+        Parameters
+        ----------
+        enroll_ids: iterable of str, required
+            The enrollment IDs
+        as_of_date: [date, datetime, str], optional
+            Passed on to `get_copc_enrollment_providers`
+        accumulators: iterable of tuple or callable, optional
+            The (accum_id, accum_type) pairs whose benefit accruals are fetched for every enrollment, or a callable
+            that returns them given an enrollment's plan accruals. By default they are taken from the 'accumId' and
+            'accumType' of the plan accruals (see `accumulator_keys`).
+        workers: int, optional, default 16
+            The number of calls in flight at a time
+        max_enrollments: int, optional, default 2 * `workers`
+            The number of enrollments in flight at a time
+
+        Examples
+        --------
+        >>> client = Client(r"http://qnxt_app_server.com", pool_maxsize=32)
+        >>> for record in MemberEnrichment(client, header_factory).enrich(enroll_ids, workers=32):
+        ...     print(record['enroll_id'], len(record['copc_providers']))
+        """
+        assert (workers > 0), "`workers` must be greater than 0"
+        require_sync(self.client, 'enrich')
+        if accumulators is None:
+            accumulators = self.accumulator_keys
+        elif not callable(accumulators):
+            fixed = list(accumulators)
+
+            def accumulators(plan_accruals: list) -> list:
+                return fixed
+        max_enrollments = max_enrollments or 2 * workers
+        enroll_ids = iter(enroll_ids)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            inflight = {}
+
+            def submit(enrollment: _Enrollment, part, fn: Callable, *args, **kwargs):
+                inflight[pool.submit(fn, *args, **kwargs)] = (enrollment, part)
+                enrollment.remaining += 1
+
+            def start() -> bool:
+                enroll_id = next(enroll_ids, _END)
+                if enroll_id is _END:
+                    return False
+                enrollment = _Enrollment(enroll_id)
+                submit(enrollment, 'copc_providers', self.copc.get_copc_enrollment_providers, enroll_id,
+                       as_of_date=as_of_date)
+                submit(enrollment, 'plan_accruals', self.accumulators.get_static_plan_accruals, enroll_id)
+                return True
+
+            active = 0
+            while active < max_enrollments and start():
+                active += 1
+            try:
+                while inflight:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        enrollment, part = inflight.pop(future)
+                        enrollment.remaining -= 1
+                        record = enrollment.record
+                        try:
+                            results = self._results(future)
+                        except Exception as e:
+                            record['errors'][part] = e
+                            results = None
+                        if isinstance(part, tuple):
+                            if results is not None:
+                                record['benefit_accruals'][part] = results
+                        else:
+                            record[part] = results
+                        if part == 'plan_accruals' and results is not None:
+                            try:
+                                keys = accumulators(results)
+                            except Exception as e:
+                                record['errors']['accumulators'] = e
+                                keys = ()
+                            for accum_id, accum_type in keys:
+                                submit(enrollment, (accum_id, accum_type),
+                                       self.accumulators.get_static_benefit_accruals, record['enroll_id'], accum_id,
+                                       accum_type)
+                        if enrollment.remaining == 0:
+                            active -= 1
+                            if start():
+                                active += 1
+                            yield record
+            finally:
+                for future in inflight:
+                    future.cancel()
+
+    @staticmethod
+    def _results(future) -> list:
+        """Returns the 'results' of a completed call, raising if it failed"""
+        body = _raise_for_status(future.result()).json
+        return body.get('results') if isinstance(body, dict) else body
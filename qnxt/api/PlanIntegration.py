@@ -1,10 +1,20 @@
-from datetime import date, datetime
-from typing import Union
+import copy
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from typing import Hashable, Iterator, Tuple, Union
 
 import requests
 
 from qnxt.api.Response import Response
 from qnxt.authentication import RequestHeader
+from qnxt.client import Client, as_client
+from qnxt.journal import DONE, FAILED, FailedWriteError, WriteJournal
+from qnxt.retry import RetryPolicy, unsent
 from qnxt.utils import *
 
 
@@ -12,17 +22,18 @@ class ApplicationLogs:
     """This operation returns application logs, based on the data passed in the request."""
     BASE_PATH = r"QNXTApi/PlanIntegration"
 
-    def __init__(self, app_server, header_factory):
+    def __init__(self, app_server: Union[str, Client], header_factory: RequestHeader):
         """
         Parameters
         ----------
-        app_server: str, optional
-            This is the FQDN of the target QNXT app server
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
         header_factory: qnxt.authentication.RequestHeader, required
             This is a callable that generates the appropriate authentication headers for QNXT API requests
         """
-        self.base_uri = clean_url.clean_url(app_server, self.BASE_PATH)
-        self.app_server = app_server
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
+        self.app_server = self.client.app_server
         self.header_factory = header_factory
 
     def search(self,
@@ -107,24 +118,85 @@ class ApplicationLogs:
                   'utcDateFrom': dateutil.dateformat(utc_date_from),
                   'utcDateTo': dateutil.dateformat(utc_date_to)
                   }
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
+
+    def iter_search(self,
+                    page_size: int = 100,
+                    max_records: int = None,
+                    prefetch: int = 0,
+                    **kwargs
+                    ) -> Iterator[dict]:
+        """
+        Lazily yields every application log matching the search, requesting `page_size` records at a time. Each page is
+        released as soon as its records have been consumed.
+
+        Parameters
+        ----------
+        page_size: int, optional, default 100
+            The number of records requested per page (the `take` value)
+        max_records: int, optional
+            Stop after this many records. By default every matching record is returned.
+        prefetch: int, optional, default 0
+            The number of further pages kept in flight concurrently once the first page is back; records are still
+            yielded in order. See `qnxt.utils.paginate.iter_pages`.
+        kwargs:
+            Any other parameter of `search` except `take`, or `model` to convert each record (see
+            `qnxt.utils.paginate.paginate`)
+        """
+        return paginate.paginate(self.search, page_size=page_size, max_records=max_records, prefetch=prefetch,
+                                 **kwargs)
+
+    def scan(self,
+             utc_date_from: Union[date, datetime, str],
+             utc_date_to: Union[date, datetime, str],
+             windows: int = 8,
+             workers: int = 8,
+             window_limit: int = 1000,
+             min_window: timedelta = timedelta(minutes=1),
+             **kwargs
+             ) -> Iterator[dict]:
+        """
+        Lazily yields every application log between `utc_date_from` and `utc_date_to` by splitting the range into
+        time windows that are searched in parallel. Windows that are too dense are split again, so the server never
+        has to skip deep into a large result set. Records are deduplicated on `referenceId` and come back in the order
+        their windows complete, not in date order.
+
+        Parameters
+        ----------
+        utc_date_from: [date, datetime, str], required
+            The start of the range, in UTC. Dates are taken as midnight.
+        utc_date_to: [date, datetime, str], required
+            The end of the range, in UTC. Dates are taken as midnight.
+        windows: int, optional, default 8
+            The number of windows the range is split into up front
+        workers: int, optional, default 8
+            The number of windows searched concurrently
+        window_limit: int, optional, default 1000
+            The `take` value of each window search, and the number of records above which a window is split
+        min_window: datetime.timedelta, optional, default 1 minute
+            Windows are never split below this width; a window that is still too dense is paged through instead
+        kwargs:
+            Any other parameter of `search` except `skip` and `take`, e.g. `level='Error'`
+        """
+        return paginate.scan(self.search, utc_date_from, utc_date_to, key='referenceId', windows=windows,
+                             workers=workers, window_limit=window_limit, min_window=min_window, **kwargs)
 
 
 class ProcessLogs:
     """Provide a processLogDetailID and retrieve full details"""
     BASE_PATH = r'QNXTApi/PlanIntegration'
 
-    def __init__(self, app_server: str, header_factory: RequestHeader):
+    def __init__(self, app_server: Union[str, Client], header_factory: RequestHeader):
         """
         Parameters
         ----------
-        app_server: str, optional
-            This is the FQDN of the target QNXT app server
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
         header_factory: qnxt.authentication.RequestHeader, required
             This is a callable that generates the appropriate authentication headers for QNXT API requests
         """
-        self.base_uri = clean_url.clean_url(app_server, self.BASE_PATH)
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
         self.header_factory = header_factory
 
     def get_details(self, process_log_detailid: str):
@@ -146,8 +218,7 @@ class ProcessLogs:
         uri = f"{self.base_uri}/{endpoint}"
         params = {'processLogDetailId': process_log_detailid
                   }
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
 
 
 class ProcessLogDetails:
@@ -156,16 +227,17 @@ class ProcessLogDetails:
     and stages."""
     BASE_PATH = r"QNXTApi/PlanIntegration"
 
-    def __init__(self, app_server: str, header_factory: RequestHeader):
+    def __init__(self, app_server: Union[str, Client], header_factory: RequestHeader):
         """
         Parameters
         ----------
-        app_server: str, optional
-            This is the FQDN of the target QNXT app server
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
         header_factory: qnxt.authentication.RequestHeader, required
             This is a callable that generates the appropriate authentication headers for QNXT API requests
         """
-        self.base_uri = f"{clean_url.clean_url(app_server, self.BASE_PATH)}"
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
         self.header_factory = header_factory
 
     def search(self,
@@ -216,8 +288,33 @@ class ProcessLogDetails:
                   'orderBy': order_by,
                   'expand': expand
                   }
-        response = requests.get(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.get(uri, self.header_factory, params=params)
+
+    def iter_search(self,
+                    page_size: int = 100,
+                    max_records: int = None,
+                    prefetch: int = 0,
+                    **kwargs
+                    ) -> Iterator[dict]:
+        """
+        Lazily yields every process log detail matching the search, requesting `page_size` records at a time. Each page
+        is released as soon as its records have been consumed.
+
+        Parameters
+        ----------
+        page_size: int, optional, default 100
+            The number of records requested per page (the `take` value)
+        max_records: int, optional
+            Stop after this many records. By default every matching record is returned.
+        prefetch: int, optional, default 0
+            The number of further pages kept in flight concurrently once the first page is back; records are still
+            yielded in order. See `qnxt.utils.paginate.iter_pages`.
+        kwargs:
+            Any other parameter of `search` except `take`, or `model` to convert each record (see
+            `qnxt.utils.paginate.paginate`)
+        """
+        return paginate.paginate(self.search, page_size=page_size, max_records=max_records, prefetch=prefetch,
+                                 **kwargs)
 
     def create_process_logdetail(self,
                                  processlog_id: str = None,
@@ -280,8 +377,7 @@ class ProcessLogDetails:
                   'amount': amount,
                   'entityState': entity_state
                   }
-        response = requests.post(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.post(uri, self.header_factory, params=params)
 
     def update_process_logdetail(self,
                                  processlogdetail_id: str,
@@ -381,8 +477,7 @@ class ProcessLogDetails:
                   'amount': amount,
                   'entityState': entity_state
                   }
-        response = requests.put(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.put(uri, self.header_factory, params=params)
 
     def create_process_state(self,
                              processlogdetail_id: str,
@@ -475,8 +570,7 @@ class ProcessLogDetails:
                   'executionTime': execution_time,
                   'entityState': entity_state,
                   }
-        response = requests.post(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.post(uri, self.header_factory, params=params)
 
 
 class ProcessLogHeaders:
@@ -485,16 +579,17 @@ class ProcessLogHeaders:
     and errors, for multiple processes."""
     BASE_PATH = r"QNXTApi/PlanIntegration"
 
-    def __init__(self, app_server: str, header_factory: RequestHeader):
+    def __init__(self, app_server: Union[str, Client], header_factory: RequestHeader):
         """
         Parameters
         ----------
-        app_server: str, optional
-            This is the FQDN of the target QNXT app server
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
         header_factory: qnxt.authentication.RequestHeader, required
             This is a callable that generates the appropriate authentication headers for QNXT API requests
         """
-        self.base_uri = f"{clean_url.clean_url(app_server, self.BASE_PATH)}"
+        self.client = as_client(app_server)
+        self.base_uri = self.client.url(self.BASE_PATH)
         self.header_factory = header_factory
 
     def create_process_log_header(self,
@@ -573,8 +668,7 @@ class ProcessLogHeaders:
                   'xmlData': xml_data,
                   'entityState': entity_state,
                   }
-        response = requests.post(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.post(uri, self.header_factory, params=params)
 
     def update_process_log_header(self,
                                   processlog_id: str,
@@ -681,5 +775,753 @@ class ProcessLogHeaders:
                   'xmlData': xml_data,
                   'entityState': entity_state,
                   }
-        response = requests.put(uri, headers=self.header_factory(), params=params)
-        return Response(response)
+        return self.client.put(uri, self.header_factory, params=params)
+
+
+def _created_id(response: Response, field: str):
+    """Returns the `field` of the record created by a POST, or the whole created record if it has no such field.
+    Raises requests.HTTPError if `response` is an HTTP error."""
+    if response.status_code >= 400:
+        raise requests.HTTPError(f"{response.status_code} Error for url: {response.http_response.url}",
+                                 response=response.http_response)
+    body = response.json
+    created = body.get('results', body) if isinstance(body, dict) else body
+    if isinstance(created, list) and len(created) == 1:
+        created = created[0]
+    if isinstance(created, dict):
+        return created.get(field, created)
+    return created
+
+
+class JournaledWrites:
+    """Sends the PlanIntegration writes (the process log header, detail and state creates and updates) with retries,
+    and records each one under the dedup key it is given in a `qnxt.journal.WriteJournal`, so that a write the app
+    server has acknowledged is never sent twice and one it has not can be replayed after a crash"""
+    # operation -> (resource, the field of the written record returned for it)
+    OPERATIONS = {'create_process_log_header': ('headers', 'processLogId'),
+                  'update_process_log_header': ('headers', 'processLogId'),
+                  'create_process_logdetail': ('details', 'processLogDetailId'),
+                  'update_process_logdetail': ('details', 'processLogDetailId'),
+                  'create_process_state': ('details', 'processStateId')}
+
+    def __init__(self,
+                 app_server: Union[str, Client],
+                 header_factory: RequestHeader,
+                 journal: WriteJournal = None,
+                 retry: RetryPolicy = None,
+                 ):
+        """
+        Each write returns the ID of the record written, or the whole record if the app server's answer has no such
+        field (see `OPERATIONS`), and raises requests.HTTPError if it still fails after its last retry.
+
+        QNXT has no idempotency keys of its own, so a create that reached the app server but whose answer was lost
+        would be created twice if it were sent again. Creates are therefore only retried when the app server cannot
+        have processed them: after a failed connection or a 429 or 503 (see `qnxt.retry.RetryPolicy.unsent`). A
+        create that fails any other way (e.g. a read timeout or a 500) is marked failed in the journal, not pending,
+        so `replay` leaves it alone, and writing it again with the same key, e.g. on a rerun of the job, raises
+        `qnxt.journal.FailedWriteError` without sending it; check whether the record exists, e.g. by its reference ID,
+        before requeuing it with `journal.retry_failed()`. Updates are retried after any failure the policy covers.
+
+        The retries are left to this class, so the client must not retry writes itself: its `retry` policy, if it
+        has one, may not cover POST or PUT.
+
+        Parameters
+        ----------
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
+        header_factory: qnxt.authentication.RequestHeader, required
+            This is a callable that generates the appropriate authentication headers for QNXT API requests
+        journal: qnxt.journal.WriteJournal, optional
+            Where the writes are recorded, one journal per job. Every write then needs a `key`. Without a journal,
+            writes are only retried.
+        retry: qnxt.retry.RetryPolicy, optional, default RetryPolicy()
+            How often, and how long apart, a failed write is sent again. Creates use `retry.unsent()`.
+
+        Raises
+        ------
+        ValueError
+            The client retries POST or PUT requests itself
+
+        Examples
+        --------
+        >>> writes = JournaledWrites(client, header_factory, journal=WriteJournal('/var/lib/qnxt/myjob.sqlite3'))
+        >>> writes.replay()  # send whatever the last run left unacknowledged
+        >>> for row in rows:  # rows that were already written are not sent again
+        ...     detail_id = writes.create_process_logdetail(f"{row.id}/detail", processlog_id=header_id,
+        ...                                                 referenceid=row.id)
+        ...     writes.create_process_state(f"{row.id}/state", processlogdetail_id=detail_id,
+        ...                                 process_stage_id='COMPLETED')
+        """
+        self.client = as_client(app_server)
+        client_retry = getattr(self.client, 'retry', None)
+        if client_retry is not None and {'POST', 'PUT'} & set(client_retry.methods):
+            # the client's retries would run under ours, and would send a create again after a read timeout
+            raise ValueError("JournaledWrites needs a client whose retry policy leaves out POST and PUT, it retries "
+                             "the writes itself")
+        self.header_factory = header_factory
+        self.journal = journal
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.create_retry = self.retry.unsent()
+        self.headers = ProcessLogHeaders(self.client, header_factory)
+        self.details = ProcessLogDetails(self.client, header_factory)
+        self.sent = 0
+        self.deduplicated = 0
+        self.replayed = 0
+        self._counter_lock = threading.Lock()
+        # concurrent writes with the same explicit key are sent once
+        self._flights = singleflight.SingleFlight()
+
+    def __repr__(self):
+        return f"JournaledWrites(journal={self.journal}, retry={self.retry})"
+
+    def write(self, operation: str, key: str = None, **kwargs):
+        """
+        Send a write, unless the journal already has it acknowledged, in which case its stored result is returned
+
+        Parameters
+        ----------
+        operation: str, required
+            One of `OPERATIONS`, e.g. 'create_process_logdetail'
+        key: str, required with a journal
+            The dedup key of the write, unique to it within the job, e.g. a transaction ID and the step it records.
+            The same key on a rerun of the job is the same write. Writes with the same key that run at the same time
+            are sent once. Keys are never derived from the parameters, since two writes with the same parameters (e.g.
+            an update that sets a field back to an earlier value) can both be wanted.
+        kwargs:
+            The parameters of the operation
+
+        Raises
+        ------
+        ValueError
+            There is a journal and no `key`
+        qnxt.journal.FailedWriteError
+            The journal has the write under `key` marked failed; it is not sent (see `WriteJournal.retry_failed`)
+        """
+        assert (operation in self.OPERATIONS), f"`operation` must be one of {tuple(self.OPERATIONS)}"
+        if key is None:
+            if self.journal is not None:
+                raise ValueError(f"{operation} needs a `key` to be journaled, e.g. the ID of the transaction it "
+                                 f"records")
+            return self._write(operation, key, kwargs)
+        return self._flights.do(key, self._write, operation, key, kwargs)
+
+    def _policy(self, operation: str) -> RetryPolicy:
+        return self.create_retry if operation.startswith('create_') else self.retry
+
+    def _write(self, operation: str, key: Union[str, None], kwargs: dict):
+        journaled = self.journal is not None and key is not None
+        if journaled:
+            status, result = self.journal.begin(key, operation, kwargs)
+            if status == DONE:
+                with self._counter_lock:
+                    self.deduplicated += 1
+                return result
+            if status == FAILED:
+                raise FailedWriteError(key, self.journal.get(key)['error'])
+        resource, field = self.OPERATIONS[operation]
+        policy = self._policy(operation)
+        try:
+            response = policy.call(getattr(getattr(self, resource), operation), **kwargs)
+            with self._counter_lock:
+                self.sent += 1
+            result = _created_id(response, field)
+        except Exception as e:
+            if journaled:
+                self.journal.fail(key, e, permanent=self._permanent(e, policy))
+            raise
+        if journaled:
+            self.journal.ack(key, result)
+        return result
+
+    @staticmethod
+    def _permanent(error: Exception, policy: RetryPolicy) -> bool:
+        """Returns True if sending the write again would not fix `error`, e.g. 400 Bad Request, or, under a policy
+        that only retries unsent requests, might apply the write twice"""
+        status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+        if status_code is not None:
+            return status_code not in policy.statuses
+        return policy.unsent_only and not unsent(error)
+
+    def replay(self) -> int:
+        """
+        Send every write the journal has as pending, in the order they were first recorded, e.g. those left
+        unacknowledged when a previous run crashed. A write rejected for good (e.g. 400 Bad Request), or a create that
+        may have been applied, is marked failed in the journal and skipped. Stops at the first write that still fails
+        otherwise, raising its error and leaving it and the writes after it pending. Returns the number of writes
+        acknowledged.
+        """
+        assert (self.journal is not None), "replaying needs a journal"
+        replayed = 0
+        for key, operation, kwargs in self.journal.pending():
+            try:
+                self.write(operation, key=key, **kwargs)
+            except Exception as e:
+                if self._permanent(e, self._policy(operation)):
+                    continue
+                raise
+            replayed += 1
+            with self._counter_lock:
+                self.replayed += 1
+        return replayed
+
+    def create_process_log_header(self, key: str = None, **kwargs):
+        """`ProcessLogHeaders.create_process_log_header`, through `write`"""
+        return self.write('create_process_log_header', key=key, **kwargs)
+
+    def update_process_log_header(self, key: str = None, **kwargs):
+        """`ProcessLogHeaders.update_process_log_header`, through `write`"""
+        return self.write('update_process_log_header', key=key, **kwargs)
+
+    def create_process_logdetail(self, key: str = None, **kwargs):
+        """`ProcessLogDetails.create_process_logdetail`, through `write`"""
+        return self.write('create_process_logdetail', key=key, **kwargs)
+
+    def update_process_logdetail(self, key: str = None, **kwargs):
+        """`ProcessLogDetails.update_process_logdetail`, through `write`"""
+        return self.write('update_process_logdetail', key=key, **kwargs)
+
+    def create_process_state(self, key: str = None, **kwargs):
+        """`ProcessLogDetails.create_process_state`, through `write`"""
+        return self.write('create_process_state', key=key, **kwargs)
+
+    def stats(self) -> dict:
+        """Returns the number of writes sent, answered from the journal and replayed, with the retry counts of the
+        updates and creates together"""
+        retries = self.retry.stats()
+        for name, count in self.create_retry.stats().items():
+            if name != 'budget_exhausted':  # the budget is shared
+                retries[name] += count
+        return {'sent': self.sent, 'deduplicated': self.deduplicated, 'replayed': self.replayed, **retries}
+
+
+class _WriteFuture(Future):
+    """The future of a row queued on a `ProcessLogWriter`, which remembers the lane the row was sent on"""
+
+    def __init__(self, lane: Hashable):
+        super().__init__()
+        self.lane = lane
+
+
+# wakes a waiting ProcessLogWriter worker or ProcessLogHandler shipper to stop it
+_STOP = object()
+
+
+class _Row:
+    __slots__ = ('operation', 'kwargs', 'key', 'future')
+
+    def __init__(self, operation: str, kwargs: dict, key: Union[str, None], future: _WriteFuture):
+        self.operation = operation
+        self.kwargs = kwargs
+        self.key = key
+        self.future = future
+
+
+class ProcessLogWriter:
+    """Queues process log detail and state records and creates them on a bounded pool of threads, so that a job
+    logging many transactions never waits on QNXT for each one"""
+    DETAIL_ID = 'processLogDetailId'
+    STATE_ID = 'processStateId'
+
+    def __init__(self,
+                 app_server: Union[str, Client],
+                 header_factory: RequestHeader,
+                 workers: int = 8,
+                 batch_size: int = 100,
+                 flush_interval: float = 1.0,
+                 max_pending: int = 10000,
+                 ordered: bool = True,
+                 writes: JournaledWrites = None,
+                 ):
+        """
+        Rows are buffered and handed to the pool `batch_size` at a time, or every `flush_interval` seconds, whichever
+        comes first. Each row is still one request to the app server, but requests for different headers run
+        concurrently. Every `add_detail` and `add_state` returns a `concurrent.futures.Future` of the created ID.
+
+        Parameters
+        ----------
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used. Use a
+            Client with `pool_maxsize` of at least `workers`.
+        header_factory: qnxt.authentication.RequestHeader, required
+            This is a callable that generates the appropriate authentication headers for QNXT API requests
+        workers: int, optional, default 8
+            The number of requests in flight at a time
+        batch_size: int, optional, default 100
+            The number of buffered rows that triggers a flush to the pool
+        flush_interval: float, optional, default 1.0
+            The longest time, in seconds, a row waits in the buffer
+        max_pending: int, optional, default 10000
+            The number of rows queued or in flight at a time. `add_detail` and `add_state` block once it is reached, so
+            memory stays flat however fast rows are added.
+        ordered: bool, optional, default True
+            If True, the rows of one header (`processlog_id`) are created one after another in the order they were
+            added, and rows of different headers run concurrently. If False, only a state added under the future of a
+            detail waits for that detail; everything else runs concurrently.
+        writes: JournaledWrites, optional
+            If given, rows are sent through it, so that they are retried and journaled. Rows that a previous run of
+            the job already wrote then resolve to their stored IDs without being sent again.
+
+        Examples
+        --------
+        >>> client = Client(r"http://qnxt_app_server.com", pool_maxsize=16)
+        >>> with ProcessLogWriter(client, header_factory, workers=16) as writer:
+        ...     for row in rows:
+        ...         detail = writer.add_detail(processlog_id, referenceid=row.id, message='stored')
+        ...         writer.add_state(detail, process_stage_id='COMPLETED')
+        >>> writer.stats()
+        ...
+        """
+        assert (workers > 0), "`workers` must be greater than 0"
+        assert (batch_size > 0), "`batch_size` must be greater than 0"
+        assert (max_pending >= batch_size), "`max_pending` must be at least `batch_size`"
+        self.client = as_client(app_server)
+        self.header_factory = header_factory
+        self.details = ProcessLogDetails(self.client, header_factory)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ordered = ordered
+        self.writes = writes
+
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self._started = None
+        self._buffer = []
+        # lane -> rows waiting behind the one in flight; a lane is in here for as long as one of its rows is in flight
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._slots = threading.Semaphore(max_pending)
+        self._closed = False
+        # lanes with rows to send. The workers are daemon threads of the writer's own rather than a ThreadPoolExecutor,
+        # which refuses new work once the interpreter starts exiting, so rows can still be sent when logging.shutdown
+        # flushes a ProcessLogHandler that was never closed
+        self._ready = queue.SimpleQueue()
+        self._workers = [threading.Thread(target=self._work, name=f"ProcessLogWriter-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name='ProcessLogWriter-flush', daemon=True)
+        self._flusher.start()
+
+    def __repr__(self):
+        return f"ProcessLogWriter(submitted={self.submitted}, sent={self.sent}, failed={self.failed})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_detail(self, processlog_id: str, key: str = None, **kwargs) -> Future:
+        """
+        Queue a process log detail record under the header `processlog_id`. Returns a future of its
+        processlogdetailid (see `DETAIL_ID`), which raises if the record could not be created.
+
+        Parameters
+        ----------
+        processlog_id: str, required
+            The identifier for the header record linked to this detail record
+        key: str, optional
+            The dedup key of the row, required if the rows are sent through `writes` with a journal (see
+            `JournaledWrites.write`)
+        kwargs:
+            Any other parameter of `ProcessLogDetails.create_process_logdetail`
+        """
+        lane = processlog_id if self.ordered else object()
+        return self._add('create_process_logdetail', dict(kwargs, processlog_id=processlog_id), key, lane)
+
+    def add_state(self, processlogdetail_id: Union[str, Future], key: str = None, **kwargs) -> Future:
+        """
+        Queue a process state record of a process log detail. Returns a future of its ID (see `STATE_ID`), which raises
+        if the record could not be created.
+
+        Parameters
+        ----------
+        processlogdetail_id: str or concurrent.futures.Future, required
+            The identifier for the detail record, or the future returned by `add_detail` for it. A state is always
+            created after a detail it was added under, and fails with the detail's error if the detail failed.
+        key: str, optional
+            The dedup key of the row, required if the rows are sent through `writes` with a journal (see
+            `JournaledWrites.write`)
+        kwargs:
+            Any other parameter of `ProcessLogDetails.create_process_state`
+        """
+        if isinstance(processlogdetail_id, _WriteFuture):
+            lane = processlogdetail_id.lane
+        else:
+            lane = processlogdetail_id if self.ordered else object()
+        return self._add('create_process_state', dict(kwargs, processlogdetail_id=processlogdetail_id), key, lane)
+
+    def _add(self, operation: str, kwargs: dict, key: Union[str, None], lane: Hashable) -> Future:
+        if key is None and self.writes is not None and self.writes.journal is not None:
+            raise ValueError(f"{operation} needs a `key` to be journaled, e.g. the ID of the transaction it records")
+        self._slots.acquire()
+        future = _WriteFuture(lane)
+        with self._lock:
+            if self._closed:
+                self._slots.release()
+                raise RuntimeError("cannot add rows to a closed ProcessLogWriter")
+            if self._started is None:
+                self._started = time.perf_counter()
+            self._buffer.append(_Row(operation, kwargs, key, future))
+            self.submitted += 1
+            if len(self._buffer) >= self.batch_size:
+                self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """Hand the buffered rows to their lanes, starting a worker for every lane that is idle. Call with the lock
+        held."""
+        if not self._buffer:
+            return
+        self.batches += 1
+        for row in self._buffer:
+            waiting = self._lanes.get(row.future.lane)
+            if waiting is None:
+                self._lanes[row.future.lane] = deque([row])
+                self._ready.put(row.future.lane)
+            else:
+                waiting.append(row)
+        self._buffer = []
+
+    def _work(self):
+        while True:
+            lane = self._ready.get()
+            if lane is _STOP:
+                return
+            self._drain(lane)
+
+    def _drain(self, lane: Hashable):
+        """Send the rows of `lane` one after another until there are none left"""
+        while True:
+            with self._lock:
+                waiting = self._lanes[lane]
+                if not waiting:
+                    del self._lanes[lane]
+                    return
+                row = waiting.popleft()
+            self._send(row)
+
+    def _send(self, row: _Row):
+        failed = False
+        try:
+            if not row.future.set_running_or_notify_cancel():
+                return
+            kwargs = row.kwargs
+            if isinstance(kwargs.get('processlogdetail_id'), Future):
+                kwargs = dict(kwargs, processlogdetail_id=kwargs['processlogdetail_id'].result())
+            if self.writes is not None:
+                row.future.set_result(self.writes.write(row.operation, key=row.key, **kwargs))
+            else:
+                response = getattr(self.details, row.operation)(**kwargs)
+                field = self.DETAIL_ID if row.operation == 'create_process_logdetail' else self.STATE_ID
+                row.future.set_result(_created_id(response, field))
+        except Exception as e:
+            failed = True
+            row.future.set_exception(e)
+        finally:
+            with self._lock:
+                self.sent += 1
+                self.failed += failed
+                self._done.notify_all()
+            self._slots.release()
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                self._dispatch()
+
+    def flush(self):
+        """Send every buffered row and wait until all of them have been created or have failed"""
+        with self._lock:
+            self._dispatch()
+            self._done.wait_for(lambda: self.sent == self.submitted)
+
+    def close(self):
+        """Flush, then stop the flush thread and the workers. No rows can be added afterwards."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self.flush()
+        self._stop.set()
+        self._flusher.join()
+        for _ in self._workers:
+            self._ready.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self) -> dict:
+        """Returns the number of rows added, sent (created or failed) and failed, the number of flushes and the
+        throughput in rows sent per second since the first row was added"""
+        with self._lock:
+            elapsed = time.perf_counter() - self._started if self._started is not None else 0.0
+            return {'submitted': self.submitted,
+                    'sent': self.sent,
+                    'failed': self.failed,
+                    'pending': self.submitted - self.sent,
+                    'batches': self.batches,
+                    'elapsed': elapsed,
+                    'rows_per_second': self.sent / elapsed if elapsed else 0.0}
+
+
+class ProcessLogHandler(logging.Handler):
+    """A `logging.Handler` that ships log records to QNXT as process log details, each with a process state, under one
+    process log header. Records are queued and sent in batches by a background thread, so logging never waits on
+    QNXT. Records are sent concurrently; each one carries the time it was logged as its state's start date. A handler
+    that is never closed is flushed by `logging.shutdown` when the interpreter exits."""
+    ON_FULL = ('block', 'drop', 'sample')
+    # records from these threads are the handler's own requests being logged, and are never shipped
+    _OWN_THREADS = ('ProcessLogHandler', 'ProcessLogWriter')
+
+    def __init__(self,
+                 app_server: Union[str, Client],
+                 header_factory: RequestHeader,
+                 processlog_id: str = None,
+                 processlogtype_id: str = None,
+                 level: int = logging.NOTSET,
+                 queue_size: int = 10000,
+                 on_full: str = 'block',
+                 sample_every: int = 10,
+                 batch_size: int = 100,
+                 flush_interval: float = 1.0,
+                 workers: int = 4,
+                 ):
+        """
+        Parameters
+        ----------
+        app_server: str or qnxt.client.Client, optional
+            This is the FQDN of the target QNXT app server, or a Client whose pooled session should be used
+        header_factory: qnxt.authentication.RequestHeader, required
+            This is a callable that generates the appropriate authentication headers for QNXT API requests
+        processlog_id: str, optional
+            The header the records are logged under. If it is not given, a header of `processlogtype_id` is created by
+            the background thread before the first batch is sent; see `processlog_id`.
+        processlogtype_id: str, optional
+            The process log type of the records, and of the header created if `processlog_id` is not given
+        level: int, optional, default logging.NOTSET
+            The level of the handler
+        queue_size: int, optional, default 10000
+            The number of records queued at a time
+        on_full: str, optional, default 'block'
+            What `emit` does with a record when the queue is full:
+            'block' waits for room,
+            'drop' drops the record,
+            'sample' waits for room for records of level ERROR and above and for one in every `sample_every` other
+            records, and drops the rest.
+            Dropped records are counted in `dropped`.
+        sample_every: int, optional, default 10
+            See `on_full`
+        batch_size: int, optional, default 100
+            The largest number of records taken off the queue and handed to the writer at a time
+        flush_interval: float, optional, default 1.0
+            The longest time, in seconds, a record waits before being sent
+        workers: int, optional, default 4
+            The number of requests to QNXT in flight at a time (see `ProcessLogWriter`)
+
+        Examples
+        --------
+        >>> handler = ProcessLogHandler(client, header_factory, processlogtype_id='MYJOB', on_full='sample')
+        >>> logging.getLogger('myjob').addHandler(handler)
+        ...
+        >>> handler.close()
+        >>> handler.stats()
+        ...
+        """
+        assert (on_full in self.ON_FULL), f"`on_full` must be one of {self.ON_FULL}"
+        assert (processlog_id is not None or processlogtype_id is not None), \
+            "either `processlog_id` or `processlogtype_id` is required"
+        super().__init__(level)
+        self.client = as_client(app_server)
+        self.header_factory = header_factory
+        self.headers = ProcessLogHeaders(self.client, header_factory)
+        self.writer = ProcessLogWriter(self.client, header_factory, workers=workers, batch_size=batch_size,
+                                       flush_interval=flush_interval, max_pending=max(batch_size, 2 * queue_size),
+                                       ordered=False)
+        self.processlog_id = processlog_id
+        self.processlogtype_id = processlogtype_id
+        self.on_full = on_full
+        self.sample_every = sample_every
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.emitted = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_error = None
+        self._overflow = 0
+        self._counter_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._closed = False
+        self._shipper = threading.Thread(target=self._ship, name='ProcessLogHandler', daemon=True)
+        self._shipper.start()
+
+    def __repr__(self):
+        return f"<ProcessLogHandler (emitted={self.emitted}, dropped={self.dropped}, failed={self.failed})>"
+
+    def fields(self, record: logging.LogRecord) -> Tuple[dict, dict]:
+        """
+        Returns the parameters of the process log detail (see `ProcessLogDetails.create_process_logdetail`) and of its
+        process state (see `ProcessLogDetails.create_process_state`) for a formatted `record`. Override this to map
+        records differently.
+        """
+        detail = {'processlogtype_id': self.processlogtype_id,
+                  'externalid': record.name,
+                  'message': record.msg}
+        state = {'process_stage_id': 'ERROR' if record.levelno >= logging.ERROR else 'COMPLETED',
+                 'start_date': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                 'status': record.levelname,
+                 'message': record.msg,
+                 'failure_count': 1 if record.levelno >= logging.WARNING else 0}
+        return detail, state
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Returns a copy of `record` with its message formatted, so that it no longer refers to the caller's
+        arguments or traceback"""
+        record = copy.copy(record)
+        record.msg = self.format(record)
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # emit is thread-safe on its own. Not taking the handler lock around it means a caller waiting for room in the
+        # queue never holds up other threads, including the ones emptying the queue.
+        if record.threadName.startswith(self._OWN_THREADS):
+            return False
+        rv = self.filter(record)
+        if rv:
+            self.emit(rv if isinstance(rv, logging.LogRecord) else record)
+        return bool(rv)
+
+    def emit(self, record: logging.LogRecord):
+        if self._closed:
+            self._failed(1, RuntimeError("the ProcessLogHandler was closed before the record was emitted"))
+            return
+        try:
+            record = self.prepare(record)
+            if self.on_full == 'block' or self._stop.is_set():
+                self._queue.put(record)
+            else:
+                try:
+                    self._queue.put_nowait(record)
+                except queue.Full:
+                    if not self._keep(record):
+                        with self._counter_lock:
+                            self.dropped += 1
+                        return
+                    self._queue.put(record)
+            with self._counter_lock:
+                self.emitted += 1
+        except Exception:
+            self.handleError(record)
+
+    def _keep(self, record: logging.LogRecord) -> bool:
+        """Returns True if `record`, which found the queue full, should wait for room rather than be dropped"""
+        if self.on_full == 'drop':
+            return False
+        if record.levelno >= logging.ERROR:
+            return True
+        with self._counter_lock:
+            self._overflow += 1
+            return self._overflow % self.sample_every == 0
+
+    def _ship(self):
+        stopping = False
+        while True:
+            batch = []
+            taken = 0
+            try:
+                # once stopped, the queue is emptied without waiting for more
+                record = self._queue.get_nowait() if stopping else self._queue.get(timeout=self.flush_interval)
+                while True:
+                    taken += 1
+                    if record is _STOP:
+                        stopping = True
+                    else:
+                        batch.append(record)
+                    if len(batch) >= self.batch_size:
+                        break
+                    record = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            if batch:
+                self._send(batch)
+            for _ in range(taken):
+                self._queue.task_done()
+            if stopping and not taken:
+                return
+
+    def _send(self, batch: list):
+        try:
+            processlog_id = self._header()
+        except Exception as e:
+            self._failed(len(batch), e)
+            return
+        for record in batch:
+            try:
+                detail_fields, state_fields = self.fields(record)
+                detail = self.writer.add_detail(processlog_id, **detail_fields)
+                state = self.writer.add_state(detail, **state_fields)
+            except Exception as e:
+                self._failed(1, e)
+                continue
+            # the state fails with its detail, so watching the state counts each record once
+            state.add_done_callback(self._done)
+
+    def _header(self) -> str:
+        """Returns `processlog_id`, creating the header first if there is none yet"""
+        if self.processlog_id is None:
+            response = self.headers.create_process_log_header(self.processlogtype_id)
+            self.processlog_id = _created_id(response, 'processLogId')
+        return self.processlog_id
+
+    def _done(self, future: Future):
+        if future.exception() is not None:
+            self._failed(1, future.exception())
+
+    def _failed(self, count: int, error: Exception):
+        with self._counter_lock:
+            self.failed += count
+            self.last_error = error
+
+    def flush(self):
+        """Wait until every queued record has been sent to QNXT or has failed"""
+        self._queue.join()
+        self.writer.flush()
+
+    def close(self):
+        """Send every queued record, then stop the background threads. Records emitted afterwards are counted as
+        failed."""
+        if not self._stop.is_set():
+            self._stop.set()
+            # wakes the shipper straight away rather than after up to `flush_interval`
+            self._queue.put(_STOP)
+            self._shipper.join()
+            self._closed = True
+            # records emitted while the shipper was stopping
+            lost = 0
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._queue.task_done()
+                lost += 1
+            if lost:
+                self._failed(lost, RuntimeError("the ProcessLogHandler was closed before the records were shipped"))
+            self.writer.close()
+        super().close()
+
+    def stats(self) -> dict:
+        """Returns the number of records emitted, dropped because the queue was full, still queued and failed to ship"""
+        with self._counter_lock:
+            return {'emitted': self.emitted,
+                    'dropped': self.dropped,
+                    'queued': self._queue.qsize(),
+                    'failed': self.failed}
@@ -0,0 +1,157 @@
+"""Compact, typed records for the result types that are held in bulk: calls, call issues, application logs, process
+log details and appeal and grievance incidents. Each record keeps its fields in `__slots__` instead of a per-record
+dict, and the values of low-cardinality fields such as `level`, `source`, `machineName` and `status` are interned so
+that every record shares one copy of each distinct string. Fields the class does not declare (e.g. objects added by
+`expand`) are kept in `extra`, so converting a record back with `to_dict` loses nothing.
+
+Attributes are named after the JSON fields. Records are converted straight from the parsed JSON, and any of these
+classes can be passed as `model` to `qnxt.utils.paginate.paginate`, to the `iter_*` methods of the API classes or to
+`Response.records`. Records compare equal when all their fields and `extra` are equal, and hash on their declared
+fields, so they can be put in sets and used as dict keys as long as those fields hold hashable values.
+
+Examples
+--------
+>>> logs = PlanIntegration.ApplicationLogs(client, header_factory)
+>>> errors = list(logs.iter_search(level='Error', page_size=1000, model=Records.ApplicationLog))
+>>> errors[0].machineName
+"""
+
+import sys
+
+
+class Record:
+    """
+    Base class of the compact records. Subclasses list their JSON fields in `__slots__` and the fields whose values are
+    interned in `INTERN`.
+    """
+    __slots__ = ('extra',)
+    INTERN = ()
+    FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = tuple(name for klass in reversed(cls.__mro__) for name in klass.__dict__.get('__slots__', ())
+                           if name != 'extra')
+        cls._known = frozenset(cls.FIELDS)
+        # (field, whether its value is interned), so `__init__` does one lookup per field
+        cls._fields = tuple((name, name in cls.INTERN) for name in cls.FIELDS)
+
+    def __init__(self, data: dict):
+        """
+        Parameters
+        ----------
+        data: dict, required
+            One parsed JSON record, e.g. an item of `Response.results`
+
+        Raises
+        ------
+        ValueError
+            `data` is not empty but has none of the fields of this class, e.g. because the wrong class was passed as
+            `model` for the endpoint
+        """
+        if not self.FIELDS:
+            raise TypeError("Record is a base class, use one of its subclasses")
+        get = data.get
+        for name, interned in self._fields:
+            value = get(name)
+            if interned and value.__class__ is str:
+                value = sys.intern(value)
+            setattr(self, name, value)
+        known = self._known
+        if known.issuperset(data):
+            self.extra = None
+        elif data and known.isdisjoint(data):
+            raise ValueError(f"None of the fields of {type(self).__name__} are in the record, which has "
+                             f"{', '.join(sorted(data)[:10])}; is this the right model for the endpoint?")
+        else:
+            self.extra = {k: v for k, v in data.items() if k not in known}
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS if getattr(self, name) is not None)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.FIELDS) and self.extra == other.extra
+
+    def __hash__(self):
+        """Hashes the declared fields only, since `extra` is a dict; raises TypeError if one of them holds a list or
+        dict, like a tuple would"""
+        return hash((type(self), *(getattr(self, name) for name in self.FIELDS)))
+
+    def __getitem__(self, key: str):
+        """Lets code written against the plain dicts (e.g. `record['referenceId']`) keep working"""
+        if key in self._known:
+            return getattr(self, key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self, drop_none: bool = True) -> dict:
+        """
+        Returns the record as a plain dict
+
+        Parameters
+        ----------
+        drop_none: bool, optional, default True
+            If True, fields that are None are left out, as they usually were not in the JSON either
+        """
+        d = {name: getattr(self, name) for name in self.FIELDS}
+        if drop_none:
+            d = {k: v for k, v in d.items() if v is not None}
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    @classmethod
+    def from_results(cls, records) -> list:
+        """Returns a list of records converted from an iterable of parsed JSON records"""
+        return list(map(cls, records))
+
+
+class Call(Record):
+    """A call from `CallTracking.CallResource.search_call_details`"""
+    __slots__ = ('callerId', 'callId', 'callDate', 'memId', 'provId', 'eligibleOrgId', 'managerId', 'userId',
+                 'status', 'callSourceId', 'submitMethod', 'callerType', 'callerName', 'phone', 'description',
+                 'createDate', 'lastUpdate', 'updateId', 'entityState')
+    INTERN = ('status', 'callSourceId', 'submitMethod', 'callerType', 'userId', 'managerId', 'updateId', 'entityState')
+
+
+class CallIssue(Record):
+    """A call issue from `CallTracking.CallResource.search_call_issues`"""
+    __slots__ = ('callerId', 'callId', 'issueId', 'callDate', 'memId', 'provId', 'eligibleOrgId', 'claimId',
+                 'referralId', 'assignedToUserId', 'status', 'issueType', 'category', 'callSourceId', 'submitMethod',
+                 'description', 'resolution', 'createDate', 'lastUpdate', 'updateId', 'entityState')
+    INTERN = ('status', 'issueType', 'category', 'callSourceId', 'submitMethod', 'assignedToUserId', 'updateId',
+              'entityState')
+
+
+class ApplicationLog(Record):
+    """An application log from `PlanIntegration.ApplicationLogs.search`"""
+    __slots__ = ('referenceId', 'timeStamp', 'level', 'source', 'sourceCategory', 'userName', 'loginId',
+                 'machineName', 'message', 'exception', 'entityState')
+    INTERN = ('level', 'source', 'sourceCategory', 'userName', 'loginId', 'machineName', 'entityState')
+
+
+class ProcessLogDetail(Record):
+    """A process log detail from `PlanIntegration.ProcessLogDetails.search`"""
+    __slots__ = ('processLogDetailId', 'processLogId', 'processLogTypeId', 'processStageId', 'xmlSchemaId',
+                 'referenceId', 'externalId', 'errorId', 'message', 'amount', 'totalCount', 'failureCount',
+                 'startDate', 'stopDate', 'status', 'appServer', 'entityState')
+    INTERN = ('processLogTypeId', 'processStageId', 'xmlSchemaId', 'errorId', 'status', 'appServer', 'entityState')
+
+
+class Incident(Record):
+    """An appeal or grievance incident from `AppealAndGrievance.Search`"""
+    __slots__ = ('incidentId', 'detailId', 'detailType', 'status', 'memId', 'provId', 'claimId', 'category',
+                 'priority', 'receivedDate', 'dueDate', 'closedDate', 'assignedToUserId', 'description',
+                 'createDate', 'lastUpdate', 'updateId', 'entityState')
+    INTERN = ('detailType', 'status', 'category', 'priority', 'assignedToUserId', 'updateId', 'entityState')
+
@@ -1,17 +1,77 @@
+import codecs
 import json
 import logging
+import re
+from typing import Callable, Iterator
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# parses a response body from raw bytes; orjson when it is installed, else the standard library
+_loads = orjson.loads if orjson is not None else json.loads
+_UNPARSED = object()
+
+
+class _Unparsable:
+    """Kept by a lean `Response` in place of a body that could not be parsed; `error` is raised when it is accessed"""
+    __slots__ = ('error',)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def set_json_backend(loads: Callable = None):
+    """
+    Set the function every `Response` uses to parse its body, e.g. `ujson.loads`. It is passed the raw body as bytes.
+    Pass None to go back to the default, orjson if it is installed and the standard library otherwise.
+    """
+    global _loads
+    if loads is None:
+        loads = orjson.loads if orjson is not None else json.loads
+    _loads = loads
+
+
+class LeanHTTPResponse:
+    """What a lean `Response` keeps of its HTTP response once the body has been parsed: the status, the headers
+    listed in `KEY_HEADERS` and the timing, but not the body or its decoded text"""
+    __slots__ = ('status_code', 'reason', 'url', 'headers', 'elapsed')
+    KEY_HEADERS = ('Cache-Control', 'Content-Type', 'Date', 'ETag', 'Last-Modified', 'Retry-After')
 
-class Response:
     def __init__(self, http_response):
+        self.status_code = http_response.status_code
+        self.reason = getattr(http_response, 'reason', None) or getattr(http_response, 'reason_phrase', None)
+        self.url = str(http_response.url)
+        self.headers = {k: http_response.headers[k] for k in self.KEY_HEADERS if k in http_response.headers}
+        self.elapsed = http_response.elapsed
+
+    def __repr__(self):
+        return f"<LeanHTTPResponse [{self.status_code}]>"
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+
+class Response:
+    __slots__ = ('http_response', '_parsed')
+
+    def __init__(self, http_response, lean: bool = False):
         """
         Pass an `http_response` to get methods for quickly inspecting its contents and provide support for pretty
-        printing.
+        printing. The body is only parsed, straight from its raw bytes, the first time `json`, `results`, `metadata`
+        or `overview` is accessed; checking `status_code` alone never parses it.
 
         Parameters
         ----------
         http_response: requests.models.Response
             An HTTP response object returned by the requests module
+        lean: bool, optional, default False
+            If True, the body is parsed straight away and `http_response` is replaced with a `LeanHTTPResponse`, which
+            keeps only the status, key headers and timing. This releases the raw body and any decoded text, for
+            callers that hold on to many responses at once. A body that cannot be parsed, such as the empty body of a
+            204 or an HTML error page, does not raise here; the parse error is raised when the body is accessed.
 
         Examples
         --------
@@ -23,7 +83,13 @@ class Response:
         ...
         """
         self.http_response = http_response
-        self._json = json.loads(self.http_response.text)
+        self._parsed = _UNPARSED
+        if lean:
+            try:
+                self._parsed = _loads(http_response.content)
+            except Exception as e:
+                self._parsed = _Unparsable(e)
+            self.http_response = LeanHTTPResponse(http_response)
 
     def __str__(self):
         pretty = json.dumps(self._json, indent=4, sort_keys=True)
@@ -32,6 +98,19 @@ class Response:
     def __repr__(self):
         return self.__str__()
 
+    @property
+    def _json(self):
+        if self._parsed is _UNPARSED:
+            self._parsed = _loads(self.http_response.content)
+        elif type(self._parsed) is _Unparsable:
+            raise self._parsed.error
+        return self._parsed
+
+    @property
+    def status_code(self) -> int:
+        """Returns the HTTP status code of the `http_response`"""
+        return self.http_response.status_code
+
     @property
     def metadata(self) -> dict:
         """Returns a dictionary of the metadata section of the `http_response`"""
@@ -114,6 +193,32 @@ class Response:
         print(pretty)
         return __results
 
+    def records(self, model: Callable) -> list:
+        """
+        Returns the 'results' converted with `model`, e.g. one of the compact `qnxt.api.Records` classes
+
+        Parameters
+        ----------
+        model: callable, required
+            Called with each parsed record
+        """
+        return list(map(model, self.results or ()))
+
+    def to_arrow(self, **kwargs):
+        """Returns the 'results' as a pyarrow.Table, see `qnxt.utils.columnar.to_arrow`"""
+        from qnxt.utils import columnar
+        return columnar.to_arrow(self, **kwargs)
+
+    def to_pandas(self, **kwargs):
+        """Returns the 'results' as a pandas.DataFrame, see `qnxt.utils.columnar.to_pandas`"""
+        from qnxt.utils import columnar
+        return columnar.to_pandas(self, **kwargs)
+
+    def to_numpy(self, **kwargs):
+        """Returns the 'results' as a NumPy structured array, see `qnxt.utils.columnar.to_numpy`"""
+        from qnxt.utils import columnar
+        return columnar.to_numpy(self, **kwargs)
+
     def top(self, n):
         """Alias of head"""
         return self.head(n)
@@ -121,3 +226,261 @@ class Response:
     def bottom(self, n):
         """Alias of tail"""
         return self.tail(n)
+
+
+class _StreamParser:
+    """Incrementally parses a top-level JSON object from an iterator of byte chunks, yielding each element of its
+    'results' array separately so that only one record (plus one chunk) is ever held in memory"""
+    FIELD, RECORD = 0, 1
+    _decoder = json.JSONDecoder()
+    # what the scan for the end of a value stops at: outside strings, in a string and after a number or literal
+    _SYNTAX = re.compile(r'["{}\[\]]')
+    _STRING = re.compile(r'["\\]')
+    _SCALAR_END = re.compile(r'[\s,:\]}]')
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        # how far the value at `_pos` has been scanned, its nesting depth there and whether that is inside a string
+        self._scan = None
+        self._depth = 0
+        self._in_string = False
+
+    def _more(self) -> bool:
+        """Read the next chunk into the buffer, dropping what has already been parsed. Returns False at the end"""
+        if self._eof:
+            return False
+        text = ''
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                break
+        else:
+            text = self._utf8.decode(b'', final=True)
+            self._eof = True
+        if self._scan is not None:
+            self._scan -= self._pos
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Returns the next non-whitespace character without consuming it"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                raise ValueError('Unexpected end of JSON response')
+
+    def _next(self) -> str:
+        char = self._peek()
+        self._pos += 1
+        return char
+
+    def _end(self):
+        """Returns the offset just past the end of the value at `_pos`, or None if the buffer ends before it does. The
+        scan carries on from where the last call stopped, so every character of a value is only looked at once"""
+        buf = self._buf
+        if self._scan is None:
+            self._scan, self._depth, self._in_string = self._pos, 0, False
+        i = self._scan
+        if buf[self._pos] not in '{["':
+            # a number or literal ends at the first delimiter, or at the end of the body
+            match = self._SCALAR_END.search(buf, i)
+            if match is not None or self._eof:
+                self._scan = None
+                return match.start() if match is not None else len(buf)
+            self._scan = len(buf)
+            return None
+        while True:
+            if self._in_string:
+                match = self._STRING.search(buf, i)
+                if match is None:
+                    i = len(buf)
+                    break
+                i = match.start()
+                if buf[i] == '\\':
+                    if i + 1 >= len(buf):
+                        # the escaped character is in the next chunk
+                        break
+                    i += 2
+                    continue
+                self._in_string = False
+                i += 1
+            else:
+                match = self._SYNTAX.search(buf, i)
+                if match is None:
+                    i = len(buf)
+                    break
+                i = match.end()
+                char = match.group()
+                if char == '"':
+                    self._in_string = True
+                    continue
+                self._depth += 1 if char in '{[' else -1
+            if self._depth == 0:
+                self._scan = None
+                return i
+        self._scan = i
+        return None
+
+    def _value(self):
+        """Decodes the next complete JSON value, reading more of the body until its end has been found"""
+        self._peek()
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+            # a number or literal that runs to the end of the buffer may continue in the next chunk
+            if end < len(self._buf) or self._eof:
+                self._pos = end
+                return value
+        except json.JSONDecodeError:
+            if self._eof:
+                raise
+        # the value runs on into the next chunks: find its end first, looking at each chunk once, and only then decode
+        # it again, instead of decoding the whole value over again as every chunk arrives
+        end = self._end()
+        while end is None:
+            if not self._more():
+                raise ValueError('Unexpected end of JSON response')
+            end = self._end()
+        value, self._pos = self._decoder.raw_decode(self._buf, self._pos)
+        return value
+
+    def events(self) -> Iterator[tuple]:
+        """Yields (FIELD, (key, value)) for every top-level member other than 'results' and (RECORD, record) for each
+        element of the 'results' array, in document order"""
+        if self._next() != '{':
+            raise ValueError('Expected a JSON object')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._value()
+            if self._next() != ':':
+                raise ValueError('Expected ":" in JSON object')
+            if key == 'results' and self._peek() == '[':
+                self._pos += 1
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self.RECORD, self._value()
+                        char = self._next()
+                        if char == ']':
+                            break
+                        if char != ',':
+                            raise ValueError('Expected "," or "]" in results array')
+            else:
+                yield self.FIELD, (key, self._value())
+            char = self._next()
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError('Expected "," or "}" in JSON object')
+
+
+class StreamingResponse:
+    def __init__(self, http_response, chunk_size: int = 65536):
+        """
+        Pass an `http_response` that was requested with `stream=True` to iterate over its 'results' one record at a
+        time while the body is still being downloaded and parsed, so even a very large search response is processed
+        in constant memory. The other top-level fields, including 'processMetadata', are captured as they go by.
+        Fields that come before the 'results' array in the body are available straight away; any that come after it
+        are available once the records have been consumed.
+
+        Parameters
+        ----------
+        http_response: requests.models.Response
+            An HTTP response object returned by the requests module with `stream=True`
+        chunk_size: int, optional, default 65536
+            The number of bytes read from the connection at a time
+
+        Examples
+        --------
+        >>> from qnxt.api import CallTracking
+        >>> calls = CallTracking.CallResource(client.streaming(), header_factory)
+        >>> response = calls.search_call_details(calldate_from='2020-01-01', take=1000000)
+        >>> for record in response:
+        ...     print(record['callerId'])
+        >>> response.metadata
+        ...
+        """
+        self.http_response = http_response
+        self._events = _StreamParser(http_response.iter_content(chunk_size)).events()
+        self._fields = {}
+        self._first = _UNPARSED
+        self._started = False
+        self._consumed = False
+
+    def __repr__(self):
+        return f"StreamingResponse(status_code={self.status_code}, overview={self._fields})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self) -> Iterator:
+        return self.results
+
+    def _read_fields(self):
+        """Read up to the first record, capturing the fields that precede it"""
+        if self._started:
+            return
+        self._started = True
+        for kind, value in self._events:
+            if kind == _StreamParser.RECORD:
+                self._first = value
+                return
+            self._fields[value[0]] = value[1]
+        self._consumed = True
+        self.close()
+
+    @property
+    def status_code(self) -> int:
+        """Returns the HTTP status code of the `http_response`"""
+        return self.http_response.status_code
+
+    @property
+    def results(self) -> Iterator:
+        """Returns an iterator over the records of the 'results' section. It can only be consumed once"""
+        self._read_fields()
+        if self._first is not _UNPARSED or not self._consumed:
+            first, self._first = self._first, _UNPARSED
+            if first is not _UNPARSED:
+                yield first
+            try:
+                for kind, value in self._events:
+                    if kind == _StreamParser.RECORD:
+                        yield value
+                    else:
+                        self._fields[value[0]] = value[1]
+            finally:
+                self._consumed = True
+                self.close()
+
+    def records(self, model: Callable) -> Iterator:
+        """Returns an iterator over the records of the 'results' section converted with `model`, e.g. one of the
+        compact `qnxt.api.Records` classes. It can only be consumed once"""
+        return map(model, self.results)
+
+    @property
+    def metadata(self) -> dict:
+        """Returns a dictionary of the metadata section, or None if it has not been read yet"""
+        self._read_fields()
+        return self._fields.get('processMetadata')
+
+    @property
+    def overview(self) -> dict:
+        """Returns a dictionary of the top-level fields read so far, other than 'results' and 'processMetadata'"""
+        self._read_fields()
+        return {k: v for k, v in self._fields.items() if k != 'processMetadata'}
+
+    def close(self):
+        """Release the connection back to the pool"""
+        self.http_response.close()
@@ -1 +1 @@
-__all__ = ['AppealAndGrievance', 'Benefit', 'CallTracking', 'Member', 'PlanIntegration', 'Response']
+__all__ = ['AppealAndGrievance', 'Benefit', 'CallTracking', 'Member', 'PlanIntegration', 'Records', 'Response']
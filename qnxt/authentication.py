@@ -1,22 +1,101 @@
+import os
 import json
+import asyncio
 import time
+import random
+import hashlib
 import logging
 import datetime
+import tempfile
+import threading
 import requests
 from requests.auth import HTTPBasicAuth
 from requests_ntlm import HttpNtlmAuth
 from typing import Union
 
+from qnxt.utils.filelock import O_NOFOLLOW, FileLock, private_directory
+from qnxt.utils.timing import TimedHTTPAdapter, measure
+
+
+class TokenCache:
+    def __init__(self, directory: str = None):
+        """
+        A file-backed token cache that lets every process on a host share one STS token per (fqdn, envid, username)
+        until it is due for a refresh. Reads and refreshes happen under a per-key file lock, files are written with
+        an atomic replace, and both the directory and the token files are only readable by the current user.
+
+        Parameters
+        ----------
+        directory: str, optional, default <system temp dir>/qnxt-tokens-<uid>
+            The directory the token files are kept in. It is created if it does not exist. An existing directory must
+            belong to the current user and not be accessible to anyone else, otherwise PermissionError is raised.
+
+        Examples
+        --------
+        >>> cache = TokenCache()
+        >>> header_factory = RequestHeader(r"http://qnxt_sts_server.com", '1', auth_obj, token_cache=cache)
+        ...
+        """
+        self.directory = private_directory(directory, 'qnxt-tokens')
+
+    def __repr__(self):
+        return f"TokenCache(directory={self.directory})"
+
+    @staticmethod
+    def key(fqdn: str, envid: str, username: str) -> str:
+        """Returns the file-safe cache key for a (fqdn, envid, username) triple"""
+        return hashlib.sha256(f"{fqdn}|{envid}|{username}".encode('utf-8')).hexdigest()
+
+    def lock(self, key: str) -> FileLock:
+        """Returns the cross-process lock guarding `key`"""
+        return FileLock(os.path.join(self.directory, f"{key}.lock"))
+
+    def load(self, key: str, thresh: int = 0) -> Union[dict, None]:
+        """Returns the cached token for `key`, or None if there is none or it expires within `thresh` seconds"""
+        try:
+            fd = os.open(os.path.join(self.directory, f"{key}.json"), os.O_RDONLY | O_NOFOLLOW)
+            with os.fdopen(fd, 'r') as f:
+                token = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if token.get('expires_at', 0) - thresh <= time.time():
+            return None
+        return token
+
+    def store(self, key: str, token: dict):
+        """Atomically replace the cached token for `key`"""
+        # mkstemp creates the file with 0600 permissions in the same directory, so os.replace is atomic
+        fd, tmp = tempfile.mkstemp(prefix=f"{key}.", suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(token, f)
+            os.replace(tmp, os.path.join(self.directory, f"{key}.json"))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
 
 class RequestHeader:
     ENDPOINT = r'/QnxtSTS'
 
-    def __init__(self, fqdn: str, envid: Union[str, int], auth: Union[HTTPBasicAuth, HttpNtlmAuth], thresh: int = 300):
+    def __init__(self,
+                 fqdn: str,
+                 envid: Union[str, int],
+                 auth: Union[HTTPBasicAuth, HttpNtlmAuth],
+                 thresh: int = 300,
+                 background_refresh: bool = False,
+                 token_cache: TokenCache = None,
+                 timeout: Union[float, tuple] = (10, 30),
+                 ):
         """
         A 'header factory' that can be passed to the API classes to allow for the retrieval of tokens that are always
         valid and not expired. RequestHeader requests an access token from the STS endpoint, calculates the expiry
         minus the `thresh` and ensures that a valid token is always ready when it is called.
 
+        Tokens are fetched through a persistent session, so an NTLM-authenticated connection to the STS server is
+        kept alive and reused across refreshes. The connect, handshake and total time of the most recent fetch are
+        available in `last_sts_timing`.
+
         Parameters
         ----------
         fqdn: str
@@ -27,7 +106,20 @@ class RequestHeader:
             The authentication object to use. Can either be a basic HTTP Auth object or a Windows auth object.
         thresh: int, optional, default 300
             `thresh` seconds will be subtracted from the expiry time of the token (3600 seconds). This is used to
-            calculate when the RequestHeader class will attempt to retrieve a new token.
+            calculate when the RequestHeader class will attempt to retrieve a new token. Refreshes are single-flight:
+            while one thread is fetching a new token, other threads keep using the old one for as long as it is still
+            inside the `thresh` window, and only wait on the fetch once it has actually expired.
+        background_refresh: bool, optional, default False
+            If True, a token is fetched immediately and a daemon thread renews it ahead of `refreshes_on` (see
+            `start_background_refresh`), so calling the class only returns a prebuilt header dict and never waits on
+            the STS server.
+        token_cache: qnxt.authentication.TokenCache, optional
+            If given, tokens are shared through this on-disk cache with every other process on the host that uses the
+            same STS server, environment and user, and the STS is only asked for a new one when the cached token is
+            within `thresh` seconds of expiring.
+        timeout: float or tuple, optional, default (10, 30)
+            The (connect, read) timeout, in seconds, of a token request to the STS server, so that neither a caller nor
+            the background renewal thread can hang on an unresponsive STS server.
 
         Examples
         --------
@@ -40,6 +132,7 @@ class RequestHeader:
         ...
         """
         self.thresh = thresh
+        self.timeout = timeout
         self.auth = auth
         self.envid = str(envid)
 
@@ -53,15 +146,36 @@ class RequestHeader:
                         "x-TZ-EnvId": envid
                         }
 
-        # these will be updated by get_token and update_token respectively
+        # these are published by _refresh, `expiry` last
         self.expiry = 0
         self.token = None
+        self._lock = threading.Lock()
+        self._auth_headers = None
+        self._renewer = None
+        self._stop_renewer = threading.Event()
+
+        self.session = requests.Session()
+        self.session.mount('http://', TimedHTTPAdapter(pool_maxsize=1))
+        self.session.mount('https://', TimedHTTPAdapter(pool_maxsize=1))
+        self.last_sts_timing = None
+
+        self.token_cache = token_cache
+        self._cache_key = TokenCache.key(self.fqdn, self.envid, getattr(self.auth, 'username', ''))
+
+        if background_refresh:
+            self.start_background_refresh()
 
     def __call__(self):
         """Call the class to return valid request headers"""
         self.update_token()
-        auth_header = {"Authorization": f"{self.token['token_type']} {self.token['access_token']}"}
-        return {**self.headers, **auth_header}
+        return dict(self._auth_headers)
+
+    async def acall(self):
+        """Awaitable version of calling the class, used by `qnxt.aio.AsyncClient`. A token fetch, when one is due,
+        runs in the default executor so the event loop is never blocked on the STS server"""
+        if time.time() >= self.expiry:
+            await asyncio.get_running_loop().run_in_executor(None, self.update_token)
+        return dict(self._auth_headers)
 
     def __str__(self):
         self.__call__()
@@ -79,20 +193,120 @@ class RequestHeader:
     def __repr__(self):
         return f"RequestHeader(fqdn={self.fqdn}, envid={self.envid}, auth={type(self.auth)}, thresh={self.thresh})"
 
+    def close(self):
+        """Stop any background renewal and close the persistent STS session"""
+        self.stop_background_refresh()
+        self.session.close()
+
+    def start_background_refresh(self, jitter: float = 30, max_backoff: float = 60, min_delay: float = 5):
+        """
+        Fetch a token now and start a daemon thread that renews it `jitter` seconds (at random) ahead of
+        `refreshes_on`. Failed renewals are retried with exponential backoff, and the old token keeps being served
+        while it is still inside the `thresh` window.
+
+        Parameters
+        ----------
+        jitter: float, optional, default 30
+            The upper bound of the random number of seconds a renewal is moved ahead of `refreshes_on`, so that many
+            processes started together do not all hit the STS server at the same moment.
+        max_backoff: float, optional, default 60
+            The upper bound of the delay, in seconds, between retries of a failed renewal.
+        min_delay: float, optional, default 5
+            The shortest time, in seconds, between two renewals. It keeps the thread from spinning on the STS server
+            when tokens are issued with an `expires_in` no longer than `thresh`.
+        """
+        if self._renewer is not None and self._renewer.is_alive():
+            return
+        self.update_token()
+        self._stop_renewer.clear()
+        self._renewer = threading.Thread(target=self._renew, args=(jitter, max_backoff, min_delay),
+                                         name='RequestHeaderRenewer', daemon=True)
+        self._renewer.start()
+
+    def stop_background_refresh(self, timeout: float = 10):
+        """
+        Stop the renewal thread started by `start_background_refresh`
+
+        Parameters
+        ----------
+        timeout: float, optional, default 10
+            The number of seconds to wait for the thread to finish a renewal in progress. If it is still running after
+            that, it is left behind; it is a daemon thread and exits once its STS request times out.
+        """
+        self._stop_renewer.set()
+        if self._renewer is not None:
+            self._renewer.join(timeout)
+            if self._renewer.is_alive():
+                logging.warning(f"Background token renewal did not stop within {timeout} seconds")
+            self._renewer = None
+
+    def _renew(self, jitter: float, max_backoff: float, min_delay: float):
+        backoff = 1
+        while True:
+            remaining = self.expiry - time.time()
+            # never let the jitter eat more than half of a short-lived token, and never renew more often than
+            # `min_delay`, or the thread would spin on the STS
+            delay = max(remaining - random.uniform(0, jitter), remaining / 2, min_delay)
+            if self._stop_renewer.wait(delay):
+                return
+            try:
+                with self._lock:
+                    self._refresh(renew=True)
+                backoff = 1
+            except Exception as e:
+                logging.warning(f"Background token renewal failed, retrying in up to {backoff * 2} seconds: {e}")
+                if self._stop_renewer.wait(backoff + random.uniform(0, backoff)):
+                    return
+                backoff = min(backoff * 2, max_backoff)
+
     def update_token(self):
         """Check for expiry based on the thresh value given to the constructor; if expired, then update the token with
-        a new one"""
-        if time.time() >= self.expiry:
-            self.token = self.get_token()
-            self.token['refreshes_on'] = str(datetime.datetime.fromtimestamp(self.expiry))
+        a new one. Only one thread fetches a token per expiry, the others either keep the still-valid old token or wait
+        for the fetch to finish"""
+        if time.time() < self.expiry:
+            return
+        if self.token is not None and time.time() < self.expiry + self.thresh:
+            # the old token is still good, so never block on a refresh another thread is already doing
+            if not self._lock.acquire(blocking=False):
+                return
+        else:
+            self._lock.acquire()
+        try:
+            if time.time() >= self.expiry:
+                self._refresh()
+        finally:
+            self._lock.release()
+
+    def _refresh(self, renew: bool = False):
+        """Fetch a new token and prebuild the request headers for it; the caller must hold `_lock`"""
+        if self.token_cache is None:
+            token = self.get_token()
+        else:
+            with self.token_cache.lock(self._cache_key):
+                token = self.token_cache.load(self._cache_key, self.thresh)
+                # an early renewal only takes a cached token if another process has already renewed it
+                if token is None or (renew and self.token is not None
+                                     and token['expires_at'] <= self.token['expires_at']):
+                    token = self.get_token()
+                    self.token_cache.store(self._cache_key, token)
+        expiry = token['expires_at'] - self.thresh
+        token['refreshes_on'] = str(datetime.datetime.fromtimestamp(expiry))
+        auth_header = {"Authorization": f"{token['token_type']} {token['access_token']}"}
+        self._auth_headers = {**self.headers, **auth_header}
+        self.token = token
+        # other threads read the headers without the lock as soon as `expiry` says they are valid, so it goes last
+        self.expiry = expiry
 
     def get_token(self):
         """Make a request to the URI and return the access token"""
-        response = requests.get(self.uri, headers=self.headers, auth=self.auth)
-        logging.debug(f"{response.status_code}: {response.reason}")
+        with measure() as timing:
+            response = self.session.get(self.uri, headers=self.headers, auth=self.auth, timeout=self.timeout)
+        self.last_sts_timing = timing
+        logging.debug(f"{response.status_code}: {response.reason} (connect {timing['connect']:.3f}s, "
+                      f"handshake {timing['handshake']:.3f}s, total {timing['total']:.3f}s)")
         _json = json.loads(response.text)
         if response.ok:
-            self.expiry = (time.time() + _json['expires_in']) - self.thresh
+            _json['expires_at'] = time.time() + _json['expires_in']
             return _json
         raise requests.HTTPError(_json['error_description'])
 
@@ -0,0 +1,475 @@
+"""Response caching for reference data that rarely changes, such as benefit and plan configuration. A `ResponseCache`
+is passed to a `qnxt.client.Client`; GET requests to endpoints that have a TTL are answered from the cache while the
+stored response is fresh, and only sent to the app server once it has expired. Each hit returns a new `Response`
+over the cached body, parsed lazily like any other.
+
+A stale response that came with an `ETag` or `Last-Modified` header is not dropped but revalidated: the request is
+sent with `If-None-Match`/`If-Modified-Since`, and if the app server answers 304 Not Modified the stored response is
+returned (and is fresh again for its TTL) without the body being downloaded or serialized again. An endpoint with a
+TTL of 0 is revalidated on every request.
+
+The entries are kept by a store. `MemoryStore` keeps them in process, bounded by a number of entries and a number of
+bytes, and evicts the least recently used ones first. `SQLiteStore` keeps them on disk, compressed, so a restarted
+job starts warm and several processes can share one cache. Any object with the same `get`, `set`, `delete` and
+`clear` methods can be used instead.
+
+Examples
+--------
+>>> from qnxt.api import Benefit
+>>> cache = ResponseCache(ttls={'QNXTApi/Benefit/benefits/*': 3600, 'QNXTApi/Benefit/plans/*': 6 * 3600})
+>>> client = Client(r"http://qnxt_app_server.com", cache=cache)
+>>> benefits = Benefit.BenefitResource(client, header_factory)
+>>> benefits.get_benefit('PLAN1', 'BEN1')  # sent to the app server
+>>> benefits.get_benefit('PLAN1', 'BEN1')  # answered from the cache
+>>> cache.stats()
+{'hits': 1, 'misses': 1, 'revalidations': 0, 'evictions': 0, 'entries': 1, 'bytes': 2048}
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
+from fnmatch import fnmatchcase
+from operator import itemgetter
+from typing import Union
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from qnxt.utils.filelock import O_NOFOLLOW, private_directory
+
+# endpoints cached by a ResponseCache created without `ttls`, in seconds; 0 revalidates every request
+DEFAULT_TTLS = {'QNXTApi/Benefit/*': 3600,
+                'QNXTApi/Member/enrollments/*/copcProviders': 0}
+# the response headers kept with a stored response
+KEEP_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+# the identities handed out to header factories that do not name their user; an id() could be reused once the
+# header factory is garbage collected, a number from the counter never is
+_anonymous = weakref.WeakKeyDictionary()
+_anonymous_ids = itertools.count(1)
+_anonymous_lock = threading.Lock()
+
+
+class CachedHTTPResponse:
+    """A stored response: the status, headers and raw body of an HTTP response, and when it expires. It stands in for
+    the HTTP response of every `Response` returned from the cache"""
+    __slots__ = ('status_code', 'reason', 'url', 'headers', 'content', 'stored_at', 'expires_at')
+    elapsed = timedelta(0)
+
+    def __init__(self, status_code: int, reason: str, url: str, headers: dict, content: bytes, stored_at: float,
+                 expires_at: float):
+        self.status_code = status_code
+        self.reason = reason
+        self.url = url
+        self.headers = headers
+        self.content = content
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+
+    def __repr__(self):
+        return f"<CachedHTTPResponse [{self.status_code}]>"
+
+    @classmethod
+    def from_response(cls, http_response, ttl: float, keep_headers: tuple = KEEP_HEADERS) -> 'CachedHTTPResponse':
+        """Copy what is cached of a `requests` or `httpx` response"""
+        now = time.time()
+        headers = {k: http_response.headers[k] for k in keep_headers if k in http_response.headers}
+        reason = getattr(http_response, 'reason', None) or getattr(http_response, 'reason_phrase', None)
+        return cls(http_response.status_code, reason, str(http_response.url), headers, http_response.content, now,
+                   now + ttl)
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def size(self) -> int:
+        """The approximate number of bytes the entry takes up"""
+        return len(self.content) + len(self.url) + sum(len(k) + len(v) for k, v in self.headers.items()) + 200
+
+    def fresh(self, now: float = None) -> bool:
+        return (time.time() if now is None else now) < self.expires_at
+
+    def validators(self) -> dict:
+        """Returns the conditional request headers that revalidate this response, empty if it cannot be revalidated"""
+        headers = {}
+        if 'ETag' in self.headers:
+            headers['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+    def renewed(self, http_response, ttl: float) -> 'CachedHTTPResponse':
+        """Returns a copy of this response that is fresh for another `ttl` seconds, with the validators of the 304
+        `http_response` that confirmed it"""
+        now = time.time()
+        headers = dict(self.headers)
+        headers.update({k: http_response.headers[k] for k in ('ETag', 'Last-Modified') if k in http_response.headers})
+        return type(self)(self.status_code, self.reason, self.url, headers, self.content, now, now + ttl)
+
+
+class MemoryStore:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        """
+        An in-process, thread-safe cache store that evicts the least recently used entries once it holds more than
+        `max_entries` entries or `max_bytes` bytes of responses
+
+        Parameters
+        ----------
+        max_entries: int, optional, default 1024
+            The maximum number of stored responses
+        max_bytes: int, optional, default 64 MiB
+            The maximum total size of the stored responses. A single response larger than this is not stored.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"MemoryStore(entries={len(self)}, bytes={self.bytes})"
+
+    def get(self, key: str) -> Union[CachedHTTPResponse, None]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedHTTPResponse):
+        size = entry.size
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _pop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+
+class SQLiteStore:
+    SCHEMA = """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    status_code INTEGER NOT NULL,
+                    reason TEXT,
+                    url TEXT NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    revalidate INTEGER NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL)"""
+
+    def __init__(self,
+                 path: str = None,
+                 max_entries: int = 100000,
+                 max_bytes: int = 1024 * 1024 * 1024,
+                 compress_level: int = 6,
+                 sweep_interval: int = 256,
+                 timeout: float = 30.0,
+                 ):
+        """
+        A cache store in an SQLite database, so that stored responses survive restarts and are shared by every
+        process that opens the same file. Bodies are stored zlib-compressed. The database runs in WAL mode, so
+        readers never wait for a writer, and each thread gets its own connection.
+
+        Every `sweep_interval` writes, expired responses that cannot be revalidated are deleted, and if the store is
+        still larger than `max_entries` or `max_bytes` the least recently used responses are deleted until it is back
+        under 90% of both.
+
+        Parameters
+        ----------
+        path: str, optional, default <system temp dir>/qnxt-cache-<uid>/responses.sqlite3
+            The database file. It is created, only readable by the current user, if it does not exist, and it must not
+            be a symlink. The default directory is private to the current user (see
+            `qnxt.utils.filelock.private_directory`); give an explicit path to share one cache between users.
+        max_entries: int, optional, default 100000
+            The number of stored responses above which a sweep evicts the least recently used ones
+        max_bytes: int, optional, default 1 GiB
+            The total compressed size of the stored responses above which a sweep evicts the least recently used ones
+        compress_level: int, optional, default 6
+            The zlib compression level of the bodies, from 0 (none) to 9
+        sweep_interval: int, optional, default 256
+            The number of writes between two sweeps
+        timeout: float, optional, default 30.0
+            The number of seconds to wait for another process's write to finish before giving up
+
+        Examples
+        --------
+        >>> cache = ResponseCache(SQLiteStore('/var/cache/qnxt/responses.sqlite3'))
+        >>> client = Client(r"http://qnxt_app_server.com", cache=cache)
+        ...
+        """
+        if path is None:
+            path = os.path.join(private_directory(name='qnxt-cache'), 'responses.sqlite3')
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.sweep_interval = sweep_interval
+        self.timeout = timeout
+        self.evictions = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT | O_NOFOLLOW, 0o600))
+        with self._connection() as db:
+            db.execute(self.SCHEMA)
+            db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __repr__(self):
+        return f"SQLiteStore(path={self.path})"
+
+    @property
+    def bytes(self) -> int:
+        """The total compressed size of the stored responses"""
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection, opening it on first use"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Union[CachedHTTPResponse, None]:
+        db = self._connection()
+        row = db.execute("SELECT status_code, reason, url, headers, body, stored_at, expires_at, accessed_at "
+                         "FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        status_code, reason, url, headers, body, stored_at, expires_at, accessed_at = row
+        now = time.time()
+        if now - accessed_at > 60:
+            # recency only matters to the sweep, so it is not written back on every read
+            db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        try:
+            content = zlib.decompress(body)
+        except zlib.error:
+            self.delete(key)
+            return None
+        return CachedHTTPResponse(status_code, reason, url, json.loads(headers), content, stored_at, expires_at)
+
+    def set(self, key: str, entry: CachedHTTPResponse):
+        body = zlib.compress(entry.content, self.compress_level)
+        size = len(body) + entry.size - len(entry.content)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, entry.status_code, entry.reason, entry.url, json.dumps(entry.headers), body, size,
+             int(bool(entry.validators())), entry.stored_at, entry.expires_at, time.time()))
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.sweep_interval == 0
+        if due:
+            self.sweep()
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM responses")
+
+    def sweep(self) -> int:
+        """Delete the expired responses that cannot be revalidated, then the least recently used ones if the store is
+        over `max_entries` or `max_bytes`. Returns the number of responses deleted."""
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = db.execute("DELETE FROM responses WHERE expires_at <= ? AND revalidate = 0",
+                                 (time.time(),)).rowcount
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            evicted = 0
+            if entries > self.max_entries or size > self.max_bytes:
+                keep_entries, keep_bytes = int(self.max_entries * 0.9), int(self.max_bytes * 0.9)
+                # walk from the most recently used response and keep them until either bound is reached
+                kept = total = 0
+                cutoff = None
+                for accessed_at, row_size in db.execute("SELECT accessed_at, size FROM responses "
+                                                        "ORDER BY accessed_at DESC"):
+                    if kept + 1 > keep_entries or total + row_size > keep_bytes:
+                        cutoff = accessed_at
+                        break
+                    kept += 1
+                    total += row_size
+                if cutoff is not None:
+                    evicted = db.execute("DELETE FROM responses WHERE accessed_at <= ?", (cutoff,)).rowcount
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.evictions += evicted
+        return deleted + evicted
+
+    def close(self):
+        """Close this thread's connection"""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+def identity(header_factory) -> str:
+    """
+    Returns who requests made with `header_factory` are sent as: a hash of the STS server, environment and user of a
+    `qnxt.authentication.RequestHeader`, so the same user shares cache entries across header factories and processes.
+    A header factory that does not name its user gets an identity of its own, as does no header factory at all.
+    """
+    if header_factory is None:
+        return 'anonymous'
+    username = getattr(getattr(header_factory, 'auth', None), 'username', None)
+    if username is None:
+        with _anonymous_lock:
+            try:
+                number = _anonymous.get(header_factory)
+                if number is None:
+                    number = _anonymous[header_factory] = next(_anonymous_ids)
+            except TypeError:
+                # neither weakly referenceable nor hashable, so it cannot be recognized again
+                number = next(_anonymous_ids)
+        return f"object-{number}"
+    user = f"{getattr(header_factory, 'fqdn', None)}\0{getattr(header_factory, 'envid', None)}\0{username}"
+    return hashlib.sha256(user.encode('utf-8')).hexdigest()[:16]
+
+
+class ResponseCache:
+    def __init__(self, store=None, ttls: dict = None, default_ttl: float = None):
+        """
+        Caches the responses to GET requests for a time that depends on the endpoint. Pass it to a
+        `qnxt.client.Client` to use it.
+
+        Parameters
+        ----------
+        store: optional
+            Where the responses are kept, a `MemoryStore` by default
+        ttls: dict, optional
+            {path pattern: seconds} of the endpoints to cache. The patterns are matched with `fnmatch` against the path
+            of the URL, with or without any prefix in front of 'QNXTApi', and the first match wins. A TTL of 0 stores
+            responses only to revalidate them on every request. Defaults to `DEFAULT_TTLS`, which caches the Benefit API
+            for an hour and revalidates COPC enrollment providers.
+        default_ttl: float, optional
+            The TTL of the endpoints that match no pattern. By default they are not cached.
+        """
+        self.store = store if store is not None else MemoryStore()
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ResponseCache(store={self.store!r}, hits={self.hits}, misses={self.misses})"
+
+    def ttl(self, uri: str) -> Union[float, None]:
+        """Returns the number of seconds responses from `uri` are fresh for, or None if they are not cached"""
+        path = urlsplit(uri).path.lstrip('/')
+        for pattern, ttl in self.ttls.items():
+            if fnmatchcase(path, pattern) or fnmatchcase(path, f'*/{pattern}'):
+                return ttl
+        return self.default_ttl
+
+    @staticmethod
+    def key(method: str, uri: str, params: dict = None, header_factory=None) -> str:
+        """
+        Returns the canonical cache key of a request. Parameters that are None are dropped and the rest, along with
+        any query string already in `uri`, are sorted by name (repeated values keep their order) and encoded the way
+        they are sent, so equivalent requests share a key however their params were built. The environment ID of
+        `header_factory` is part of the key, because it selects the QNXT environment, and so is the user it
+        authenticates as (see `identity`), so a response is never served to, or shared by a coalesced request of, a
+        user other than the one it was fetched for.
+        """
+        parts = urlsplit(uri)
+        # requests sends the parameters after the query string of the URI
+        encoded = parse_qsl(parts.query, keep_blank_values=True)
+        for name, value in (params or {}).items():
+            if value is None:
+                continue
+            for item in value if isinstance(value, (list, tuple)) else [value]:
+                encoded.append((name, str(item)))
+        envid = getattr(header_factory, 'envid', None)
+        url = f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+        return (f"{method.upper()} {envid} {identity(header_factory)} "
+                f"{url}?{urlencode(sorted(encoded, key=itemgetter(0)))}")
+
+    def get(self, key: str) -> Union[CachedHTTPResponse, None]:
+        """
+        Returns the entry stored under `key`, or None if there is none. A fresh entry is a hit. A stale entry is a miss
+        and is only returned if it can be revalidated (see `CachedHTTPResponse.validators`); otherwise it is dropped.
+        """
+        entry = self.store.get(key)
+        if entry is not None and not entry.fresh() and not entry.validators():
+            self.store.delete(key)
+            entry = None
+        with self._lock:
+            if entry is not None and entry.fresh():
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def put(self, key: str, http_response, ttl: float) -> Union[CachedHTTPResponse, None]:
+        """Store a successful response under `key` for `ttl` seconds and return the entry. Errors, and responses with
+        a TTL of 0 that cannot be revalidated, are not stored."""
+        if http_response.status_code != 200:
+            return None
+        entry = CachedHTTPResponse.from_response(http_response, ttl)
+        if ttl <= 0 and not entry.validators():
+            return None
+        self.store.set(key, entry)
+        return entry
+
+    def revalidated(self, key: str, entry: CachedHTTPResponse, http_response, ttl: float) -> CachedHTTPResponse:
+        """Store and return `entry` renewed for another `ttl` seconds, after a 304 `http_response` confirmed it"""
+        entry = entry.renewed(http_response, ttl)
+        self.store.set(key, entry)
+        with self._lock:
+            self.revalidations += 1
+        return entry
+
+    def clear(self):
+        """Drop every stored response"""
+        self.store.clear()
+
+    def stats(self) -> dict:
+        """Returns the hit, miss, revalidation and eviction counters and the size of the store"""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'evictions': getattr(self.store, 'evictions', 0),
+                'entries': len(self.store),
+                'bytes': getattr(self.store, 'bytes', None)}
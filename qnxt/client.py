@@ -0,0 +1,234 @@
+import copy
+import inspect
+import logging
+from typing import Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from qnxt.api.Response import Response, StreamingResponse
+from qnxt.cache import ResponseCache
+from qnxt.ratelimit import RateLimiter
+from qnxt.retry import CircuitBreaker, RetryPolicy
+from qnxt.utils import *
+
+
+class Client:
+    def __init__(self,
+                 app_server: str,
+                 pool_connections: int = 10,
+                 pool_maxsize: int = 10,
+                 pool_block: bool = False,
+                 keep_alive: bool = True,
+                 timeout: Union[float, tuple] = None,
+                 lean: bool = False,
+                 cache: ResponseCache = None,
+                 coalesce: bool = False,
+                 retry: RetryPolicy = None,
+                 breaker: CircuitBreaker = None,
+                 rate_limiter: RateLimiter = None,
+                 ):
+        """
+        A client that owns a single pooled `requests.Session` and can be passed to the API classes in place of the
+        bare `app_server` string, so that every call made through it reuses warm TCP/TLS connections to the app server.
+
+        Parameters
+        ----------
+        app_server: str, required
+            This is the FQDN of the target QNXT app server
+        pool_connections: int, optional, default 10
+            The number of connection pools (one per host) to cache.
+        pool_maxsize: int, optional, default 10
+            The maximum number of connections to keep open per host. Set this to at least the number of threads that
+            will share the client.
+        pool_block: bool, optional, default False
+            If True, callers wait for a free connection once `pool_maxsize` is reached instead of opening (and then
+            discarding) an extra one.
+        keep_alive: bool, optional, default True
+            If False, every request is sent with `Connection: close` and nothing is reused.
+        timeout: float or tuple, optional
+            Default (connect, read) timeout passed to every request made through the client.
+        lean: bool, optional, default False
+            If True, every `Response` is created in lean mode: its body is parsed straight away and the raw body is
+            released, keeping only the status, key headers and timing. Use this when holding many responses at once.
+        cache: qnxt.cache.ResponseCache, optional
+            If given, GET requests to the endpoints it has a TTL for are answered from it while the stored response is
+            fresh, and revalidated with a conditional request once it is stale. Streaming requests are never cached.
+        coalesce: bool, optional, default False
+            If True, concurrent identical GET requests (same URL, parameters and environment) share one request to the
+            app server, and each caller gets its own `Response` over the result. If the shared request raises, each
+            waiting caller sends its own request instead. `flights.stats()` counts the requests saved.
+        retry: qnxt.retry.RetryPolicy, optional
+            If given, requests with one of its `methods` (by default GET, HEAD and OPTIONS) that fail with a dropped
+            connection, a timeout, a 429 or a 5xx are sent again after a backoff, honouring `Retry-After`. Retries
+            happen below the cache and coalescing, so callers sharing a request also share its retries.
+        breaker: qnxt.retry.CircuitBreaker, optional
+            If given, requests to an endpoint that keeps failing raise `qnxt.retry.CircuitOpenError` without being sent
+            until the endpoint recovers, instead of piling up on a struggling app server.
+        rate_limiter: qnxt.ratelimit.RateLimiter, optional
+            If given, every request sent to the app server, retries included, first waits for a token of its API
+            family. It can be shared with other clients, including a `qnxt.aio.AsyncClient`.
+
+        Examples
+        --------
+        >>> from qnxt.api import CallTracking
+        >>> client = Client(r"http://qnxt_app_server.com", pool_maxsize=32)
+        >>> calls = CallTracking.CallResource(client, header_factory)
+        >>> stats = CallTracking.CallStatistics(client, header_factory)
+        ...
+        """
+        if app_server.endswith('/'):
+            self.app_server = app_server[:-1]
+        else:
+            self.app_server = app_server
+        self.timeout = timeout
+        self.lean = lean
+        self.cache = cache
+        self.flights = singleflight.SingleFlight() if coalesce else None
+        self.retry = retry
+        self.breaker = breaker
+        self.rate_limiter = rate_limiter
+        self.stream_chunk_size = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def __repr__(self):
+        return f"Client(app_server={self.app_server})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def url(self, base_path: str) -> str:
+        """Returns the base URL of an API resource on this client's app server"""
+        return clean_url.clean_url(self.app_server, base_path)
+
+    def streaming(self, chunk_size: int = 65536) -> 'Client':
+        """
+        Returns a view of this client, sharing its session and connection pool, whose requests are sent with
+        `stream=True` and return a `qnxt.api.Response.StreamingResponse`. Pass it to an API class to iterate over very
+        large search results one record at a time in constant memory.
+
+        Parameters
+        ----------
+        chunk_size: int, optional, default 65536
+            The number of bytes read from the connection at a time
+        """
+        view = copy.copy(self)
+        view.stream_chunk_size = chunk_size
+        return view
+
+    def request(self, method: str, uri: str, header_factory, params: dict = None, **kwargs) -> Response:
+        """
+        Send a request through the pooled session and wrap the result in a `Response`
+
+        Parameters
+        ----------
+        method: str, required
+            The HTTP method, e.g. GET, POST or PUT
+        uri: str, required
+            The full URI of the endpoint
+        header_factory: qnxt.authentication.RequestHeader, required
+            This is a callable that generates the appropriate authentication headers for QNXT API requests
+        params: dict, optional
+            The query string parameters of the request
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if self.stream_chunk_size is not None:
+            response = self._send(method, uri, header_factory, params, dict(kwargs, stream=True))
+            return StreamingResponse(response, self.stream_chunk_size)
+        if method != 'GET' or (self.cache is None and self.flights is None):
+            return Response(self._send(method, uri, header_factory, params, kwargs), lean=self.lean)
+
+        key = ResponseCache.key(method, uri, params, header_factory)
+        ttl = cached = None
+        if self.cache is not None:
+            ttl = self.cache.ttl(uri)
+        if ttl is not None:
+            cached = self.cache.get(key)
+            if cached is not None and cached.fresh():
+                logging.debug(f"{method} {cached.url} {cached.status_code}: from cache")
+                return Response(cached, lean=self.lean)
+        if self.flights is not None:
+            # every caller gets its own Response over the shared HTTP response, so parsed bodies are never shared
+            http_response = self.flights.do(f"{key} {sorted(kwargs.items())}", self._send_cached, method, uri,
+                                            header_factory, params, kwargs, key, ttl, cached)
+        else:
+            http_response = self._send_cached(method, uri, header_factory, params, kwargs, key, ttl, cached)
+        return Response(http_response, lean=self.lean)
+
+    def _send(self, method: str, uri: str, header_factory, params: dict, kwargs: dict, validators: dict = None):
+        """Send a request through the pooled session, retrying it if the retry policy covers it, and return the HTTP
+        response"""
+        if self.retry is not None and method in self.retry.methods:
+            return self.retry.call(self._attempt, method, uri, header_factory, params, kwargs, validators)
+        return self._attempt(method, uri, header_factory, params, kwargs, validators)
+
+    def _attempt(self, method: str, uri: str, header_factory, params: dict, kwargs: dict, validators: dict = None):
+        """Send a request once, through the circuit breaker and rate limiter if there are any, and return the HTTP
+        response"""
+        endpoint, trial = self.breaker.before(uri) if self.breaker is not None else (None, False)
+        sending = False
+        try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(uri)
+            # headers are made per attempt, so a retry after a long backoff does not go out with an expired token
+            headers = header_factory()
+            if validators:
+                headers = {**headers, **validators}
+            sending = True
+            response = self.session.request(method, uri, headers=headers, params=params, **kwargs)
+        except BaseException as e:
+            if endpoint is not None:
+                self.breaker.record_error(endpoint, trial, e if sending else None)
+            raise
+        if endpoint is not None:
+            self.breaker.record(endpoint, self.breaker.failed(response))
+        logging.debug(f"{method} {response.url} {response.status_code}: {response.reason}")
+        return response
+
+    def _send_cached(self, method: str, uri: str, header_factory, params: dict, kwargs: dict, key: str, ttl: float,
+                     cached):
+        """Send a GET request, revalidating the stale `cached` response if there is one, and store the result in the
+        cache if `ttl` is not None"""
+        validators = cached.validators() if cached is not None else None
+        response = self._send(method, uri, header_factory, params, kwargs, validators=validators)
+        if ttl is not None:
+            if response.status_code == 304 and cached is not None:
+                return self.cache.revalidated(key, cached, response, ttl)
+            self.cache.put(key, response, ttl)
+        return response
+
+    def get(self, uri: str, header_factory, params: dict = None, **kwargs) -> Response:
+        return self.request('GET', uri, header_factory, params=params, **kwargs)
+
+    def post(self, uri: str, header_factory, params: dict = None, **kwargs) -> Response:
+        return self.request('POST', uri, header_factory, params=params, **kwargs)
+
+    def put(self, uri: str, header_factory, params: dict = None, **kwargs) -> Response:
+        return self.request('PUT', uri, header_factory, params=params, **kwargs)
+
+    def close(self):
+        """Close the session and every pooled connection it holds"""
+        self.session.close()
+
+
+def as_client(app_server) -> Client:
+    """Returns `app_server` unchanged if it is already a client, otherwise wraps the FQDN in a new `Client`"""
+    if isinstance(app_server, str):
+        return Client(app_server)
+    return app_server
+
+
+def require_sync(client, name: str):
+    """Raises TypeError if `client` is a `qnxt.aio.AsyncClient`, for the helpers that fan requests out on threads"""
+    if inspect.iscoroutinefunction(getattr(client, 'request', None)):
+        raise TypeError(f"{name} needs a qnxt.client.Client, not {type(client).__name__}; with an AsyncClient await "
+                        f"the API methods directly instead, e.g. with asyncio.gather")
@@ -0,0 +1,179 @@
+"""A durable local journal of writes to QNXT. Every write is recorded under its dedup key before it is sent and marked
+acknowledged, with its result, once the app server has accepted it. A write whose key is already acknowledged is not
+sent again, so when a job is run again after a crash the writes that went through return their stored results
+straight away, and `pending()` lists the ones that were never acknowledged, to be replayed.
+
+A write that failed in a way that sending it again would not fix, or that may already have been applied (e.g. a
+create whose answer was lost), is marked failed. It is not sent again on a rerun either: it raises `FailedWriteError`
+until it has been checked and made pending again with `retry_failed()`.
+
+See `qnxt.api.PlanIntegration.JournaledWrites`.
+
+Examples
+--------
+>>> journal = WriteJournal('/var/lib/qnxt/myjob.sqlite3')
+>>> journal.stats()
+{'pending': 3, 'done': 199997, 'failed': 0}
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, Tuple, Union
+
+import requests
+
+from qnxt.utils.filelock import O_NOFOLLOW
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class FailedWriteError(requests.RequestException):
+    """Raised instead of sending a write that the journal has marked failed"""
+
+    def __init__(self, key: str, error: str):
+        super().__init__(f"the write {key} failed before and is not sent again until it is made pending with "
+                         f"retry_failed(): {error}")
+        self.key = key
+        self.error = error
+
+
+class WriteJournal:
+    SCHEMA = """CREATE TABLE IF NOT EXISTS writes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL UNIQUE,
+                    operation TEXT NOT NULL,
+                    kwargs TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL)"""
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        """
+        A write journal in an SQLite database. The database runs in WAL mode with full synchronous commits, so an
+        acknowledgement that has been recorded survives a crash of the process or the machine, and each thread gets
+        its own connection.
+
+        Parameters
+        ----------
+        path: str, required
+            The database file of the job, e.g. '/var/lib/qnxt/myjob.sqlite3'. It is created, only readable by the
+            current user, if it does not exist, and it must not be a symlink. Give every job its own file: the dedup
+            keys of different jobs are not meant to be compared.
+        timeout: float, optional, default 30.0
+            The number of seconds to wait for another process's write to finish before giving up
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT | O_NOFOLLOW, 0o600))
+        with self._connection() as db:
+            db.execute(self.SCHEMA)
+            db.execute("CREATE INDEX IF NOT EXISTS writes_status ON writes (status, seq)")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+
+    def __repr__(self):
+        return f"WriteJournal(path={self.path})"
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection, opening it on first use"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=FULL")
+            self._local.db = db
+        return db
+
+    def begin(self, key: str, operation: str, kwargs: dict) -> Tuple[str, object]:
+        """
+        Record a write under `key` unless it is already in the journal. Returns its (status, result); the result is
+        only set for an acknowledged write.
+
+        Parameters
+        ----------
+        key: str, required
+            The dedup key of the write
+        operation: str, required
+            The name of the method that sends the write
+        kwargs: dict, required
+            The parameters of the write. Values that are not JSON types (e.g. dates) are stored as their str().
+        """
+        db = self._connection()
+        now = time.time()
+        db.execute("INSERT OR IGNORE INTO writes (key, operation, kwargs, status, created_at, updated_at) "
+                   "VALUES (?, ?, ?, ?, ?, ?)", (key, operation, json.dumps(kwargs, default=str), PENDING, now, now))
+        status, result = db.execute("SELECT status, result FROM writes WHERE key = ?", (key,)).fetchone()
+        return status, json.loads(result) if result is not None else None
+
+    def ack(self, key: str, result):
+        """Mark the write under `key` acknowledged, with the `result` returned for it"""
+        self._connection().execute("UPDATE writes SET status = ?, result = ?, error = NULL, attempts = attempts + 1, "
+                                   "updated_at = ? WHERE key = ?",
+                                   (DONE, json.dumps(result, default=str), time.time(), key))
+
+    def fail(self, key: str, error: BaseException, permanent: bool = False):
+        """Record that sending the write under `key` failed. It stays pending, to be replayed, unless the failure is
+        `permanent`, in which case it is marked failed and not sent again until `retry_failed` is called."""
+        self._connection().execute("UPDATE writes SET status = ?, error = ?, attempts = attempts + 1, updated_at = ? "
+                                   "WHERE key = ?",
+                                   (FAILED if permanent else PENDING, repr(error), time.time(), key))
+
+    def get(self, key: str) -> Union[dict, None]:
+        """Returns everything recorded about the write under `key`, or None if there is no such write"""
+        db = self._connection()
+        cursor = db.execute("SELECT * FROM writes WHERE key = ?", (key,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        entry = dict(zip((column[0] for column in cursor.description), row))
+        entry['kwargs'] = json.loads(entry['kwargs'])
+        entry['result'] = json.loads(entry['result']) if entry['result'] is not None else None
+        return entry
+
+    def _writes(self, status: str) -> Iterator[Tuple[str, str, dict]]:
+        rows = self._connection().execute("SELECT key, operation, kwargs FROM writes WHERE status = ? ORDER BY seq",
+                                          (status,)).fetchall()
+        for key, operation, kwargs in rows:
+            yield key, operation, json.loads(kwargs)
+
+    def pending(self) -> Iterator[Tuple[str, str, dict]]:
+        """Yields the (key, operation, kwargs) of every write that was never acknowledged, in the order they were first
+        recorded"""
+        return self._writes(PENDING)
+
+    def failed(self) -> Iterator[Tuple[str, str, dict]]:
+        """Yields the (key, operation, kwargs) of every write that failed permanently, e.g. with a 400 Bad Request"""
+        return self._writes(FAILED)
+
+    def retry_failed(self) -> int:
+        """Make every permanently failed write pending again, e.g. once its cause has been fixed. Returns their
+        number."""
+        return self._connection().execute("UPDATE writes SET status = ?, updated_at = ? WHERE status = ?",
+                                          (PENDING, time.time(), FAILED)).rowcount
+
+    def purge(self) -> int:
+        """Delete the acknowledged writes, e.g. once the job has finished. Returns their number."""
+        return self._connection().execute("DELETE FROM writes WHERE status = ?", (DONE,)).rowcount
+
+    def stats(self) -> dict:
+        """Returns the number of pending, acknowledged and permanently failed writes"""
+        counts = dict(self._connection().execute("SELECT status, COUNT(*) FROM writes GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in (PENDING, DONE, FAILED)}
+
+    def close(self):
+        """Close this thread's connection"""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
@@ -0,0 +1,146 @@
+"""Client-side rate limiting. A `RateLimiter` keeps one token bucket per API family, keyed by its resource base path
+(e.g. 'QNXTApi/CallTracking' or 'QNXTApi/Member'), and every request waits for a token of its family before it is
+sent. A bucket refills at `rate` tokens per second and holds at most `burst`, so a bulk job can run right at the
+allowed rate without bursting over it.
+
+Waiting for a token never holds a lock: the token is reserved straight away and the caller sleeps until it is due, so
+one limiter can be shared by any number of threads, a `qnxt.client.Client` and a `qnxt.aio.AsyncClient` at the same
+time, and requests are let through in the order they asked.
+
+Examples
+--------
+>>> limiter = RateLimiter({'QNXTApi/CallTracking': 10, 'QNXTApi/PlanIntegration': (50, 100)}, default_rate=20)
+>>> client = Client(r"http://qnxt_app_server.com", rate_limiter=limiter)
+>>> limiter.stats()
+{'QNXTApi/CallTracking': {'rate': 10, 'burst': 10, 'acquired': 1200, 'waited': 1150, 'wait_seconds': 104.2}, ...}
+"""
+
+import asyncio
+import threading
+import time
+from typing import Union
+
+from qnxt.utils import *
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = None):
+        """
+        Lets through `rate` requests per second on average, and up to `burst` at once after a quiet spell
+
+        Parameters
+        ----------
+        rate: float, required
+            The number of tokens added per second
+        burst: float, optional, default `rate` (and at least 1)
+            The largest number of tokens the bucket holds
+        """
+        assert (rate > 0), "`rate` must be greater than 0"
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.tokens = self.burst
+        self.acquired = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"TokenBucket(rate={self.rate}, burst={self.burst})"
+
+    def reserve(self) -> float:
+        """Takes a token and returns the number of seconds to wait before using it. The bucket goes into debt for
+        tokens reserved ahead of time, so later callers wait behind earlier ones."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= 1
+            self.acquired += 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if wait:
+                self.waited += 1
+                self.wait_seconds += wait
+            return wait
+
+    def acquire(self) -> float:
+        """Wait until a token is available and take it. Returns the number of seconds waited."""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self) -> float:
+        """The asyncio counterpart of `acquire`, which waits without blocking the event loop"""
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self) -> dict:
+        """Returns the rate, the burst, the number of tokens taken, how many of them had to wait and for how long"""
+        return {'rate': self.rate, 'burst': self.burst, 'acquired': self.acquired, 'waited': self.waited,
+                'wait_seconds': self.wait_seconds}
+
+
+class RateLimiter:
+    def __init__(self, rates: dict = None, default_rate: Union[float, tuple] = None, depth: int = 2):
+        """
+        Parameters
+        ----------
+        rates: dict, optional
+            The rate of each resource base path, in requests per second, e.g. {'QNXTApi/CallTracking': 10}. A value
+            can also be a (rate, burst) tuple.
+        default_rate: float or tuple, optional
+            The rate, or (rate, burst), of every resource base path not in `rates`. Each of them gets its own bucket.
+            By default requests to those resources are not limited.
+        depth: int, optional, default 2
+            The number of path segments, from 'QNXTApi' on, that make a resource base path (see
+            `qnxt.utils.clean_url.resource_path`)
+        """
+        self.default_rate = default_rate
+        self.depth = depth
+        # paths are matched case-insensitively, and reported as given in `rates` or as first seen
+        self._buckets = {self._key(path): self._bucket(rate) for path, rate in (rates or {}).items()}
+        self._paths = {self._key(path): path.strip('/') for path in (rates or {})}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"RateLimiter(rates={ {self._paths[key]: bucket.rate for key, bucket in self._buckets.items()} })"
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return path.strip('/').lower()
+
+    @staticmethod
+    def _bucket(rate: Union[float, tuple]) -> TokenBucket:
+        if isinstance(rate, tuple):
+            return TokenBucket(*rate)
+        return TokenBucket(rate)
+
+    def bucket(self, uri: str) -> Union[TokenBucket, None]:
+        """Returns the bucket of the resource `uri` belongs to, or None if its requests are not limited"""
+        path = clean_url.resource_path(uri, self.depth)
+        key = self._key(path)
+        bucket = self._buckets.get(key)
+        if bucket is None and self.default_rate is not None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    self._paths[key] = path
+                    bucket = self._buckets[key] = self._bucket(self.default_rate)
+        return bucket
+
+    def acquire(self, uri: str) -> float:
+        """Wait until a request to `uri` may be sent. Returns the number of seconds waited."""
+        bucket = self.bucket(uri)
+        return bucket.acquire() if bucket is not None else 0.0
+
+    async def aacquire(self, uri: str) -> float:
+        """The asyncio counterpart of `acquire`, which waits without blocking the event loop"""
+        bucket = self.bucket(uri)
+        return await bucket.aacquire() if bucket is not None else 0.0
+
+    def stats(self) -> dict:
+        """Returns the stats of every bucket, by resource base path"""
+        return {self._paths[key]: bucket.stats() for key, bucket in list(self._buckets.items())}
@@ -0,0 +1,424 @@
+"""Retrying of requests that failed for a reason that may go away on its own: a dropped connection, a timeout, or a
+429 or 5xx answer from an overloaded app server. Retries wait an exponentially growing, fully jittered delay, or as
+long as the app server asks in its `Retry-After` header, so many clients retrying at once spread out instead of
+hitting the app server again in lockstep.
+
+A `RetryBudget` caps retries at a share of all calls, so that when the app server is struggling the retries do not
+multiply its load. A `CircuitBreaker` goes further: once an endpoint has failed several times in a row, requests to it
+fail straight away with `CircuitOpenError`, without being sent, until a trial request after `reset_timeout` succeeds.
+
+Pass a `RetryPolicy` and a `CircuitBreaker` to `qnxt.client.Client` (or `qnxt.aio.AsyncClient`) to apply them to
+every request it sends.
+
+Examples
+--------
+>>> client = Client(r"http://qnxt_app_server.com",
+...                 retry=RetryPolicy(attempts=4, budget=RetryBudget(ratio=0.1)),
+...                 breaker=CircuitBreaker(failure_threshold=5, reset_timeout=30))
+>>> client.retry.stats()
+{'calls': 1200, 'retries': 14, 'gave_up': 1, 'budget_exhausted': 0}
+>>> client.breaker.stats()
+{'open': ['QNXTApi/Benefit/benefits'], 'rejected': 37}
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Tuple, Union
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from qnxt.utils import *
+
+# the HTTP statuses that are worth retrying
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# the exceptions raised by requests (and httpx, when it is installed) that are worth retrying
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout)
+if httpx is not None:
+    RETRY_ERRORS += (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+# the HTTP methods a client retries; repeating any of them has the same effect as sending it once
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+# the HTTP statuses that say a request was turned away without being processed
+UNPROCESSED_STATUSES = frozenset({429, 503})
+
+
+def unsent(error: BaseException) -> bool:
+    """Returns True if `error` means the request never reached the app server, because no connection could be made.
+    A read timeout or a connection dropped mid-request is not unsent: the app server may have processed it."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if httpx is not None and isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.ConnectionError):
+        # requests wraps a refused connection in a MaxRetryError whose reason is a NewConnectionError, and a connect
+        # timeout in one whose reason is a ConnectTimeoutError; a dropped connection has neither
+        reason = getattr(error.args[0] if error.args else None, 'reason', None)
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+def retry_after(response) -> Union[float, None]:
+    """Returns the number of seconds the `Retry-After` header of `response` asks to wait, or None if it has none"""
+    value = getattr(response, 'headers', {}).get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = 0.2, reserve: float = 10, cap: float = 100):
+        """
+        Caps retries at a share of calls. Every call adds `ratio` of a token to the budget, up to `cap` tokens, and
+        every retry takes one. A retry with no token left is not sent. The budget can be shared by several policies.
+
+        Parameters
+        ----------
+        ratio: float, optional, default 0.2
+            The number of retries allowed per call, over time
+        reserve: float, optional, default 10
+            The number of tokens the budget starts with, so the first calls can be retried
+        cap: float, optional, default 100
+            The largest number of tokens the budget holds, i.e. the longest burst of retries it allows
+        """
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = min(float(reserve), cap)
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"RetryBudget(ratio={self.ratio}, tokens={self.tokens:.1f})"
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Takes a token and returns True, or returns False if there is none left"""
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.exhausted += 1
+            return False
+
+
+class RetryPolicy:
+    def __init__(self,
+                 attempts: int = 5,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 statuses: frozenset = RETRY_STATUSES,
+                 errors: tuple = RETRY_ERRORS,
+                 methods: frozenset = IDEMPOTENT_METHODS,
+                 max_retry_after: float = 120.0,
+                 budget: RetryBudget = None,
+                 unsent_only: bool = False,
+                 ):
+        """
+        How often, and how long apart, a failed request is tried again
+
+        Parameters
+        ----------
+        attempts: int, optional, default 5
+            The number of times a request is sent in all, including the first
+        backoff: float, optional, default 0.5
+            The delay before the first retry is drawn at random between 0 and `backoff` seconds, and the upper bound
+            doubles with every further retry
+        max_backoff: float, optional, default 30.0
+            The largest upper bound of a delay, in seconds
+        statuses: frozenset, optional, default RETRY_STATUSES
+            The HTTP statuses that are retried. The response of the last attempt is returned whatever its status.
+        errors: tuple, optional, default RETRY_ERRORS
+            The exceptions that are retried. The exception of the last attempt is raised.
+        methods: frozenset, optional, default IDEMPOTENT_METHODS
+            The HTTP methods retried when the policy is given to a client. Writes are left out by default, since
+            sending one again may apply it twice; see `qnxt.api.PlanIntegration.JournaledWrites`.
+        max_retry_after: float, optional, default 120.0
+            A response with one of `statuses` whose `Retry-After` header asks to wait longer than this many seconds is
+            returned straight away instead of being retried. Shorter `Retry-After` waits are always honoured.
+        budget: RetryBudget, optional
+            If given, a retry is only sent while the budget has a token for it
+        unsent_only: bool, optional, default False
+            If True, only failures after which the app server cannot have processed the request are retried: the
+            errors for which `unsent` is True and the statuses of `statuses` that are also in `UNPROCESSED_STATUSES`.
+            Use it for writes that would be applied twice if sent again, such as creates.
+        """
+        assert (attempts > 0), "`attempts` must be greater than 0"
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses & UNPROCESSED_STATUSES if unsent_only else statuses
+        self.errors = errors
+        self.methods = methods
+        self.max_retry_after = max_retry_after
+        self.budget = budget
+        self.unsent_only = unsent_only
+        self.calls = 0
+        self.retries = 0
+        self.gave_up = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"RetryPolicy(attempts={self.attempts}, backoff={self.backoff}, max_backoff={self.max_backoff})"
+
+    def unsent(self) -> 'RetryPolicy':
+        """Returns a policy with the same settings and budget but `unsent_only` set, and counters of its own"""
+        return RetryPolicy(self.attempts, self.backoff, self.max_backoff, self.statuses, self.errors, self.methods,
+                           self.max_retry_after, self.budget, unsent_only=True)
+
+    def retryable(self, error: BaseException) -> bool:
+        """Returns True if a call that raised `error` may be retried"""
+        return isinstance(error, self.errors) and (not self.unsent_only or unsent(error))
+
+    def delay(self, attempt: int) -> float:
+        """Returns the number of seconds to wait before retrying after failed attempt number `attempt` (from 0)"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _next_delay(self, attempt: int, response=None) -> Union[float, None]:
+        """Returns how long to wait before retrying failed attempt number `attempt`, or None to stop retrying"""
+        if attempt + 1 >= self.attempts:
+            self._give_up()
+            return None
+        delay = self.delay(attempt)
+        if response is not None:
+            wait = retry_after(response)
+            if wait is not None:
+                if wait > self.max_retry_after:
+                    self._give_up()
+                    return None
+                delay = max(delay, wait)
+        if self.budget is not None and not self.budget.withdraw():
+            self._give_up()
+            return None
+        with self._lock:
+            self.retries += 1
+        return delay
+
+    def _start(self):
+        with self._lock:
+            self.calls += 1
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """
+        Returns `fn(*args, **kwargs)`, calling it again after a delay for as long as it raises one of `errors` or
+        returns a response with one of `statuses`, up to `attempts` times in all
+
+        Parameters
+        ----------
+        fn: callable, required
+            Sends the request and returns a response with a `status_code`
+        args, kwargs:
+            Passed on to `fn`
+        """
+        self._start()
+        attempt = 0
+        while True:
+            try:
+                response = fn(*args, **kwargs)
+            except self.errors as e:
+                delay = self._next_delay(attempt) if self.retryable(e) else None
+                if delay is None:
+                    raise
+                reason = type(e).__name__
+            else:
+                if response.status_code not in self.statuses:
+                    return response
+                delay = self._next_delay(attempt, response)
+                if delay is None:
+                    return response
+                reason = response.status_code
+                # release the connection of a response that is thrown away (it may be streaming)
+                close = getattr(response, 'close', None)
+                if close is not None:
+                    close()
+            self._log(fn, delay, reason, attempt)
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn: Callable, *args, **kwargs):
+        """The asyncio counterpart of `call`: returns `await fn(*args, **kwargs)`, retried the same way"""
+        self._start()
+        attempt = 0
+        while True:
+            try:
+                response = await fn(*args, **kwargs)
+            except self.errors as e:
+                delay = self._next_delay(attempt) if self.retryable(e) else None
+                if delay is None:
+                    raise
+                reason = type(e).__name__
+            else:
+                if response.status_code not in self.statuses:
+                    return response
+                delay = self._next_delay(attempt, response)
+                if delay is None:
+                    return response
+                reason = response.status_code
+            self._log(fn, delay, reason, attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _log(self, fn: Callable, delay: float, reason, attempt: int):
+        logging.debug(f"retrying {getattr(fn, '__name__', fn)} in {delay:.2f}s after {reason} "
+                      f"(attempt {attempt + 1} of {self.attempts})")
+
+    def _give_up(self):
+        with self._lock:
+            self.gave_up += 1
+
+    def stats(self) -> dict:
+        """Returns the number of calls made, retries sent, calls that still failed after their last attempt and
+        retries refused by the budget"""
+        return {'calls': self.calls,
+                'retries': self.retries,
+                'gave_up': self.gave_up,
+                'budget_exhausted': self.budget.exhausted if self.budget is not None else 0}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of sending a request to an endpoint whose circuit is open"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"circuit open for {endpoint}, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class _Circuit:
+    __slots__ = ('failures', 'opened_at', 'trial')
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+
+class CircuitBreaker:
+    def __init__(self,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0,
+                 statuses: frozenset = RETRY_STATUSES,
+                 depth: int = 3,
+                 ):
+        """
+        Keeps one circuit per endpoint. A circuit opens after `failure_threshold` failed requests in a row, and while
+        it is open requests to the endpoint raise `CircuitOpenError` without being sent. After `reset_timeout` seconds
+        one trial request is let through: if it succeeds the circuit closes, otherwise it opens again.
+
+        A request has failed if it raised one of `qnxt.retry.RETRY_ERRORS` or its status is one of `statuses`.
+
+        Parameters
+        ----------
+        failure_threshold: int, optional, default 5
+            The number of failures in a row that opens a circuit
+        reset_timeout: float, optional, default 30.0
+            The number of seconds a circuit stays open before a trial request
+        statuses: frozenset, optional, default RETRY_STATUSES
+            The HTTP statuses counted as failures
+        depth: int, optional, default 3
+            The number of path segments, from 'QNXTApi' on, that make an endpoint, e.g. 'QNXTApi/Benefit/benefits'
+            (see `qnxt.utils.clean_url.resource_path`)
+        """
+        assert (failure_threshold > 0), "`failure_threshold` must be greater than 0"
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.statuses = statuses
+        self.depth = depth
+        self.rejected = 0
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"CircuitBreaker(failure_threshold={self.failure_threshold}, reset_timeout={self.reset_timeout})"
+
+    def endpoint(self, uri: str) -> str:
+        """Returns the endpoint `uri` belongs to"""
+        return clean_url.resource_path(uri, self.depth)
+
+    def before(self, uri: str) -> Tuple[str, bool]:
+        """
+        Returns (the endpoint of `uri`, whether the request is the trial of an open circuit) if a request to it may be
+        sent now, otherwise raises `CircuitOpenError`. Every request let through must end in `record`, or, if it was
+        the trial and ended without a verdict on the endpoint (e.g. it was never sent), in `release`.
+        """
+        endpoint = self.endpoint(uri)
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None or circuit.opened_at is None:
+                return endpoint, False
+            retry_in = circuit.opened_at + self.reset_timeout - time.monotonic()
+            if retry_in <= 0 and not circuit.trial:
+                circuit.trial = True
+                return endpoint, True
+            self.rejected += 1
+        raise CircuitOpenError(endpoint, max(retry_in, 0.0))
+
+    def release(self, endpoint: str):
+        """Give back the trial `before` granted for `endpoint`, so the next request becomes the trial instead, without
+        counting a success or a failure. Otherwise the circuit would stay open for good."""
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is not None:
+                circuit.trial = False
+
+    def record(self, endpoint: str, failed: bool):
+        """Record the outcome of a request to `endpoint` let through by `before`"""
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if not failed:
+                if circuit is not None:
+                    del self._circuits[endpoint]
+                return
+            if circuit is None:
+                circuit = self._circuits[endpoint] = _Circuit()
+            circuit.failures += 1
+            if circuit.trial or circuit.failures >= self.failure_threshold:
+                if circuit.opened_at is None:
+                    logging.warning(f"circuit opened for {endpoint} after {circuit.failures} failures")
+                circuit.opened_at = time.monotonic()
+                circuit.trial = False
+
+    def record_error(self, endpoint: str, trial: bool, error: BaseException = None):
+        """Record a request to `endpoint` let through by `before` that raised `error` while being sent, as a failure
+        if the error counts as one. A request that raised before it was sent (`error` None, e.g. the rate limiter or
+        the header factory raised) or for a reason that says nothing about the endpoint gives back its `trial`."""
+        if error is not None and self.failed(error=error):
+            self.record(endpoint, True)
+        elif trial:
+            self.release(endpoint)
+
+    def failed(self, response=None, error: BaseException = None) -> bool:
+        """Returns True if a request that returned `response` or raised `error` counts as a failure"""
+        if error is not None:
+            return isinstance(error, RETRY_ERRORS)
+        return response.status_code in self.statuses
+
+    def stats(self) -> dict:
+        """Returns the endpoints whose circuit is open and the number of requests rejected without being sent"""
+        with self._lock:
+            return {'open': sorted(endpoint for endpoint, circuit in self._circuits.items()
+                                   if circuit.opened_at is not None),
+                    'rejected': self.rejected}
@@ -1 +1 @@
-__all__ = ['clean_url', 'dateutil']
\ No newline at end of file
+__all__ = ['clean_url', 'columnar', 'dateutil', 'filelock', 'paginate', 'singleflight', 'timing']
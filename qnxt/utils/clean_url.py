@@ -1,3 +1,6 @@
+from urllib.parse import urlsplit
+
+
 def clean_url(app_server, base_path) -> str:
     """
     Pass the FQDN of the app server and a base path for the API endpoint, returns the FQDN and base path in the proper
@@ -20,3 +23,22 @@ def clean_url(app_server, base_path) -> str:
     else:
         base_url = f"{app_server}/{base_path}"
     return base_url
+
+
+def resource_path(uri: str, depth: int = 2) -> str:
+    """
+    Returns the first `depth` segments of the path of `uri` from 'QNXTApi' on, e.g. 'QNXTApi/CallTracking' for
+    'http://app_server/QNXTApi/CallTracking/calls/123' with `depth` 2, or 'QNXTApi/CallTracking/calls' with `depth` 3.
+    IDs further down the path are left out, so every request to the same resource gets the same path.
+
+    Parameters
+    ----------
+    uri: str, required
+        The full URI of an endpoint
+    depth: int, optional, default 2
+        The number of path segments kept
+    """
+    segments = [segment for segment in urlsplit(uri).path.split('/') if segment]
+    lowered = [segment.lower() for segment in segments]
+    start = lowered.index('qnxtapi') if 'qnxtapi' in lowered else 0
+    return '/'.join(segments[start:start + depth])
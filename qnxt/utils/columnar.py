@@ -0,0 +1,325 @@
+"""Build columnar data (Arrow record batches, a pandas DataFrame or a NumPy structured array) straight from search
+results, without going through one Python row at a time. Every function accepts a `Response`, a `StreamingResponse`,
+a list or iterator of records (dicts or `qnxt.api.Records` instances), or an iterable of pages such as
+`qnxt.utils.paginate.iter_pages`. Column types are inferred from the first `sample` records, ISO date strings are
+parsed in one vectorized step per batch and repeated strings are dictionary-encoded. A column with a value that does
+not fit the type inferred from the sample is widened to strings rather than failing the export.
+
+pyarrow, pandas and numpy are optional and only imported when the matching function is called.
+
+Examples
+--------
+>>> logs = PlanIntegration.ApplicationLogs(client, header_factory)
+>>> frame = columnar.to_pandas(paginate.iter_pages(logs.search, level='Error', page_size=1000, prefetch=4))
+"""
+
+import importlib
+import itertools
+import json
+import re
+from operator import itemgetter
+from datetime import datetime, timezone
+from typing import Iterator
+
+BOOL, INT, FLOAT, STRING, CATEGORY, OBJECT = 'bool', 'int', 'float', 'string', 'category', 'object'
+# date strings without and with a zone designator; the latter are normalized to UTC
+DATETIME, DATETIME_UTC = 'datetime', 'datetime_utc'
+# the Python classes a value of each numeric or boolean kind may have
+CLASSES = {BOOL: (bool,), INT: (int,), FLOAT: (int, float)}
+
+ISO_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}:?\d{2})?$')
+ISO_ZONE = re.compile(r'(Z|[+-]\d{2}:?\d{2})$')
+
+
+def _import(name: str):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        raise ImportError(f"This export requires the {name} package, install it with `pip install {name}`") from None
+
+
+def _kind(values: list, dictionary_threshold: float) -> str:
+    """Returns the column kind of a sample of values"""
+    types = {type(v) for v in values if v is not None}
+    if not types:
+        return OBJECT
+    if types == {bool}:
+        return BOOL
+    if types == {int}:
+        return INT
+    if types <= {int, float}:
+        return FLOAT
+    if types == {str}:
+        present = [v for v in values if v is not None]
+        if all(ISO_DATE.match(v) for v in present):
+            return DATETIME_UTC if any(ISO_ZONE.search(v) for v in present) else DATETIME
+        if len(set(present)) <= len(present) * dictionary_threshold:
+            return CATEGORY
+        return STRING
+    return OBJECT
+
+
+def infer_schema(records: list, dictionary_threshold: float = 0.5) -> dict:
+    """
+    Returns {column name: kind} for a sample of records, in the order the columns are first seen
+
+    Parameters
+    ----------
+    records: list, required
+        A sample of records (dicts or `qnxt.api.Records` instances)
+    dictionary_threshold: float, optional, default 0.5
+        A string column is dictionary-encoded when it has at most this many distinct values per value
+    """
+    names = dict.fromkeys(key for record in records for key in _keys(record))
+    return {name: _kind([record.get(name) for record in records], dictionary_threshold) for name in names}
+
+
+def _is_record(item) -> bool:
+    """True for a dict or a `qnxt.api.Records` record, False for a page of them"""
+    return isinstance(item, dict) or hasattr(item, 'FIELDS')
+
+
+def _keys(record) -> Iterator[str]:
+    """Returns the field names of a dict, or of a `qnxt.api.Records` record including its `extra` fields"""
+    if isinstance(record, dict):
+        return iter(record)
+    return itertools.chain(record.FIELDS, record.extra or ())
+
+
+def _pages(data, batch_size: int) -> Iterator[list]:
+    """Normalize the supported inputs into an iterator of lists of records"""
+    if isinstance(getattr(type(data), 'results', None), property):
+        data = data.results
+    if isinstance(data, list) and (not data or _is_record(data[0])):
+        yield data
+        return
+    items = iter(data)
+    first = next(items, None)
+    if first is None:
+        return
+    items = itertools.chain([first], items)
+    if _is_record(first):
+        while True:
+            page = list(itertools.islice(items, batch_size))
+            if not page:
+                return
+            yield page
+    else:
+        yield from items
+
+
+def _sampled(data, sample: int, batch_size: int, dictionary_threshold: float) -> tuple:
+    """Buffer the first pages until `sample` records are seen, infer the schema and return it with all the pages"""
+    pages = _pages(data, batch_size)
+    buffered, rows = [], 0
+    for page in pages:
+        buffered.append(page)
+        rows += len(page)
+        if rows >= sample:
+            break
+    schema = infer_schema([r for page in buffered for r in page][:sample], dictionary_threshold)
+    return schema, itertools.chain(buffered, pages)
+
+
+def _columns(page: list, names: list) -> list:
+    """Returns one list of values per name in `names`"""
+    columns = []
+    for name in names:
+        try:
+            columns.append(list(map(itemgetter(name), page)))
+        except KeyError:
+            columns.append([record.get(name) for record in page])
+    return columns
+
+
+def _json_text(values: list) -> list:
+    """Nested objects and mixed types are kept as their JSON text in Arrow"""
+    return [v if v is None or isinstance(v, str) else json.dumps(v) for v in values]
+
+
+def _fits(values: list, classes: tuple) -> bool:
+    """True if every value that is not None is exactly of one of `classes` (so a bool does not pass for an int)"""
+    return all(v is None or v.__class__ in classes for v in values)
+
+
+def _widened(values: list, parsed: list) -> bool:
+    """True if a value was lost converting `values` to `parsed`, so the column has to be widened to strings"""
+    return any(p is None and v is not None for v, p in zip(values, parsed))
+
+
+def _parse_dates(values: list, utc: bool = False) -> list:
+    """Slow path for date strings the vectorized parsers reject; unparseable values become None. Zoned values are
+    converted to UTC, and returned as aware datetimes if `utc` is True and naive ones otherwise"""
+    parsed = []
+    for v in values:
+        try:
+            value = datetime.fromisoformat(v.replace('Z', '+00:00'))
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc)
+                if not utc:
+                    value = value.replace(tzinfo=None)
+            elif utc:
+                value = value.replace(tzinfo=timezone.utc)
+            parsed.append(value)
+        except (AttributeError, TypeError, ValueError):
+            parsed.append(None)
+    return parsed
+
+
+def arrow_batches(data, sample: int = 1000, batch_size: int = 10000, dictionary_threshold: float = 0.5) -> tuple:
+    """
+    Returns (schema, iterator of pyarrow.RecordBatch), one batch per page, with the schema inferred from the first
+    `sample` records. Columns that only appear after the sample are not included. A column with a value that does not
+    fit its inferred type (e.g. a string in an integer column) is widened to strings in that batch, so its type can
+    differ from `schema`; `to_arrow` widens it in every batch.
+
+    Parameters
+    ----------
+    data: required
+        A Response, a StreamingResponse, records or pages of records
+    sample: int, optional, default 1000
+        The number of records the column types are inferred from
+    batch_size: int, optional, default 10000
+        The number of records per batch when `data` is a flat iterator of records
+    dictionary_threshold: float, optional, default 0.5
+        A string column is dictionary-encoded when it has at most this many distinct values per value
+    """
+    pa = _import('pyarrow')
+    kinds, pages = _sampled(data, sample, batch_size, dictionary_threshold)
+    types = {BOOL: pa.bool_(), INT: pa.int64(), FLOAT: pa.float64(), STRING: pa.string(), OBJECT: pa.string(),
+             CATEGORY: pa.dictionary(pa.int32(), pa.string()), DATETIME: pa.timestamp('ms'),
+             DATETIME_UTC: pa.timestamp('ms', tz='UTC')}
+    schema = pa.schema([(name, types[kind]) for name, kind in kinds.items()])
+
+    mismatch = (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError)
+
+    def array(kind: str, values: list):
+        if kind == CATEGORY:
+            try:
+                return pa.array(values, pa.string()).dictionary_encode()
+            except mismatch:
+                return pa.array(_json_text(values), pa.string()).dictionary_encode()
+        if kind in (DATETIME, DATETIME_UTC):
+            try:
+                return pa.array(values, pa.string()).cast(types[kind])
+            except mismatch:
+                parsed = _parse_dates(values, kind == DATETIME_UTC)
+                if not _widened(values, parsed):
+                    return pa.array(parsed, types[kind])
+        elif kind in CLASSES and _fits(values, CLASSES[kind]):
+            # checked up front, because pyarrow silently truncates e.g. a float in an integer column
+            try:
+                return pa.array(values, types[kind])
+            except mismatch:
+                pass
+        return pa.array(_json_text(values), pa.string())
+
+    def batches():
+        for page in pages:
+            arrays = [array(kind, values) for kind, values in zip(kinds.values(), _columns(page, list(kinds)))]
+            yield pa.RecordBatch.from_arrays(arrays, names=list(kinds))
+
+    return schema, batches()
+
+
+def to_arrow(data, sample: int = 1000, batch_size: int = 10000, dictionary_threshold: float = 0.5):
+    """Returns a pyarrow.Table of `data`. Takes the same parameters as `arrow_batches`"""
+    pa = _import('pyarrow')
+    schema, batches = arrow_batches(data, sample, batch_size, dictionary_threshold)
+    batches = list(batches)
+    # a column widened to strings in any batch is widened in all of them, so the batches share one schema
+    for batch in batches:
+        for i, field in enumerate(batch.schema):
+            if field.type != schema.field(i).type:
+                schema = schema.set(i, pa.field(field.name, pa.string()))
+    batches = [batch if batch.schema.equals(schema) else
+               pa.RecordBatch.from_arrays([column if column.type == field.type else _as_string(pa, column)
+                                           for column, field in zip(batch.columns, schema)], schema=schema)
+               for batch in batches]
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+def _as_string(pa, column):
+    """Casts an Arrow column to strings, decoding a dictionary-encoded one first"""
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    return column.cast(pa.string())
+
+
+def _collect(data, sample: int, batch_size: int, dictionary_threshold: float) -> tuple:
+    """Returns the schema and {name: list of values} for every record, releasing each page once it is copied"""
+    kinds, pages = _sampled(data, sample, batch_size, dictionary_threshold)
+    columns = {name: [] for name in kinds}
+    for page in pages:
+        for name, values in zip(kinds, _columns(page, list(kinds))):
+            columns[name].extend(values)
+    return kinds, columns
+
+
+def to_pandas(data, sample: int = 1000, batch_size: int = 10000, dictionary_threshold: float = 0.5):
+    """
+    Returns a pandas.DataFrame of `data`, converted from `to_arrow` so the records are never copied into Python lists.
+    Integer and boolean columns use the nullable pandas dtypes (Int64 and boolean), dates become datetime64 (UTC if
+    the strings carry a zone), dictionary-encoded strings become categoricals and other strings are objects. Requires
+    pyarrow as well as pandas. Takes the same parameters as `arrow_batches`.
+    """
+    pd = _import('pandas')
+    pa = _import('pyarrow')
+    table = to_arrow(data, sample, batch_size, dictionary_threshold)
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype(), pa.bool_(): pd.BooleanDtype()}.get)
+
+
+def _numpy_column(np, kind: str, values: list):
+    """Returns the NumPy array of one column, or None if a value does not fit `kind`"""
+    if kind in CLASSES and not _fits(values, CLASSES[kind]):
+        return None
+    if kind == INT:
+        if None in values:
+            return np.array([np.nan if v is None else v for v in values], dtype='f8')
+        return np.array(values, dtype='i8')
+    if kind == FLOAT:
+        return np.array([np.nan if v is None else v for v in values], dtype='f8')
+    if kind == BOOL:
+        return np.array(values, dtype='O' if None in values else '?')
+    if kind in (DATETIME, DATETIME_UTC):
+        if not _fits(values, (str,)):
+            return None
+        if kind == DATETIME:
+            try:
+                return np.array(['NaT' if v is None else v for v in values], dtype='M8[ms]')
+            except ValueError:
+                pass
+        parsed = _parse_dates(values)
+        if _widened(values, parsed):
+            return None
+        return np.array(['NaT' if v is None else v for v in parsed], dtype='M8[ms]')
+    if kind == CATEGORY:
+        shared = {}
+        return np.fromiter((shared.setdefault(v, v) if v.__class__ is str else v for v in values), dtype='O',
+                           count=len(values))
+    # fromiter keeps nested lists as single objects instead of adding dimensions
+    return np.fromiter(values, dtype='O', count=len(values))
+
+
+def to_numpy(data, sample: int = 1000, batch_size: int = 10000, dictionary_threshold: float = 0.5):
+    """
+    Returns a NumPy structured array of `data`. Integer columns with missing values become float64 (NaN), boolean
+    columns with missing values stay objects, dates become datetime64[ms] in UTC and every string column is an object
+    column in which repeated strings share a single object. A column with a value that does not fit its inferred type
+    is kept as an object column of the original values. Takes the same parameters as `arrow_batches`.
+    """
+    np = _import('numpy')
+    kinds, columns = _collect(data, sample, batch_size, dictionary_threshold)
+    arrays = {}
+    for name, kind in kinds.items():
+        values = columns.pop(name)
+        try:
+            array = _numpy_column(np, kind, values)
+        except (TypeError, ValueError, OverflowError):
+            array = None
+        arrays[name] = array if array is not None else np.fromiter(values, dtype='O', count=len(values))
+    size = len(next(iter(arrays.values()))) if arrays else 0
+    result = np.empty(size, dtype=[(name, array.dtype) for name, array in arrays.items()])
+    for name, array in arrays.items():
+        result[name] = array
+    return result
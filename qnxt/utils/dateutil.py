@@ -22,3 +22,24 @@ def dateformat(as_of: Union[date, datetime, str]) -> str:
         as_of = as_of.strftime(fmt='%Y-%m-%d')
 
     return as_of
+
+
+def to_datetime(value: Union[date, datetime, str]) -> datetime:
+    """Pass either a datetime/date object or a string in ISO format and get a datetime back. Dates become midnight of
+    that day
+
+    Parameters
+    ----------
+    value: [date, datetime, str], required
+        A date, datetime or str object representing a date or a date and time
+
+    Returns
+    -------
+    value: datetime
+        The same point in time as a datetime object
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(value)
@@ -0,0 +1,96 @@
+import getpass
+import os
+import stat
+import tempfile
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# opening a file with O_NOFOLLOW fails if it is a symlink, so a planted link cannot redirect a read or write
+O_NOFOLLOW = getattr(os, 'O_NOFOLLOW', 0)
+
+
+def private_directory(path: str = None, name: str = None) -> str:
+    """
+    Returns `path`, or a per-user directory called `name` in the system temp dir, after making sure that only the
+    current user can get at it: it is created with 0700 permissions if it does not exist, and an existing one must be
+    a real directory (not a symlink) owned by the current user and not accessible to group or others.
+
+    Parameters
+    ----------
+    path: str, optional
+        The directory
+    name: str, optional
+        The name of the default directory used when `path` is None. The user is appended to it, e.g.
+        /tmp/qnxt-tokens-1000, so different users never share it.
+
+    Raises
+    ------
+    PermissionError
+        If the directory is a symlink, belongs to another user or is accessible to other users
+    """
+    if path is None:
+        owner = os.getuid() if hasattr(os, 'getuid') else getpass.getuser()
+        path = os.path.join(tempfile.gettempdir(), f"{name}-{owner}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+    if hasattr(os, 'getuid'):
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"{path} is owned by another user")
+        if info.st_mode & 0o077:
+            raise PermissionError(f"{path} is accessible to other users, restrict it with `chmod 700`")
+    return path
+
+
+class FileLock:
+    def __init__(self, path: str):
+        """
+        An exclusive, blocking, cross-process lock held on `path` for the duration of a `with` block. The lock file is
+        created if it does not exist and is left in place afterwards.
+
+        Parameters
+        ----------
+        path: str, required
+            Path of the lock file
+
+        Examples
+        --------
+        >>> with FileLock('/tmp/qnxt.lock'):
+        ...     pass
+        """
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | O_NOFOLLOW, 0o600)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 seconds, keep waiting like flock does
+                    continue
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
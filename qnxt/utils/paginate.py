@@ -0,0 +1,283 @@
+import inspect
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterator, Union
+
+import requests
+
+from qnxt.utils.dateutil import to_datetime
+
+# keys of `processMetadata` that may carry the size of the whole result set
+TOTAL_KEYS = ('totalCount', 'totalRecords', 'recordCount', 'total')
+
+
+def _fetch(search: Callable, args: tuple, kwargs: dict, skip: int, take: int) -> tuple:
+    """Returns the 'results' of one page and the total size of the result set, if the response reports it"""
+    response = search(*args, skip=skip, take=take, **kwargs)
+    if inspect.isawaitable(response):
+        if inspect.iscoroutine(response):
+            response.close()
+        raise TypeError(f"{getattr(search, '__name__', search)} is bound to a qnxt.aio.AsyncClient; the paging and "
+                        f"scanning helpers need a qnxt.client.Client, with an AsyncClient await the search for each "
+                        f"page instead, e.g. with asyncio.gather")
+    page = response.results
+    if page is None:
+        raise requests.HTTPError(f"{getattr(search, '__name__', search)} returned no results at skip={skip}")
+    return page, total_count(response)
+
+
+def total_count(response) -> Union[int, None]:
+    """Returns the total number of records of a paged search from its `processMetadata`, or None if it is not there"""
+    body = response.json
+    metadata = body.get('processMetadata') if isinstance(body, dict) else None
+    if isinstance(metadata, dict):
+        for key in TOTAL_KEYS:
+            if isinstance(metadata.get(key), int):
+                return metadata[key]
+    return None
+
+
+def iter_pages(search: Callable, *args, page_size: int = 100, max_records: int = None, skip: int = 0,
+               prefetch: int = 0, **kwargs) -> Iterator[list]:
+    """
+    Call `search` with increasing `skip` offsets and yield the 'results' list of each page until a short page comes
+    back or `max_records` records have been yielded. Only one page is held at a time.
+
+    Parameters
+    ----------
+    search: callable, required
+        Any API method that takes `skip` and `take` and returns a `qnxt.api.Response.Response`
+    page_size: int, optional, default 100
+        The `take` value of each request
+    max_records: int, optional
+        Stop after this many records. By default every record is returned.
+    skip: int, optional, default 0
+        The offset of the first record
+    prefetch: int, optional, default 0
+        If greater than 0, once the first page is back up to `prefetch` further pages are kept in flight on a thread
+        pool, and pages are still yielded in order. The offsets are bounded by the total count in `processMetadata`
+        when the server reports one; otherwise pages are requested speculatively until a short page comes back. Use a
+        `qnxt.client.Client` with `pool_maxsize` of at least `prefetch` so every page gets a warm connection.
+    args, kwargs:
+        Passed on to `search` unchanged
+
+    Raises
+    ------
+    requests.HTTPError
+        A page came back without a 'results' section, e.g. because the request failed
+    TypeError
+        `search` belongs to an API class built on a `qnxt.aio.AsyncClient`
+    """
+    assert (page_size > 0), "`page_size` must be greater than 0"
+    if prefetch > 0:
+        yield from _iter_pages_prefetch(search, args, kwargs, page_size, max_records, skip, prefetch)
+        return
+    remaining = max_records
+    while remaining is None or remaining > 0:
+        take = page_size if remaining is None else min(page_size, remaining)
+        page, _ = _fetch(search, args, kwargs, skip, take)
+        if page:
+            yield page
+        if len(page) < take:
+            return
+        skip += len(page)
+        if remaining is not None:
+            remaining -= len(page)
+        del page
+
+
+def _iter_pages_prefetch(search: Callable, args: tuple, kwargs: dict, page_size: int, max_records: Union[int, None],
+                         skip: int, prefetch: int) -> Iterator[list]:
+    end = None if max_records is None else skip + max_records
+    take = page_size if end is None else min(page_size, end - skip)
+    if take <= 0:
+        return
+    page, total = _fetch(search, args, kwargs, skip, take)
+    if page:
+        yield page
+    if len(page) < take:
+        return
+    if total is not None:
+        end = total if end is None else min(end, total)
+    next_skip = skip + len(page)
+    del page
+
+    inflight = deque()
+    with ThreadPoolExecutor(max_workers=prefetch) as pool:
+        def submit():
+            nonlocal next_skip
+            while len(inflight) < prefetch and (end is None or next_skip < end):
+                take = page_size if end is None else min(page_size, end - next_skip)
+                inflight.append((take, pool.submit(_fetch, search, args, kwargs, next_skip, take)))
+                next_skip += take
+
+        try:
+            submit()
+            while inflight:
+                take, future = inflight.popleft()
+                page, _ = future.result()
+                if page:
+                    yield page
+                if len(page) < take:
+                    # the end of the result set, anything requested past it is dropped
+                    return
+                del page
+                submit()
+        finally:
+            for _, future in inflight:
+                future.cancel()
+
+
+def paginate(search: Callable, *args, page_size: int = 100, max_records: int = None, skip: int = 0,
+             prefetch: int = 0, model: Callable = None, **kwargs) -> Iterator[dict]:
+    """
+    Lazily yield every record of a paged search. Memory stays flat however large the result set is, because each
+    page is released once its records have been consumed (and at most `prefetch` more are waiting). Takes the same
+    parameters as `iter_pages`, and `model`: if given, every record is converted with it as it is yielded, e.g. with
+    one of the compact `qnxt.api.Records` classes.
+
+    Examples
+    --------
+    >>> logs = PlanIntegration.ApplicationLogs(client, header_factory)
+    >>> for record in paginate(logs.search, level='Error', page_size=500, max_records=10000):
+    ...     print(record['referenceId'])
+    """
+    for page in iter_pages(search, *args, page_size=page_size, max_records=max_records, skip=skip, prefetch=prefetch,
+                           **kwargs):
+        yield from page if model is None else map(model, page)
+
+
+def _window_kwargs(kwargs: dict, params: tuple, window: tuple) -> dict:
+    """Returns `kwargs` with the two date parameters named in `params` set to the bounds of `window`"""
+    start, stop = window
+    return {**kwargs,
+            params[0]: start.isoformat(timespec='seconds'),
+            params[1]: stop.isoformat(timespec='seconds')}
+
+
+def _scan_window(search: Callable, args: tuple, kwargs: dict, params: tuple, window: tuple, window_limit: int,
+                 min_window: timedelta, first: tuple = None) -> tuple:
+    """Returns (records, None) with every record of one time window, or (None, halves) if the window holds more than
+    `window_limit` records and splitting it narrows the search, where `halves` pairs each half of the window with its
+    first page. `first` is the first page of the window and its total, if it has already been fetched."""
+    start, stop = window
+    window_kwargs = _window_kwargs(kwargs, params, window)
+    records, total = first if first is not None else _fetch(search, args, window_kwargs, 0, window_limit)
+    dense = len(records) >= window_limit or (total is not None and total > window_limit)
+    if dense and stop - start > min_window:
+        mid = start + (stop - start) / 2
+        halves = [(half, _fetch(search, args, _window_kwargs(kwargs, params, half), 0, window_limit))
+                  for half in ((start, mid), (mid, stop))]
+        # a server that filters on a coarser unit than the window (e.g. whole days) answers both halves exactly as it
+        # answered the window, and splitting again would only repeat the same search down to `min_window`
+        if any(half_first != (records, total) for _, half_first in halves):
+            return None, halves
+    if len(records) >= window_limit:
+        # the window cannot be narrowed any further, so page through the rest of it
+        for page in iter_pages(search, *args, page_size=window_limit, skip=len(records), **window_kwargs):
+            records.extend(page)
+    return records, None
+
+
+def scan(search: Callable,
+         date_from: Union[date, datetime, str],
+         date_to: Union[date, datetime, str],
+         *args,
+         params: tuple = ('utc_date_from', 'utc_date_to'),
+         key: str = None,
+         windows: int = 8,
+         workers: int = 8,
+         window_limit: int = 1000,
+         min_window: timedelta = timedelta(minutes=1),
+         **kwargs
+         ) -> Iterator[dict]:
+    """
+    Scan a date range of a search by splitting it into `windows` sub-windows that are fetched in parallel, instead of
+    paging ever deeper through one result set. A window that comes back with `window_limit` records or more is split
+    in half and both halves are fetched again, so no request ever pages deep unless a window narrower than
+    `min_window` is still too dense, or splitting it does not narrow the search because the server filters dates more
+    coarsely than the window. Records are yielded as their windows complete, not in date order.
+
+    Parameters
+    ----------
+    search: callable, required
+        Any API method that takes `skip`, `take` and the two date parameters named in `params`
+    date_from: [date, datetime, str], required
+        The start of the range. Dates are taken as midnight.
+    date_to: [date, datetime, str], required
+        The end of the range. Dates are taken as midnight.
+    params: tuple, optional, default ('utc_date_from', 'utc_date_to')
+        The names of the keyword arguments of `search` that bound each window
+    key: str, optional
+        If given, records are deduplicated on this field within each window and between two windows sharing a
+        boundary. Only the keys of windows whose neighbour is still being fetched are kept, so memory does not grow
+        with the size of the scan.
+    windows: int, optional, default 8
+        The number of windows the range is split into up front
+    workers: int, optional, default 8
+        The number of windows fetched concurrently. Use a `qnxt.client.Client` with `pool_maxsize` of at least
+        `workers`.
+    window_limit: int, optional, default 1000
+        The `take` value of each window request, and the number of records above which a window is split
+    min_window: datetime.timedelta, optional, default 1 minute
+        Windows are never split below this width; a window that is still too dense is paged through instead
+    args, kwargs:
+        Passed on to `search` unchanged
+    """
+    assert (windows > 0 and workers > 0 and window_limit > 0), "`windows`, `workers` and `window_limit` must be > 0"
+    start, stop = to_datetime(date_from), to_datetime(date_to)
+    step = (stop - start) / windows
+    bounds = [start + step * i for i in range(windows)] + [stop]
+    # the keys of the finished window on one side of each boundary, until the window on its other side finishes
+    neighbours = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(window, first=None):
+            future = pool.submit(_scan_window, search, args, kwargs, params, window, window_limit, min_window, first)
+            inflight[future] = window
+
+        inflight = {}
+        for window in zip(bounds[:-1], bounds[1:]):
+            submit(window)
+        try:
+            while inflight:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    lo, hi = inflight.pop(future)
+                    records, halves = future.result()
+                    if halves is not None:
+                        for half, first in halves:
+                            submit(half, first)
+                        continue
+                    if key is not None:
+                        records = _unseen(records, key, lo, hi, start, stop, neighbours)
+                    yield from records
+                    del records
+        finally:
+            for future in inflight:
+                future.cancel()
+
+
+def _unseen(records: list, key: str, lo: datetime, hi: datetime, start: datetime, stop: datetime,
+            neighbours: dict) -> list:
+    """Returns the records of the finished window (lo, hi) whose `key` has not been seen in the window itself or in a
+    finished neighbouring window, and updates `neighbours`, the keys kept for each boundary"""
+    earlier = neighbours.get(lo, ())
+    later = neighbours.get(hi, ())
+    keys = set()
+    unseen = []
+    for record in records:
+        value = record.get(key)
+        if value is not None:
+            if value in keys or value in earlier or value in later:
+                continue
+            keys.add(value)
+        unseen.append(record)
+    for bound in (lo, hi):
+        if bound in neighbours:
+            # the windows on both sides of this boundary have finished
+            del neighbours[bound]
+        elif bound != start and bound != stop:
+            neighbours[bound] = keys
+    return unseen
@@ -0,0 +1,121 @@
+"""Single-flight call coalescing: while a call for a key is in flight, other callers asking for the same key wait for
+it and share its result instead of making the same call again.
+
+Only results are shared. If the call raises, the exception goes to its own caller only, and every caller that was
+waiting on it makes its own call instead, so no caller ever sees an error raised on another caller's behalf (and
+its traceback).
+"""
+
+import asyncio
+import threading
+from typing import Callable, Hashable
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'failed')
+
+    def __init__(self, done):
+        self.done = done
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Coalesces concurrent calls with the same key across threads
+
+        Examples
+        --------
+        >>> flights = SingleFlight()
+        >>> flights.do(('GET', uri), session.get, uri)  # called once, however many threads ask at the same time
+        """
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"SingleFlight(calls={self.calls}, coalesced={self.coalesced})"
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        """
+        Returns `fn(*args, **kwargs)`, or the result of the call already in flight for `key`
+
+        Parameters
+        ----------
+        key: hashable, required
+            Calls with equal keys are taken to return the same result
+        fn: callable, required
+            The call to make
+        args, kwargs:
+            Passed on to `fn`
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight(threading.Event())
+                    self.calls += 1
+                    leader = True
+                else:
+                    leader = False
+            if leader:
+                return self._lead(key, flight, fn, args, kwargs)
+            flight.done.wait()
+            if not flight.failed:
+                with self._lock:
+                    self.coalesced += 1
+                return flight.result
+
+    def _lead(self, key: Hashable, flight: _Flight, fn: Callable, args: tuple, kwargs: dict):
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> dict:
+        """Returns the number of calls made and of calls saved by sharing an in-flight one"""
+        return {'calls': self.calls, 'coalesced': self.coalesced}
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        """Coalesces concurrent coroutine calls with the same key within one event loop, like `SingleFlight`"""
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+
+    def __repr__(self):
+        return f"AsyncSingleFlight(calls={self.calls}, coalesced={self.coalesced})"
+
+    async def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        """Returns `await fn(*args, **kwargs)`, or the result of the call already in flight for `key`"""
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(asyncio.Event())
+                self.calls += 1
+                try:
+                    flight.result = await fn(*args, **kwargs)
+                    return flight.result
+                except BaseException:
+                    flight.failed = True
+                    raise
+                finally:
+                    del self._flights[key]
+                    flight.done.set()
+            await flight.done.wait()
+            if not flight.failed:
+                self.coalesced += 1
+                return flight.result
+
+    def stats(self) -> dict:
+        """Returns the number of calls made and of calls saved by sharing an in-flight one"""
+        return {'calls': self.calls, 'coalesced': self.coalesced}
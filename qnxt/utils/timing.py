@@ -0,0 +1,90 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# connection set-up and per-leg times of the requests made by the current thread inside `measure`
+_local = threading.local()
+
+
+def _record(name: str, seconds: float):
+    samples = getattr(_local, name, None)
+    if samples is not None:
+        samples.append(seconds)
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _record('connect', time.perf_counter() - start)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # includes the TLS handshake
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _record('connect', time.perf_counter() - start)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """An HTTPAdapter that reports connection set-up and per-leg send times to `measure`"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
+
+    def send(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().send(request, *args, **kwargs)
+        finally:
+            _record('legs', time.perf_counter() - start)
+
+
+@contextmanager
+def measure():
+    """
+    Time the requests sent through a `TimedHTTPAdapter` by the current thread inside the `with` block. The yielded
+    dictionary is filled in when the block exits.
+
+    connect: seconds spent opening new TCP (and TLS) connections, 0 when pooled connections were reused
+    handshake: seconds spent on the authentication legs (e.g. NTLM negotiate/challenge) before the final response
+    total: wall-clock seconds of the whole block
+
+    Examples
+    --------
+    >>> with measure() as timing:
+    ...     session.get(uri, auth=auth)
+    >>> timing['total']
+    ...
+    """
+    timing = {}
+    _local.connect = []
+    _local.legs = []
+    start = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        timing['total'] = time.perf_counter() - start
+        timing['connect'] = sum(_local.connect)
+        timing['handshake'] = sum(_local.legs[:-1])
+        _local.connect = None
+        _local.legs = None
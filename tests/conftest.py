@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+
+class StubSTS:
+    """A local QnxtSTS stand-in that hands out numbered tokens after `delay` seconds"""
+
+    def __init__(self, delay: float = 0.05, expires_in: int = 3600):
+        self.delay = delay
+        self.expires_in = expires_in
+        self.fail = False
+        self.requests = 0
+        # the (host, port) of every client connection, to tell whether connections are reused
+        self.connections = set()
+        self._lock = threading.Lock()
+        sts = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with sts._lock:
+                    sts.requests += 1
+                    sts.connections.add(self.client_address)
+                    number = sts.requests
+                time.sleep(sts.delay)
+                if sts.fail:
+                    status, body = 500, {'error': 'server_error', 'error_description': 'STS unavailable'}
+                else:
+                    status, body = 200, {'access_token': f"token-{number}", 'token_type': 'Bearer',
+                                         'expires_in': sts.expires_in}
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# a request received by a StubAppServer; `query` maps each parameter to its list of values
+Request = namedtuple('Request', 'method path query headers')
+
+
+class StubAppServer:
+    """A local QNXT app server stand-in. Every request is passed to `handler(request)`, which returns (status, body)
+    or (status, body, headers); a body that is not bytes is sent as JSON. By default every request gets 200 and
+    {'results': []}."""
+
+    def __init__(self, handler=None):
+        self.handler = handler or (lambda request: (200, {'results': []}))
+        self.requests = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        app = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _answer(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                parts = urlsplit(self.path)
+                request = Request(self.command, parts.path, parse_qs(parts.query), dict(self.headers))
+                with app._lock:
+                    app.requests.append(request)
+                    app.connections.add(self.client_address)
+                status, body, *headers = app.handler(request)
+                content = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                headers = headers[0] if headers else {}
+                headers.setdefault('Content-Type', 'application/json')
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = _answer
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def app_server():
+    server = StubAppServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def sts():
+    server = StubSTS()
+    yield server
+    server.close()
@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from qnxt.aio import AsyncClient
+from qnxt.api import CallTracking
+from qnxt.ratelimit import RateLimiter
+from qnxt.retry import RetryPolicy
+
+APP_SERVER = 'http://qnxt_app_server.com'
+
+
+def _client(handler, **kwargs) -> AsyncClient:
+    """An AsyncClient whose requests are answered by `handler(request)` instead of an app server"""
+    client = AsyncClient(APP_SERVER, **kwargs)
+    client.session = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def _ok(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={'results': [{'callerId': 'C1'}]})
+
+
+class AsyncHeaders:
+    """A header factory with an `acall` coroutine, counting how it was called"""
+
+    def __init__(self):
+        self.calls = 0
+        self.acalls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {'Authorization': 'Bearer sync'}
+
+    async def acall(self):
+        self.acalls += 1
+        return {'Authorization': 'Bearer async'}
+
+
+def test_api_methods_return_awaitable_responses():
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return _ok(request)
+
+    async def main():
+        async with _client(handler) as client:
+            calls = CallTracking.CallResource(client, lambda: {'Authorization': 'Bearer token'})
+            return await calls.search_call_issues(memid='M1', status=None, take=10)
+
+    response = asyncio.run(main())
+    assert response.status_code == 200
+    assert response.results == [{'callerId': 'C1'}]
+    request, = sent
+    assert request.method == 'GET'
+    assert request.url.path == '/QNXTApi/CallTracking/callIssues/search'
+    # None parameters are dropped, the way requests drops them
+    assert dict(request.url.params) == {'memId': 'M1', 'take': '10'}
+    assert request.headers['Authorization'] == 'Bearer token'
+
+
+def test_failed_gets_are_retried_and_writes_are_not():
+    statuses = {'GET': [503, 200], 'POST': [503, 200]}
+
+    def handler(request):
+        return httpx.Response(statuses[request.method].pop(0), json={})
+
+    retry = RetryPolicy(attempts=3, backoff=0)
+
+    async def main():
+        async with _client(handler, retry=retry) as client:
+            uri = client.url('QNXTApi/CallTracking/calls')
+            return await client.get(uri, dict), await client.post(uri, dict)
+
+    get, post = asyncio.run(main())
+    assert get.status_code == 200
+    assert post.status_code == 503
+    assert retry.stats() == {'calls': 1, 'retries': 1, 'gave_up': 0, 'budget_exhausted': 0}
+
+
+def test_a_dropped_connection_is_retried():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError('refused', request=request)
+        return _ok(request)
+
+    async def main():
+        async with _client(handler, retry=RetryPolicy(attempts=2, backoff=0)) as client:
+            return await client.get(client.url('QNXTApi/CallTracking/calls'), dict)
+
+    assert asyncio.run(main()).status_code == 200
+    assert len(attempts) == 2
+
+
+def test_requests_wait_for_the_rate_limiter_without_blocking_the_loop():
+    limiter = RateLimiter({'QNXTApi/CallTracking': (20, 1)})
+
+    async def main():
+        async with _client(_ok, rate_limiter=limiter) as client:
+            uri = client.url('QNXTApi/CallTracking/calls')
+            ticks = []
+
+            async def tick():
+                # keeps running while the requests wait for their tokens
+                for _ in range(5):
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.01)
+
+            start = time.monotonic()
+            responses = await asyncio.gather(*(client.get(uri, dict) for _ in range(3)), tick())
+            return time.monotonic() - start, responses, ticks
+
+    elapsed, responses, ticks = asyncio.run(main())
+    assert [r.status_code for r in responses[:3]] == [200] * 3
+    assert len(ticks) == 5
+    # one token right away, then one every 50ms
+    assert elapsed >= 0.09
+    stats = limiter.stats()['QNXTApi/CallTracking']
+    assert stats['acquired'] == 3
+    assert stats['waited'] == 2
+    assert stats['wait_seconds'] == pytest.approx(0.15, abs=0.02)
+
+
+def test_header_factories_are_awaited_through_acall():
+    sent = []
+
+    def handler(request):
+        sent.append(request.headers['Authorization'])
+        return _ok(request)
+
+    header_factory = AsyncHeaders()
+
+    async def main():
+        async with _client(handler) as client:
+            calls = CallTracking.CallResource(client, header_factory)
+            await asyncio.gather(*(calls.get_call_details('C1') for _ in range(3)))
+
+    asyncio.run(main())
+    assert sent == ['Bearer async'] * 3
+    assert (header_factory.acalls, header_factory.calls) == (3, 0)
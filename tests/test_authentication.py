@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from qnxt.authentication import RequestHeader, TokenCache, basic_authentication
+
+
+def _storm(header_factory, threads: int = 64) -> list:
+    """Call `header_factory` from `threads` threads released at the same moment; returns the headers or exceptions"""
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def call(i):
+        barrier.wait()
+        try:
+            results[i] = header_factory()
+        except Exception as e:
+            results[i] = e
+
+    workers = [threading.Thread(target=call, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def test_cold_start_storm_fetches_one_token(sts):
+    header_factory = RequestHeader(sts.url, '1', basic_authentication('user', 'password'))
+    results = _storm(header_factory)
+    assert not [r for r in results if isinstance(r, Exception)]
+    assert sts.requests == 1
+    assert {r['Authorization'] for r in results} == {'Bearer token-1'}
+    header_factory.close()
+
+
+def test_expired_token_storm_refreshes_once(sts):
+    header_factory = RequestHeader(sts.url, '1', basic_authentication('user', 'password'), thresh=0)
+    assert header_factory()['Authorization'] == 'Bearer token-1'
+    # past the hard expiry, so every thread has to wait for the one refresh
+    header_factory.expiry -= 7200
+    header_factory.token['expires_at'] -= 7200
+    results = _storm(header_factory)
+    assert not [r for r in results if isinstance(r, Exception)]
+    assert sts.requests == 2
+    assert {r['Authorization'] for r in results} == {'Bearer token-2'}
+    header_factory.close()
+
+
+def test_soft_expired_token_is_served_during_refresh(sts):
+    header_factory = RequestHeader(sts.url, '1', basic_authentication('user', 'password'), thresh=300)
+    header_factory()
+    # inside the thresh window: the old token is still valid, so nobody waits for the refresh
+    header_factory.expiry -= 3400
+    results = _storm(header_factory)
+    assert not [r for r in results if isinstance(r, Exception)]
+    assert sts.requests == 2
+    assert {r['Authorization'] for r in results} <= {'Bearer token-1', 'Bearer token-2'}
+    assert header_factory()['Authorization'] == 'Bearer token-2'
+    header_factory.close()
+
+
+def test_headers_are_published_before_expiry(sts, tmp_path, monkeypatch):
+    cache = TokenCache(str(tmp_path))
+    store = cache.store
+
+    def slow_store(key, token):
+        time.sleep(0.2)
+        store(key, token)
+
+    monkeypatch.setattr(cache, 'store', slow_store)
+    header_factory = RequestHeader(sts.url, '1', basic_authentication('user', 'password'), token_cache=cache)
+    first = threading.Thread(target=header_factory)
+    first.start()
+    # callers arriving once the token has been fetched, but while it is still being stored, must never see a
+    # half-published token
+    time.sleep(sts.delay + 0.1)
+    results = _storm(header_factory, threads=8)
+    errors = [r for r in results if isinstance(r, Exception)]
+    first.join()
+    assert not errors
+    assert sts.requests == 1
+    header_factory.close()
+
+
+def test_acall_fetches_the_token_off_the_event_loop(sts):
+    header_factory = RequestHeader(sts.url, '1', basic_authentication('user', 'password'))
+
+    async def storm():
+        return await asyncio.gather(*(header_factory.acall() for _ in range(16)))
+
+    results = asyncio.run(storm())
+    assert sts.requests == 1
+    assert {r['Authorization'] for r in results} == {'Bearer token-1'}
+    header_factory.close()
+
+
+def test_background_refresh_does_not_spin_on_short_tokens(sts):
+    # tokens that expire within `thresh` are due for renewal the moment they arrive
+    sts.expires_in = 60
+    header_factory = RequestHeader(sts.url, '1', basic_authentication('user', 'password'), thresh=300)
+    header_factory.start_background_refresh(jitter=0, min_delay=0.5)
+    time.sleep(1.2)
+    header_factory.close()
+    assert sts.requests <= 4
+
+
+def test_stop_background_refresh_does_not_hang_on_the_sts(sts):
+    header_factory = RequestHeader(sts.url, '1', basic_authentication('user', 'password'), thresh=300,
+                                   timeout=(1, 1))
+    sts.expires_in = 60
+    header_factory.start_background_refresh(jitter=0, min_delay=0.1)
+    # the renewal is now stuck in a slow STS request
+    sts.delay = 3
+    time.sleep(0.3)
+    start = time.time()
+    header_factory.stop_background_refresh(timeout=0.5)
+    assert time.time() - start < 1
+    header_factory.session.close()
+
+
+def test_token_cache_rejects_a_directory_other_users_can_reach(tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        TokenCache(str(shared))
+    link = tmp_path / 'link'
+    private = tmp_path / 'private'
+    private.mkdir(mode=0o700)
+    link.symlink_to(private)
+    with pytest.raises(PermissionError):
+        TokenCache(str(link))
+    assert TokenCache(str(private)).directory == str(private)
+
+
+def test_token_cache_does_not_follow_planted_symlinks(tmp_path):
+    cache = TokenCache(str(tmp_path / 'tokens'))
+    key = TokenCache.key('sts', '1', 'user')
+    target = tmp_path / 'elsewhere.json'
+    target.write_text(json.dumps({'access_token': 'planted', 'expires_at': time.time() + 3600}))
+    os.symlink(target, os.path.join(cache.directory, f"{key}.json"))
+    assert cache.load(key) is None
+
+
+def test_token_refreshes_reuse_the_sts_connection(sts):
+    sts.delay = 0
+    header_factory = RequestHeader(sts.url, '1', basic_authentication('user', 'password'), thresh=0)
+    for i in range(1, 4):
+        assert header_factory()['Authorization'] == f"Bearer token-{i}"
+        if i == 1:
+            assert header_factory.last_sts_timing['connect'] > 0
+        else:
+            # a reused connection costs no set-up
+            assert header_factory.last_sts_timing['connect'] == 0
+        header_factory.expiry = 0
+    assert sts.requests == 3
+    assert len(sts.connections) == 1
+    header_factory.close()
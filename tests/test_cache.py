@@ -0,0 +1,135 @@
+import time
+
+from qnxt.api import Benefit
+from qnxt.authentication import RequestHeader, basic_authentication
+from qnxt.cache import CachedHTTPResponse, ResponseCache, SQLiteStore
+from qnxt.client import Client
+
+URI = 'http://qnxt_app_server.com/QNXTApi/Benefit/benefits/PLAN1'
+
+
+def test_the_key_is_scoped_to_the_user():
+    alice = RequestHeader('http://sts', '1', basic_authentication('alice', 'password'))
+    again = RequestHeader('http://sts', '1', basic_authentication('alice', 'rotated'))
+    bob = RequestHeader('http://sts', '1', basic_authentication('bob', 'password'))
+    assert ResponseCache.key('GET', URI, {'a': 1}, alice) == ResponseCache.key('GET', URI, {'a': 1}, again)
+    assert ResponseCache.key('GET', URI, {'a': 1}, alice) != ResponseCache.key('GET', URI, {'a': 1}, bob)
+
+
+def test_header_factories_that_do_not_name_a_user_never_share_a_key():
+    def headers():
+        return {'Authorization': 'Bearer a'}
+
+    assert ResponseCache.key('GET', URI, None, headers) == ResponseCache.key('GET', URI, None, headers)
+    assert ResponseCache.key('GET', URI, None, headers) != ResponseCache.key('GET', URI, None, lambda: {})
+
+
+def test_the_query_string_of_the_uri_is_part_of_the_key():
+    assert ResponseCache.key('GET', URI + '?asOf=2024-01-01', None, dict) != \
+        ResponseCache.key('GET', URI + '?asOf=2024-02-01', None, dict)
+    # the same request, whether the parameters were given in the URI or in `params`
+    assert ResponseCache.key('GET', URI + '?b=2&a=1', None, dict) == \
+        ResponseCache.key('GET', URI, {'a': 1, 'b': 2}, dict)
+    # the query string goes first, so repeated values are in the order they are sent
+    assert ResponseCache.key('GET', URI + '?a=1', {'a': 2}, dict) != \
+        ResponseCache.key('GET', URI + '?a=2', {'a': 1}, dict)
+
+
+class VersionedResource:
+    """An app server handler for one resource whose body changes with its version, honouring If-None-Match"""
+
+    def __init__(self):
+        self.version = 1
+
+    def __call__(self, request):
+        etag = f'"v{self.version}"'
+        if request.headers.get('If-None-Match') == etag:
+            return 304, b'', {'ETag': etag}
+        return 200, {'results': [{'benefitId': 'B1', 'version': self.version}]}, {'ETag': etag}
+
+
+def test_a_304_answers_with_the_cached_body(app_server):
+    app_server.handler = VersionedResource()
+    cache = ResponseCache(ttls={'QNXTApi/Benefit/*': 0})
+    with Client(app_server.url, cache=cache) as client:
+        benefits = Benefit.BenefitResource(client, dict)
+        first = benefits.get_benefit('PLAN1', 'B1')
+        second = benefits.get_benefit('PLAN1', 'B1')
+    assert [request.headers.get('If-None-Match') for request in app_server.requests] == [None, '"v1"']
+    assert second.status_code == 200
+    assert second.results == first.results == [{'benefitId': 'B1', 'version': 1}]
+    assert cache.stats()['revalidations'] == 1
+
+
+def test_a_changed_resource_replaces_the_cached_body(app_server):
+    resource = app_server.handler = VersionedResource()
+    cache = ResponseCache(ttls={'QNXTApi/Benefit/*': 0})
+    with Client(app_server.url, cache=cache) as client:
+        benefits = Benefit.BenefitResource(client, dict)
+        benefits.get_benefit('PLAN1', 'B1')
+        resource.version = 2
+        assert benefits.get_benefit('PLAN1', 'B1').results[0]['version'] == 2
+        assert benefits.get_benefit('PLAN1', 'B1').results[0]['version'] == 2
+    assert [request.headers.get('If-None-Match') for request in app_server.requests] == [None, '"v1"', '"v2"']
+    assert cache.stats()['revalidations'] == 1
+
+
+def test_a_fresh_response_is_not_revalidated(app_server):
+    app_server.handler = VersionedResource()
+    cache = ResponseCache(ttls={'QNXTApi/Benefit/*': 60})
+    with Client(app_server.url, cache=cache) as client:
+        benefits = Benefit.BenefitResource(client, dict)
+        for _ in range(3):
+            assert benefits.get_benefit('PLAN1', 'B1').results[0]['version'] == 1
+    assert len(app_server.requests) == 1
+    assert cache.stats()['hits'] == 2
+
+
+def _entry(ttl: float, etag: str = None, content: bytes = b'{"results": []}') -> CachedHTTPResponse:
+    now = time.time()
+    headers = {'ETag': etag} if etag else {}
+    return CachedHTTPResponse(200, 'OK', URI, headers, content, now, now + ttl)
+
+
+def test_sqlite_responses_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'responses.sqlite3')
+    store = SQLiteStore(path)
+    store.set('key', _entry(60, etag='"v1"'))
+    store.close()
+    entry = SQLiteStore(path).get('key')
+    assert (entry.content, entry.headers, entry.fresh()) == (b'{"results": []}', {'ETag': '"v1"'}, True)
+
+
+def test_expired_responses_are_dropped_unless_they_can_be_revalidated(tmp_path):
+    cache = ResponseCache(SQLiteStore(str(tmp_path / 'responses.sqlite3')))
+    cache.store.set('fresh', _entry(60))
+    cache.store.set('expired', _entry(-1))
+    cache.store.set('revalidate', _entry(-1, etag='"v1"'))
+    assert cache.get('fresh').fresh()
+    # a stale response is a miss, but it is only kept if it can be revalidated
+    assert cache.get('expired') is None and cache.store.get('expired') is None
+    assert cache.get('revalidate').validators() == {'If-None-Match': '"v1"'}
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+    cache.store.set('expired', _entry(-1))
+    assert cache.store.sweep() == 1
+    assert len(cache.store) == 2
+
+
+def test_a_sweep_evicts_the_least_recently_used_responses(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'responses.sqlite3'), max_entries=10, sweep_interval=1000)
+    for i in range(12):
+        store.set(f"key-{i}", _entry(60))
+    assert store.sweep() == 12 - 9
+    assert store.evictions == 3
+    assert sorted(int(key.split('-')[1]) for key, in store._connection().execute("SELECT key FROM responses")) == \
+        list(range(3, 12))
+
+
+def test_a_sweep_runs_every_sweep_interval_writes(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'responses.sqlite3'), sweep_interval=4)
+    for i in range(3):
+        store.set(f"expired-{i}", _entry(-1))
+    assert len(store) == 3
+    store.set('fresh', _entry(60))
+    assert len(store) == 1
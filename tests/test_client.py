@@ -0,0 +1,88 @@
+import pytest
+import requests
+
+from qnxt.api import Benefit, CallTracking
+from qnxt.client import Client, as_client
+from qnxt.retry import CircuitBreaker, CircuitOpenError
+
+URI = 'http://qnxt_app_server.com/QNXTApi/Benefit/benefits/PLAN1'
+
+
+def _ok(*args, **kwargs) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = URI
+    response._content = b'{}'
+    return response
+
+
+def _open_circuit(breaker: CircuitBreaker):
+    endpoint, _ = breaker.before(URI)
+    breaker.record(endpoint, True)
+    assert breaker.stats()['open'] == [endpoint]
+
+
+@pytest.mark.parametrize('stage', ['header_factory', 'rate_limiter'])
+def test_a_trial_that_fails_before_it_is_sent_is_given_back(monkeypatch, stage):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    client = Client('http://qnxt_app_server.com', breaker=breaker)
+    monkeypatch.setattr(client.session, 'request', _ok)
+    _open_circuit(breaker)
+
+    def boom(*args, **kwargs):
+        raise RuntimeError('STS unavailable')
+
+    if stage == 'rate_limiter':
+        client.rate_limiter = type('Limiter', (), {'acquire': staticmethod(boom)})()
+        header_factory = dict
+    else:
+        header_factory = boom
+    with pytest.raises(RuntimeError):
+        client.get(URI, header_factory)
+    client.rate_limiter = None
+    # the trial was given back, so the next request is let through as the trial and closes the circuit
+    assert client.get(URI, dict).status_code == 200
+    assert breaker.stats()['open'] == []
+
+
+def test_a_trial_that_fails_while_sent_reopens_the_circuit(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    client = Client('http://qnxt_app_server.com', breaker=breaker)
+
+    def refused(*args, **kwargs):
+        raise requests.ConnectionError('refused')
+
+    monkeypatch.setattr(client.session, 'request', refused)
+    with pytest.raises(requests.ConnectionError):
+        client.get(URI, dict)
+    with pytest.raises(CircuitOpenError):
+        client.get(URI, dict)
+
+
+def test_api_classes_sharing_a_client_reuse_its_connection(app_server):
+    client = Client(app_server.url)
+    calls = CallTracking.CallResource(client, dict)
+    benefits = Benefit.BenefitResource(client, dict)
+    assert calls.client is client and benefits.client is client
+    for _ in range(3):
+        assert calls.get_call_details('C1').status_code == 200
+        assert benefits.get_benefit('PLAN1', 'B1').status_code == 200
+    client.close()
+    assert [request.path for request in app_server.requests[:2]] == ['/QNXTApi/CallTracking/calls/C1/issues',
+                                                                       '/QNXTApi/Benefit/benefits/PLAN1/B1']
+    assert len(app_server.requests) == 6
+    assert len(app_server.connections) == 1
+
+
+def test_an_fqdn_gets_a_client_of_its_own(app_server):
+    calls = CallTracking.CallResource(app_server.url + '/', dict)
+    assert isinstance(calls.client, Client)
+    assert calls.client.app_server == app_server.url
+    assert as_client(calls.client) is calls.client
+
+
+def test_without_keep_alive_every_request_opens_a_connection(app_server):
+    with Client(app_server.url, keep_alive=False) as client:
+        for _ in range(3):
+            client.get(client.url('QNXTApi/Benefit/benefits/PLAN1'), dict)
+    assert len(app_server.connections) == 3
@@ -0,0 +1,37 @@
+import pytest
+
+from qnxt.api import Records
+from qnxt.utils import columnar
+
+pa = pytest.importorskip('pyarrow')
+
+
+def _logs(n: int) -> list:
+    return [{'referenceId': f"REF{i}", 'timeStamp': '2024-03-01T12:00:00', 'level': 'Error', 'loginId': i}
+            for i in range(n)]
+
+
+def test_a_value_that_does_not_fit_the_sample_widens_the_column():
+    late = [{'referenceId': 'REF-late', 'timeStamp': 'not a date', 'level': 'Warning', 'loginId': 'svc_batch'},
+            {'referenceId': 'REF-float', 'timeStamp': None, 'level': 'Error', 'loginId': 2.5}]
+    table = columnar.to_arrow(iter([_logs(10), late]), sample=10)
+    assert table.num_rows == 12
+    assert table.schema.field('loginId').type == pa.string()
+    assert table.column('loginId').to_pylist()[-2:] == ['svc_batch', '2.5']
+    assert table.column('timeStamp').to_pylist()[-2:] == ['not a date', None]
+
+
+def test_to_pandas_goes_through_arrow():
+    pytest.importorskip('pandas')
+    frame = columnar.to_pandas(_logs(5))
+    assert str(frame['loginId'].dtype) == 'Int64'
+    assert str(frame['level'].dtype) == 'category'
+    assert str(frame['timeStamp'].dtype).startswith('datetime64')
+
+
+def test_records_instances_are_accepted():
+    records = Records.ApplicationLog.from_results(_logs(5))
+    table = columnar.to_arrow(iter(records), batch_size=2)
+    assert table.num_rows == 5
+    assert table.column('loginId').to_pylist() == [0, 1, 2, 3, 4]
+    assert 'machineName' in table.schema.names
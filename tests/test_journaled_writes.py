@@ -0,0 +1,125 @@
+import json
+
+import pytest
+import requests
+
+from qnxt.api.PlanIntegration import JournaledWrites
+from qnxt.api.Response import Response
+from qnxt.client import Client
+from qnxt.journal import FailedWriteError, WriteJournal
+from qnxt.retry import RetryPolicy
+
+
+class StubClient:
+    """Answers each write with the next scripted outcome: a status code, or an exception to raise"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.sent = []
+
+    def url(self, base_path: str) -> str:
+        return f"http://qnxt_app_server.com/{base_path}"
+
+    def _answer(self, method: str, uri: str, params: dict) -> Response:
+        self.sent.append((method, uri, params))
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        http_response = requests.Response()
+        http_response.status_code = outcome
+        http_response.url = uri
+        http_response._content = json.dumps({'results': {'processLogDetailId': f"D{len(self.sent)}"}}).encode()
+        return Response(http_response)
+
+    def post(self, uri: str, header_factory, params: dict = None) -> Response:
+        return self._answer('POST', uri, params)
+
+    def put(self, uri: str, header_factory, params: dict = None) -> Response:
+        return self._answer('PUT', uri, params)
+
+
+class StubHeaders:
+    envid = '1'
+
+
+def _writes(client, tmp_path, journal: bool = True) -> JournaledWrites:
+    journal = WriteJournal(str(tmp_path / 'job.sqlite3')) if journal else None
+    return JournaledWrites(client, StubHeaders(), journal=journal, retry=RetryPolicy(attempts=3, backoff=0))
+
+
+def test_a_journaled_write_needs_a_key(tmp_path):
+    writes = _writes(StubClient(), tmp_path)
+    with pytest.raises(ValueError):
+        writes.create_process_logdetail(processlog_id='H1', referenceid='R1')
+    with pytest.raises(TypeError):
+        WriteJournal()
+
+
+def test_identical_writes_without_a_key_are_all_sent(tmp_path):
+    client = StubClient()
+    writes = _writes(client, tmp_path, journal=False)
+    for stage in ('STARTED', 'COMPLETED', 'STARTED'):
+        writes.update_process_logdetail(processlogdetail_id='D1', process_stage_id=stage)
+    writes.update_process_logdetail(processlogdetail_id='D1', process_stage_id='STARTED')
+    assert len(client.sent) == 4
+
+
+def test_a_keyed_write_is_sent_once_per_job(tmp_path):
+    client = StubClient()
+    writes = _writes(client, tmp_path)
+    first = writes.create_process_logdetail('R1/detail', processlog_id='H1', referenceid='R1')
+    again = writes.create_process_logdetail('R1/detail', processlog_id='H1', referenceid='R1')
+    assert first == again and len(client.sent) == 1
+
+
+def test_creates_are_only_retried_when_they_cannot_have_been_processed(tmp_path):
+    client = StubClient(503, 200)
+    writes = _writes(client, tmp_path)
+    assert writes.create_process_logdetail('R1/detail', processlog_id='H1') == 'D2'
+
+    client = StubClient(requests.ReadTimeout('read timed out'), 200)
+    writes = _writes(client, tmp_path)
+    with pytest.raises(requests.ReadTimeout):
+        writes.create_process_logdetail('R2/detail', processlog_id='H1')
+    assert len(client.sent) == 1
+    # it may have been created, so it is parked for review instead of being replayed
+    assert [key for key, _, _ in writes.journal.failed()] == ['R2/detail']
+    assert writes.replay() == 0 and len(client.sent) == 1
+
+    client = StubClient(500)
+    writes = _writes(client, tmp_path)
+    with pytest.raises(requests.HTTPError):
+        writes.create_process_logdetail('R3/detail', processlog_id='H1')
+    assert len(client.sent) == 1
+
+
+def test_a_failed_write_is_not_sent_again_on_a_rerun(tmp_path):
+    client = StubClient(requests.ReadTimeout('read timed out'), 200)
+    writes = _writes(client, tmp_path)
+    with pytest.raises(requests.ReadTimeout):
+        writes.create_process_logdetail('R2/detail', processlog_id='H1')
+
+    # the job is run again with the same journal
+    writes = _writes(client, tmp_path)
+    with pytest.raises(FailedWriteError) as raised:
+        writes.create_process_logdetail('R2/detail', processlog_id='H1')
+    assert raised.value.key == 'R2/detail' and 'ReadTimeout' in raised.value.error
+    assert len(client.sent) == 1
+
+    assert writes.journal.retry_failed() == 1
+    assert writes.create_process_logdetail('R2/detail', processlog_id='H1') == 'D2'
+    assert len(client.sent) == 2
+
+
+def test_a_client_that_retries_writes_is_rejected(tmp_path):
+    client = Client('http://qnxt_app_server.com', retry=RetryPolicy(methods=frozenset({'GET', 'POST'})))
+    with pytest.raises(ValueError):
+        _writes(client, tmp_path)
+    _writes(Client('http://qnxt_app_server.com', retry=RetryPolicy()), tmp_path)
+
+
+def test_updates_are_retried_after_a_server_error(tmp_path):
+    client = StubClient(500, requests.ReadTimeout('read timed out'), 200)
+    writes = _writes(client, tmp_path)
+    writes.update_process_logdetail('D1/stage', processlogdetail_id='D1', process_stage_id='COMPLETED')
+    assert len(client.sent) == 3
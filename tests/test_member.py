@@ -0,0 +1,182 @@
+import json
+import threading
+import time
+
+import requests
+
+from qnxt.api.Member import COPCProviders, MemberEnrichment
+from qnxt.api.Response import Response
+
+
+class StubClient:
+    """Serves COPC provider windows and counts the validations, in place of a qnxt.client.Client"""
+
+    def __init__(self, providers: list):
+        self.providers = providers
+        self.validated = []
+        self.window_params = []
+
+    def url(self, base_path: str) -> str:
+        return f"http://qnxt_app_server.com/{base_path}"
+
+    def get(self, uri: str, header_factory, params: dict = None) -> Response:
+        if uri.endswith('/validate'):
+            self.validated.append((uri.split('/')[-2], params['asOfDate']))
+            body = {'results': True}
+        else:
+            self.window_params.append(params)
+            body = {'results': self.providers[params['skip']:params['skip'] + params['take']]}
+        http_response = requests.Response()
+        http_response.status_code = 200
+        http_response._content = json.dumps(body).encode('utf-8')
+        return Response(http_response)
+
+
+DATES = ('2024-02-01', '2024-03-01', '2024-04-01')
+
+
+def test_dates_inside_the_same_windows_are_validated_once():
+    client = StubClient([{'provId': 'PRV1', 'effDate': '2024-01-01', 'termDate': '2024-12-31'}])
+    table = COPCProviders(client, None).validate_copc_providers(('ENR1', 'PRV1', d) for d in DATES)
+    assert len(client.validated) == 1 and len(table) == 3
+    # the windows are fetched without an as-of filter, so past windows are included
+    assert all(params['asOfDate'] is None for params in client.window_params)
+
+
+def test_a_provider_without_windows_is_validated_date_by_date():
+    client = StubClient([{'provId': 'OTHER', 'effDate': '2024-01-01', 'termDate': None}])
+    table = COPCProviders(client, None).validate_copc_providers(('ENR1', 'PRV1', d) for d in DATES)
+    assert sorted(d for _, d in client.validated) == list(DATES) and len(table) == 3
+
+
+def test_unreadable_windows_are_not_collapsed():
+    client = StubClient([{'providerId': 'PRV1', 'effectiveDate': '2024-01-01'}])
+    COPCProviders(client, None).validate_copc_providers(('ENR1', 'PRV1', d) for d in DATES)
+    assert len(client.validated) == 3
+
+
+def test_a_window_without_a_termination_date_field_is_not_taken_as_open_ended():
+    # the provider terminated before the last date, but the response does not say so
+    client = StubClient([{'provId': 'PRV1', 'effDate': '2024-01-01'}])
+    COPCProviders(client, None).validate_copc_providers(('ENR1', 'PRV1', d) for d in DATES)
+    assert sorted(d for _, d in client.validated) == list(DATES)
+
+
+def test_an_explicit_null_termination_date_is_open_ended():
+    client = StubClient([{'provId': 'PRV1', 'effDate': '2024-01-01', 'termDate': None}])
+    COPCProviders(client, None).validate_copc_providers(('ENR1', 'PRV1', d) for d in DATES)
+    assert len(client.validated) == 1
+
+
+class EnrichClient:
+    """Serves the calls of MemberEnrichment.enrich in place of a qnxt.client.Client, recording the calls in flight.
+    `delays` and `statuses` are looked up by (enroll_id, part), `part` being 'copc', 'plan' or the accumulator ID."""
+
+    def __init__(self, delays: dict = None, statuses: dict = None, delay: float = 0.01):
+        self.delays = delays or {}
+        self.statuses = statuses or {}
+        self.delay = delay
+        self.calls = []
+        self.running = []
+        self.most_running = 0
+        self.most_enrollments = 0
+        self._lock = threading.Lock()
+
+    def url(self, base_path: str) -> str:
+        return f"http://qnxt_app_server.com/{base_path}"
+
+    @staticmethod
+    def _call(uri: str) -> tuple:
+        parts = uri.split('/')
+        if parts[-1] == 'copcProviders':
+            return parts[-2], 'copc'
+        if parts[-1] == 'staticPlanAccruals':
+            return parts[-2], 'plan'
+        return parts[-4], parts[-2]
+
+    def get(self, uri: str, header_factory, params: dict = None) -> Response:
+        call = self._call(uri)
+        with self._lock:
+            self.calls.append(call)
+            self.running.append(call)
+            self.most_running = max(self.most_running, len(self.running))
+            self.most_enrollments = max(self.most_enrollments, len({enroll_id for enroll_id, _ in self.running}))
+        try:
+            time.sleep(self.delays.get(call, self.delay))
+            status = self.statuses.get(call, 200)
+            if status is None:
+                raise requests.ConnectionError('connection dropped')
+            enroll_id, part = call
+            if part == 'copc':
+                body = {'results': [{'provId': f"PRV-{enroll_id}"}]}
+            elif part == 'plan':
+                body = {'results': [{'accumId': 'A1', 'accumType': 'D'}, {'accumId': 'A2', 'accumType': 'O'}]}
+            else:
+                body = {'results': [{'accumId': part, 'enrollId': enroll_id}]}
+            http_response = requests.Response()
+            http_response.status_code = status
+            http_response.url = uri
+            http_response._content = json.dumps(body).encode('utf-8')
+            return Response(http_response)
+        finally:
+            with self._lock:
+                self.running.remove(call)
+
+
+def test_every_part_of_an_enrollment_is_fetched():
+    client = EnrichClient()
+    record, = MemberEnrichment(client, None).enrich(['E1'])
+    assert record == {'enroll_id': 'E1',
+                      'copc_providers': [{'provId': 'PRV-E1'}],
+                      'plan_accruals': [{'accumId': 'A1', 'accumType': 'D'}, {'accumId': 'A2', 'accumType': 'O'}],
+                      'benefit_accruals': {('A1', 'D'): [{'accumId': 'A1', 'enrollId': 'E1'}],
+                                           ('A2', 'O'): [{'accumId': 'A2', 'enrollId': 'E1'}]},
+                      'errors': {}}
+    # the benefit accruals fan out from the plan accruals, so they are only requested once those are back
+    assert set(client.calls[:2]) == {('E1', 'copc'), ('E1', 'plan')}
+    assert set(client.calls[2:]) == {('E1', 'A1'), ('E1', 'A2')}
+
+
+def test_records_are_yielded_as_their_enrollments_complete():
+    client = EnrichClient(delays={('E1', 'copc'): 0.3})
+    records = list(MemberEnrichment(client, None).enrich(['E1', 'E2', 'E3']))
+    assert [r['enroll_id'] for r in records][-1] == 'E1'
+    assert sorted(r['enroll_id'] for r in records) == ['E1', 'E2', 'E3']
+
+
+def test_a_none_enrollment_id_does_not_end_the_input():
+    records = list(MemberEnrichment(EnrichClient(), None).enrich(['E1', None, 'E2']))
+    assert sorted(str(r['enroll_id']) for r in records) == ['E1', 'E2', 'None']
+
+
+def test_a_failed_call_only_loses_its_own_part():
+    client = EnrichClient(statuses={('E1', 'copc'): 500, ('E1', 'A2'): None, ('E2', 'plan'): 503})
+    records = {r['enroll_id']: r for r in MemberEnrichment(client, None).enrich(['E1', 'E2'])}
+    e1, e2 = records['E1'], records['E2']
+    assert e1['copc_providers'] is None
+    assert isinstance(e1['errors']['copc_providers'], requests.HTTPError)
+    assert isinstance(e1['errors'][('A2', 'O')], requests.ConnectionError)
+    assert list(e1['benefit_accruals']) == [('A1', 'D')]
+    assert e1['plan_accruals'] is not None
+    # without plan accruals there are no accumulators to fan out to
+    assert e2['plan_accruals'] is None and e2['benefit_accruals'] == {}
+    assert list(e2['errors']) == ['plan_accruals']
+    assert e2['copc_providers'] == [{'provId': 'PRV-E2'}]
+
+
+def test_calls_and_enrollments_in_flight_are_bounded():
+    client = EnrichClient(delay=0.02)
+    pulled = []
+
+    def enroll_ids():
+        for i in range(12):
+            pulled.append(i)
+            yield f"E{i}"
+
+    records = MemberEnrichment(client, None).enrich(enroll_ids(), workers=3, max_enrollments=2)
+    next(records)
+    # the input is consumed lazily, one enrollment for each one that completes
+    assert len(pulled) <= 2 + 1
+    assert len(list(records)) == 11
+    assert client.most_running <= 3
+    assert client.most_enrollments <= 2
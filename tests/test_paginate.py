@@ -0,0 +1,203 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from qnxt.aio import AsyncClient
+from qnxt.api import CallTracking
+from qnxt.api.Response import Response
+from qnxt.client import Client
+from qnxt.utils import paginate
+
+RECORDS = [{'callerId': f"C{i}"} for i in range(25)]
+
+
+def _response(body: dict) -> Response:
+    http_response = requests.Response()
+    http_response.status_code = 200
+    http_response._content = json.dumps(body).encode()
+    return Response(http_response)
+
+
+class StubSearch:
+    """A paged search over `records` that remembers the (skip, take) of every call"""
+
+    def __init__(self, records: list = RECORDS, total: bool = False):
+        self.records = records
+        self.total = total
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, skip: int = 0, take: int = 100, **kwargs) -> Response:
+        with self._lock:
+            self.calls.append((skip, take))
+        body = {'results': self.records[skip:skip + take]}
+        if self.total:
+            body['processMetadata'] = {'totalCount': len(self.records)}
+        return _response(body)
+
+
+def _paged(request):
+    skip, take = int(request.query['skip'][0]), int(request.query['take'][0])
+    return 200, {'results': RECORDS[skip:skip + take]}
+
+
+def test_iter_methods_page_through_every_record(app_server):
+    app_server.handler = _paged
+    with Client(app_server.url) as client:
+        calls = CallTracking.CallResource(client, dict)
+        records = list(calls.iter_call_issues(page_size=10, memid='M1'))
+    assert records == RECORDS
+    assert [(r.query['skip'], r.query['take']) for r in app_server.requests] == [(['0'], ['10']), (['10'], ['10']),
+                                                                                 (['20'], ['10'])]
+    # the other search parameters go with every page
+    assert {r.query['memId'][0] for r in app_server.requests} == {'M1'}
+
+
+def test_a_short_page_ends_the_search():
+    search = StubSearch()
+    assert list(paginate.paginate(search, page_size=5)) == RECORDS
+    # 25 records in pages of 5: the sixth, empty, page is what ends it
+    assert search.calls == [(skip, 5) for skip in range(0, 30, 5)]
+
+
+def test_max_records_trims_the_last_page():
+    search = StubSearch()
+    assert list(paginate.paginate(search, page_size=10, max_records=15)) == RECORDS[:15]
+    assert search.calls == [(0, 10), (10, 5)]
+
+
+def test_records_are_converted_with_the_model():
+    assert list(paginate.paginate(StubSearch(), page_size=10, model=lambda r: r['callerId'])) == \
+        [r['callerId'] for r in RECORDS]
+
+
+def test_a_page_without_results_raises():
+    def failed(skip, take):
+        return _response({'error': 'unavailable'})
+
+    with pytest.raises(requests.HTTPError):
+        list(paginate.paginate(failed))
+
+
+def test_an_async_client_is_refused():
+    calls = CallTracking.CallResource(AsyncClient('http://qnxt_app_server.com'), dict)
+    with pytest.raises(TypeError, match='AsyncClient'):
+        next(calls.iter_call_issues())
+
+
+class SlowSearch(StubSearch):
+    """A StubSearch whose earlier pages take longer, so prefetched pages complete out of order"""
+
+    def __init__(self, records: list = RECORDS, total: bool = False, delay: float = 0.02):
+        super().__init__(records, total)
+        self.delay = delay
+        self.running = 0
+        self.most_running = 0
+
+    def __call__(self, skip: int = 0, take: int = 100, **kwargs) -> Response:
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        try:
+            time.sleep(self.delay * max(0, 5 - skip // take))
+            return super().__call__(skip, take, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+@pytest.mark.parametrize('total', [True, False])
+def test_prefetched_pages_are_yielded_in_order(total):
+    search = SlowSearch(total=total)
+    assert list(paginate.paginate(search, page_size=4, prefetch=3)) == RECORDS
+    assert search.most_running <= 3
+    if total:
+        # the total count bounds the offsets, so nothing past the end is requested
+        assert sorted(search.calls) == [(skip, 4) for skip in range(0, 24, 4)] + [(24, 1)]
+    else:
+        assert sorted(search.calls)[:7] == [(skip, 4) for skip in range(0, 25, 4)]
+        assert len(search.calls) <= 7 + 3
+
+
+def test_prefetch_respects_max_records():
+    search = SlowSearch(total=True, delay=0)
+    assert list(paginate.paginate(search, page_size=4, max_records=10, prefetch=4)) == RECORDS[:10]
+    assert sorted(search.calls) == [(0, 4), (4, 4), (8, 2)]
+
+
+def test_closing_the_iterator_stops_prefetching():
+    search = SlowSearch([{'callerId': f"C{i}"} for i in range(1000)], delay=0.01)
+    records = paginate.paginate(search, page_size=10, prefetch=2)
+    assert next(records) == {'callerId': 'C0'}
+    records.close()
+    requested = len(search.calls)
+    # the first page and at most the two in flight when the iterator was closed
+    assert requested <= 3
+    time.sleep(0.2)
+    assert len(search.calls) == requested
+
+
+class StubLogSearch:
+    """A search over application logs one minute apart that filters on its date bounds, both inclusive, either to the
+    minute or, like some servers, to the whole day"""
+
+    def __init__(self, count: int, start: datetime = datetime(2024, 1, 1), whole_days: bool = False):
+        self.logs = [{'referenceId': i, 'date': start + timedelta(minutes=i)} for i in range(count)]
+        self.whole_days = whole_days
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, skip: int = 0, take: int = 100, utc_date_from: str = None, utc_date_to: str = None):
+        with self._lock:
+            self.calls.append((utc_date_from, utc_date_to, skip))
+        lo, hi = datetime.fromisoformat(utc_date_from), datetime.fromisoformat(utc_date_to)
+        if self.whole_days:
+            lo, hi = datetime.combine(lo.date(), datetime.min.time()), datetime.combine(hi.date(), datetime.max.time())
+        found = [log for log in self.logs if lo <= log['date'] <= hi]
+        return _response({'results': [dict(log, date=log['date'].isoformat()) for log in found[skip:skip + take]],
+                          'processMetadata': {'totalCount': len(found)}})
+
+
+def _ids(records) -> list:
+    return sorted(record['referenceId'] for record in records)
+
+
+def test_dense_windows_are_split_instead_of_paged():
+    search = StubLogSearch(200)
+    records = list(paginate.scan(search, '2024-01-01', '2024-01-02', key='referenceId', windows=2, window_limit=50))
+    assert _ids(records) == list(range(200))
+    # every window was narrowed until it fit in one page
+    assert {skip for _, _, skip in search.calls} == {0}
+
+
+def test_windows_are_not_split_when_the_server_filters_whole_days():
+    search = StubLogSearch(200, whole_days=True)
+    records = list(paginate.scan(search, '2024-01-01T00:00:00', '2024-01-01T12:00:00', key='referenceId', windows=1,
+                                 window_limit=50))
+    assert _ids(records) == list(range(200))
+    # the window, its two halves, which came back the same, then the rest of the window page by page up to a short one
+    assert [skip for _, _, skip in search.calls] == [0, 0, 0, 50, 100, 150, 200]
+
+
+def test_records_on_a_shared_boundary_are_yielded_once():
+    search = StubLogSearch(120)
+    # the windows meet on whole hours, where a log sits, and both bounds are inclusive
+    records = list(paginate.scan(search, '2024-01-01T00:00:00', '2024-01-01T02:00:00', key='referenceId', windows=2))
+    assert _ids(records) == list(range(120))
+    without_key = list(paginate.scan(search, '2024-01-01T00:00:00', '2024-01-01T02:00:00', windows=2))
+    assert len(without_key) == 120 + 1
+
+
+def test_keys_are_only_kept_until_both_sides_of_a_boundary_are_done():
+    start, middle, stop = datetime(2024, 1, 1), datetime(2024, 1, 2), datetime(2024, 1, 3)
+    neighbours = {}
+    first = paginate._unseen([{'id': 1}, {'id': 2}, {'id': 2}], 'id', start, middle, start, stop, neighbours)
+    assert first == [{'id': 1}, {'id': 2}]
+    assert neighbours == {middle: {1, 2}}
+    second = paginate._unseen([{'id': 2}, {'id': 3}, {'id': None}], 'id', middle, stop, start, stop, neighbours)
+    assert second == [{'id': 3}, {'id': None}]
+    assert neighbours == {}
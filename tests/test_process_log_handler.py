@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import requests
+
+from qnxt.api.PlanIntegration import ProcessLogHandler
+from qnxt.api.Response import Response
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StubClient:
+    """Creates process log details and states in place of a qnxt.client.Client, counting the details"""
+
+    def __init__(self):
+        self.details = []
+        self._lock = threading.Lock()
+
+    def url(self, base_path: str) -> str:
+        return f"http://qnxt_app_server.com/{base_path}"
+
+    def post(self, uri: str, header_factory, params: dict = None) -> Response:
+        if not uri.endswith('/states'):
+            with self._lock:
+                self.details.append(params['message'])
+        http_response = requests.Response()
+        http_response.status_code = 200
+        http_response._content = json.dumps({'results': {'processLogDetailId': 'D1', 'processStateId': 'S1'}}).encode()
+        return Response(http_response)
+
+
+def _logger(handler: logging.Handler, name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+def test_close_does_not_wait_for_the_flush_interval():
+    client = StubClient()
+    handler = ProcessLogHandler(client, None, processlog_id='H1', flush_interval=5)
+    logger = _logger(handler, 'test_close_does_not_wait_for_the_flush_interval')
+    logger.info('shipped on close')
+    start = time.monotonic()
+    handler.close()
+    assert time.monotonic() - start < 1
+    logger.removeHandler(handler)
+    assert client.details == ['shipped on close']
+    assert handler.stats()['failed'] == 0
+
+
+def test_records_emitted_after_close_are_counted_as_failed():
+    handler = ProcessLogHandler(StubClient(), None, processlog_id='H1')
+    logger = _logger(handler, 'test_records_emitted_after_close_are_counted_as_failed')
+    handler.close()
+    logger.info('too late')
+    logger.removeHandler(handler)
+    assert handler.stats()['failed'] == 1
+    assert isinstance(handler.last_error, RuntimeError)
+
+
+def test_a_handler_that_is_never_closed_is_flushed_at_exit():
+    # logging.shutdown flushes and closes the handler at exit, after concurrent.futures has stopped taking work
+    script = textwrap.dedent("""
+        import logging
+        import sys
+        sys.path.insert(0, sys.argv[1])
+        from test_process_log_handler import StubClient, _logger
+        from qnxt.api.PlanIntegration import ProcessLogHandler
+
+        class ReportingHandler(ProcessLogHandler):
+            def close(self):
+                super().close()
+                print(len(self.client.details), self.stats()['failed'], flush=True)
+
+        handler = ReportingHandler(StubClient(), None, processlog_id='H1', flush_interval=60)
+        logger = _logger(handler, 'job')
+        for i in range(10):
+            logger.info('record %d', i)
+    """)
+    result = subprocess.run([sys.executable, '-c', script, os.path.join(ROOT, 'tests')], cwd=ROOT,
+                            capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['10', '0']
+    assert 'Exception ignored' not in result.stderr
@@ -0,0 +1,102 @@
+import json
+import random
+import threading
+import time
+
+import pytest
+import requests
+
+from qnxt.api.PlanIntegration import ProcessLogWriter
+from qnxt.api.Response import Response
+
+
+class StubClient:
+    """Creates process log details and states in place of a qnxt.client.Client, after a short random delay, recording
+    the order they were created in and the requests of each header in flight at the same time"""
+
+    def __init__(self, delay: float = 0.01, failing: set = ()):
+        self.delay = delay
+        self.failing = failing
+        self.created = []
+        self.running = {}
+        self.most_running = 0
+        self.overlapping = []
+        self._lock = threading.Lock()
+
+    def url(self, base_path: str) -> str:
+        return f"http://qnxt_app_server.com/{base_path}"
+
+    def post(self, uri: str, header_factory, params: dict = None) -> Response:
+        lane = params.get('processLogId') or uri.split('/')[-2]
+        with self._lock:
+            if self.running.get(lane):
+                self.overlapping.append(lane)
+            self.running[lane] = self.running.get(lane, 0) + 1
+            self.most_running = max(self.most_running, sum(self.running.values()))
+        try:
+            time.sleep(random.uniform(0, self.delay))
+            with self._lock:
+                if uri.endswith('/states'):
+                    created = {'processStateId': f"S{len(self.created)}"}
+                    self.created.append(('state', uri.split('/')[-2], params['message']))
+                else:
+                    created = {'processLogDetailId': f"{params['processLogId']}-{params['message']}"}
+                    self.created.append(('detail', params['processLogId'], params['message']))
+            http_response = requests.Response()
+            http_response.status_code = 500 if params['message'] in self.failing else 200
+            http_response.url = uri
+            http_response._content = json.dumps({'results': created}).encode()
+            return Response(http_response)
+        finally:
+            with self._lock:
+                self.running[lane] -= 1
+
+
+def test_the_rows_of_a_header_are_created_in_order():
+    client = StubClient()
+    with ProcessLogWriter(client, None, workers=4, batch_size=10) as writer:
+        futures = [writer.add_detail(f"H{i % 3}", message=str(i)) for i in range(30)]
+    assert [future.result() for future in futures] == [f"H{i % 3}-{i}" for i in range(30)]
+    for header in ('H0', 'H1', 'H2'):
+        messages = [int(message) for _, lane, message in client.created if lane == header]
+        assert messages == sorted(messages) and len(messages) == 10
+    # one request of a header at a time, but the headers run side by side
+    assert client.overlapping == []
+    assert client.most_running > 1
+    assert writer.stats()['sent'] == 30 and writer.stats()['failed'] == 0
+
+
+def test_a_state_is_created_after_its_detail():
+    client = StubClient()
+    with ProcessLogWriter(client, None, workers=4, ordered=False) as writer:
+        states = []
+        for i in range(20):
+            detail = writer.add_detail('H0', message=f"d{i}")
+            states.append(writer.add_state(detail, process_stage_id='COMPLETED', message=f"s{i}"))
+    for i, state in enumerate(states):
+        assert state.result().startswith('S')
+        created = [(kind, lane) for kind, lane, message in client.created if message in (f"d{i}", f"s{i}")]
+        assert created == [('detail', 'H0'), ('state', f"H0-d{i}")]
+
+
+def test_a_state_fails_with_its_detail():
+    client = StubClient(failing={'d1'})
+    with ProcessLogWriter(client, None) as writer:
+        details = [writer.add_detail('H0', message=f"d{i}") for i in range(3)]
+        states = [writer.add_state(detail, message=f"s{i}") for i, detail in enumerate(details)]
+    with pytest.raises(requests.HTTPError):
+        states[1].result()
+    # the rows after it in the same header are still created
+    assert states[2].result().startswith('S')
+    assert [message for _, _, message in client.created].count('s1') == 0
+    assert writer.stats()['failed'] == 2
+
+
+def test_buffered_rows_are_sent_after_the_flush_interval():
+    client = StubClient(delay=0)
+    writer = ProcessLogWriter(client, None, batch_size=100, flush_interval=0.05)
+    future = writer.add_detail('H0', message='0')
+    assert future.result(timeout=2) == 'H0-0'
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.add_detail('H0', message='1')
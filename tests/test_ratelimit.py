@@ -0,0 +1,101 @@
+import asyncio
+import types
+
+import pytest
+
+from qnxt import ratelimit
+from qnxt.ratelimit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    """Stands in for the `time` module of qnxt.ratelimit: time only moves when something sleeps or `advance` is
+    called"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    async def asleep(self, seconds: float):
+        self.sleep(seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    monkeypatch.setattr(ratelimit, 'asyncio', types.SimpleNamespace(sleep=clock.asleep))
+    return clock
+
+
+def test_a_burst_goes_through_and_later_tokens_wait_in_line(clock):
+    bucket = TokenBucket(rate=10, burst=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2:] == [pytest.approx(0.1), pytest.approx(0.2)]
+
+
+def test_the_bucket_refills_at_its_rate_up_to_the_burst(clock):
+    bucket = TokenBucket(rate=10, burst=2)
+    for _ in range(2):
+        bucket.reserve()
+    clock.advance(0.1)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1)
+
+    # a long quiet spell only refills the burst
+    clock.advance(60)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, pytest.approx(0.1)]
+
+
+def test_acquire_sleeps_for_the_wait_and_stats_count_it(clock):
+    bucket = TokenBucket(rate=4)
+    assert bucket.burst == 4
+    waits = [bucket.acquire() for _ in range(6)]
+    assert waits == [0.0] * 4 + [pytest.approx(0.25)] * 2
+    # each acquire sleeps until its token is due, so the next one finds the bucket empty again
+    assert clock.slept == [pytest.approx(0.25)] * 2
+    assert bucket.stats() == {'rate': 4, 'burst': 4, 'acquired': 6, 'waited': 2, 'wait_seconds': pytest.approx(0.5)}
+
+    # a rate below 1 per second still lets one request through
+    assert TokenBucket(rate=0.5).burst == 1
+
+
+def test_aacquire_waits_without_blocking(clock):
+    bucket = TokenBucket(rate=10, burst=1)
+
+    async def main():
+        return [await bucket.aacquire() for _ in range(3)]
+
+    assert asyncio.run(main()) == [0.0, pytest.approx(0.1), pytest.approx(0.1)]
+    assert clock.slept == [pytest.approx(0.1)] * 2
+
+
+def test_each_api_family_has_its_own_bucket(clock):
+    limiter = RateLimiter({'/QNXTApi/CallTracking/': (10, 1)}, default_rate=(5, 1))
+    calls = 'http://qnxt_app_server.com/QNXTApi/CallTracking/calls'
+    members = 'http://qnxt_app_server.com/QNXTApi/Member/members'
+
+    assert limiter.bucket(calls) is limiter.bucket('http://qnxt_app_server.com/qnxtapi/calltracking/calls/1/issues')
+    assert [limiter.bucket(calls).reserve() for _ in range(2)] == [0.0, pytest.approx(0.1)]
+    # another family is not held up by the first one, and gets the default rate
+    assert [limiter.bucket(members).reserve() for _ in range(2)] == [0.0, pytest.approx(0.2)]
+    assert sorted(limiter.stats()) == ['QNXTApi/CallTracking', 'QNXTApi/Member']
+
+
+def test_families_without_a_rate_are_not_limited(clock):
+    limiter = RateLimiter({'QNXTApi/CallTracking': 1})
+    members = 'http://qnxt_app_server.com/QNXTApi/Member/members'
+    assert limiter.bucket(members) is None
+    assert [limiter.acquire(members) for _ in range(5)] == [0.0] * 5
+    assert asyncio.run(limiter.aacquire(members)) == 0.0
+    assert clock.slept == [] and list(limiter.stats()) == ['QNXTApi/CallTracking']
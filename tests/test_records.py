@@ -0,0 +1,28 @@
+import sys
+
+import pytest
+
+from qnxt.api import Records
+
+
+def test_fields_are_set_interned_and_extra_kept():
+    data = {'referenceId': 'REF1', 'level': ''.join(['Err', 'or']), 'expanded': {'a': 1}}
+    record = Records.ApplicationLog(data)
+    assert record.referenceId == 'REF1' and record.machineName is None
+    assert record.level is sys.intern('Error')
+    assert record.extra == {'expanded': {'a': 1}}
+    assert record.to_dict() == data
+
+
+def test_records_are_hashable():
+    a, b = Records.Call({'callId': 'C1', 'status': 'Open'}), Records.Call({'callId': 'C1', 'status': 'Open'})
+    assert a == b and len({a, b}) == 1
+    assert Records.Call({'callId': 'C2'}) not in {a}
+
+
+def test_a_record_with_none_of_the_fields_is_rejected():
+    with pytest.raises(ValueError, match='right model'):
+        Records.Call({'referenceId': 'REF1', 'level': 'Error'})
+    assert Records.Call({}).extra is None
+    with pytest.raises(TypeError):
+        Records.Record({'callId': 'C1'})
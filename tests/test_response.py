@@ -0,0 +1,133 @@
+import json
+
+import pytest
+import requests
+
+from qnxt.api import Response as response_module
+from qnxt.api.Response import Response
+from qnxt.client import Client
+
+BODY = {'results': [{'callerId': 'C1'}, {'callerId': 'C2'}], 'processMetadata': {'totalCount': 2}, 'status': 'OK'}
+
+
+def _http_response(content: bytes = json.dumps(BODY).encode(), status_code: int = 200) -> requests.Response:
+    http_response = requests.Response()
+    http_response.status_code = status_code
+    http_response._content = content
+    return http_response
+
+
+@pytest.fixture
+def counting_backend():
+    """Parse with the standard library, counting the calls and the types parsed"""
+    parsed = []
+
+    def loads(content):
+        parsed.append(type(content))
+        return json.loads(content)
+
+    response_module.set_json_backend(loads)
+    yield parsed
+    response_module.set_json_backend(None)
+
+
+def test_the_body_is_parsed_on_first_access_only(counting_backend):
+    response = Response(_http_response())
+    assert response.status_code == 200
+    assert counting_backend == []
+    assert response.results == BODY['results']
+    assert response.metadata == BODY['processMetadata']
+    assert response.overview == {'status': 'OK'}
+    # parsed once, from the raw bytes rather than decoded text
+    assert counting_backend == [bytes]
+
+
+def test_the_default_backend_can_be_restored(counting_backend):
+    response_module.set_json_backend(None)
+    assert Response(_http_response()).json == BODY
+    assert counting_backend == []
+
+
+
+class StreamedBody:
+    """A stand-in for a streamed `requests.Response` that hands out its body `size` bytes at a time"""
+
+    def __init__(self, body: bytes, size: int):
+        self.body = body
+        self.size = size
+        self.status_code = 200
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return (self.body[i:i + self.size] for i in range(0, len(self.body), self.size))
+
+    def close(self):
+        self.closed = True
+
+
+STREAMED = {'status': 'OK',
+            'results': [{'note': 'quoted \\"}], braces\\\\', 'name': 'Zoë ✓', 'amount': -12.5e3, 'tags': [[], {}]},
+                        {'flag': True, 'missing': None, 'count': 1234567890},
+                        'a string record', 42],
+            'processMetadata': {'totalCount': 4}}
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 1 << 16])
+def test_streamed_records_survive_any_chunking(size):
+    http_response = StreamedBody(json.dumps(STREAMED, ensure_ascii=False).encode(), size)
+    response = response_module.StreamingResponse(http_response)
+    assert response.overview == {'status': 'OK'}
+    assert list(response) == STREAMED['results']
+    assert response.metadata == STREAMED['processMetadata']
+    assert http_response.closed
+
+
+def test_each_streamed_value_is_decoded_once(monkeypatch):
+    decoded = []
+    decoder = json.JSONDecoder()
+
+    class CountingDecoder:
+        def raw_decode(self, s, idx=0):
+            decoded.append(idx)
+            return decoder.raw_decode(s, idx)
+
+    monkeypatch.setattr(response_module._StreamParser, '_decoder', CountingDecoder())
+    record = {'text': 'x' * 5000, 'items': list(range(500))}
+    body = json.dumps({'results': [record, record]}).encode()
+    records = list(response_module.StreamingResponse(StreamedBody(body, 16)))
+    assert records == [record, record]
+    # the key 'results' once, and each record at most twice however many chunks it spans: once to find that it goes
+    # on past the first chunk and once it is complete
+    assert len(decoded) <= 1 + 2 * 2
+
+
+def test_a_truncated_stream_raises():
+    body = json.dumps(STREAMED).encode()[:-40]
+    with pytest.raises(ValueError):
+        list(response_module.StreamingResponse(StreamedBody(body, 5)))
+
+
+def test_a_lean_response_drops_the_body():
+    response = Response(_http_response(), lean=True)
+    assert isinstance(response.http_response, response_module.LeanHTTPResponse)
+    assert not hasattr(response.http_response, 'content')
+    assert response.status_code == 200 and response.http_response.ok
+    assert response.json == BODY
+
+
+@pytest.mark.parametrize('content, status_code', [(b'', 204), (b'<html><body>Bad Gateway</body></html>', 502)])
+def test_a_lean_body_that_is_not_json_raises_on_access(content, status_code):
+    response = Response(_http_response(content, status_code), lean=True)
+    assert response.status_code == status_code
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            response.json
+
+
+def test_a_lean_client_returns_unparsable_responses(app_server):
+    app_server.handler = lambda request: (502, b'<html>Bad Gateway</html>', {'Content-Type': 'text/html'})
+    with Client(app_server.url, lean=True) as client:
+        response = client.get(client.url('QNXTApi/CallTracking/calls'), dict)
+    assert response.status_code == 502
+    with pytest.raises(ValueError):
+        response.results
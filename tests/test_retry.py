@@ -0,0 +1,32 @@
+import socket
+
+import pytest
+import requests
+
+from qnxt.retry import RetryPolicy, unsent
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_a_refused_connection_is_unsent():
+    with pytest.raises(requests.ConnectionError) as raised:
+        requests.get(f"http://127.0.0.1:{_closed_port()}/", timeout=5)
+    assert unsent(raised.value)
+    assert RetryPolicy().unsent().retryable(raised.value)
+
+
+def test_timeouts_and_dropped_connections_are_only_unsent_before_connecting():
+    assert unsent(requests.ConnectTimeout('connect timed out'))
+    assert not unsent(requests.ReadTimeout('read timed out'))
+    assert not unsent(requests.ConnectionError('Connection aborted.'))
+    assert not RetryPolicy().unsent().retryable(requests.ReadTimeout('read timed out'))
+
+
+def test_httpx_connect_errors_are_unsent():
+    httpx = pytest.importorskip('httpx')
+    assert unsent(httpx.ConnectError('connection refused'))
+    assert not unsent(httpx.ReadTimeout('read timed out'))
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+
+import requests
+
+from qnxt.api import Benefit
+from qnxt.client import Client
+from qnxt.utils.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def _threads(fn, count: int, stagger: float = 0.0) -> list:
+    """Run `fn` on `count` threads, starting each `stagger` seconds after the previous one; returns their results or
+    exceptions in order"""
+    results = [None] * count
+
+    def call(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    workers = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for worker in workers:
+        worker.start()
+        time.sleep(stagger)
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def _slow(request):
+    time.sleep(0.2)
+    return 200, {'results': [{'benefitId': 'B1'}]}
+
+
+def test_concurrent_identical_gets_share_one_request(app_server):
+    app_server.handler = _slow
+    with Client(app_server.url, coalesce=True, pool_maxsize=8) as client:
+        benefits = Benefit.BenefitResource(client, dict)
+        responses = _threads(lambda: benefits.get_benefit('PLAN1', 'B1'), 8)
+        assert client.flights.stats() == {'calls': 1, 'coalesced': 7}
+    assert len(app_server.requests) == 1
+    assert [r.results for r in responses] == [[{'benefitId': 'B1'}]] * 8
+    # every caller gets a Response of its own, so a parsed body is never shared
+    assert len({id(r) for r in responses}) == 8
+    assert len({id(r.results) for r in responses}) == 8
+
+
+def test_a_failed_request_is_not_shared_with_the_callers_waiting_on_it(app_server):
+    def handler(request):
+        if len(app_server.requests) == 1:
+            # the first request outlasts the client's timeout
+            time.sleep(0.5)
+        return 200, {'results': [{'benefitId': 'B1'}]}
+
+    app_server.handler = handler
+    with Client(app_server.url, coalesce=True, timeout=0.25) as client:
+        benefits = Benefit.BenefitResource(client, dict)
+        results = _threads(lambda: benefits.get_benefit('PLAN1', 'B1'), 4, stagger=0.02)
+    assert isinstance(results[0], requests.Timeout)
+    # the waiters sent a request of their own instead of raising the timeout of the first
+    assert [r.results for r in results[1:]] == [[{'benefitId': 'B1'}]] * 3
+    assert 2 <= len(app_server.requests) <= 4
+
+
+def test_waiters_call_again_after_the_leader_raises():
+    flights = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.1)
+        if len(calls) == 1:
+            raise ValueError('first call fails')
+        return len(calls)
+
+    results = _threads(lambda: flights.do('key', fn), 4, stagger=0.01)
+    assert isinstance(results[0], ValueError)
+    assert results[1:] == [2, 2, 2]
+    assert flights.stats() == {'calls': 2, 'coalesced': 2}
+
+
+def test_async_waiters_call_again_after_the_leader_raises():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(None)
+        await asyncio.sleep(0.05)
+        if len(calls) == 1:
+            raise ValueError('first call fails')
+        return len(calls)
+
+    async def main():
+        return await asyncio.gather(*(flights.do('key', fn) for _ in range(4)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert isinstance(results[0], ValueError)
+    assert results[1:] == [2, 2, 2]
+    assert flights.stats() == {'calls': 2, 'coalesced': 2}